@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Los eventos en vivo de los paneles de asistencia (SSE, ver paneladm/eventos.py)
+solo se sirven a través de esta aplicación, p. ej.:
+
+    uvicorn Ecosistema.asgi:application --workers 4
 """
 
 import os
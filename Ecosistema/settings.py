@@ -4,6 +4,7 @@ Configuración de PRODUCCIÓN en VPS Debian (Hostinger)
 """
 
 import os
+from datetime import date
 from pathlib import Path
 
 # ---------------------------------------------------------
@@ -68,6 +69,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "usuario.middleware.UserInfoMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -116,6 +118,23 @@ DATABASES = {
     }
 }
 
+# ---------------------------------------------------------
+#  CACHÉ
+# ---------------------------------------------------------
+# Memoria local sirve para un solo worker. Con varios workers (gunicorn -w N)
+# se necesita un backend compartido, por ejemplo:
+#   CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+#   CACHE_LOCATION=/var/tmp/ecosistema_cache
+# o bien:
+#   CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CACHE_LOCATION=redis://127.0.0.1:6379
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "ecosistema"),
+    }
+}
+
 # ---------------------------------------------------------
 #  VALIDACIÓN DE CONTRASEÑAS
 # ---------------------------------------------------------
@@ -149,6 +168,46 @@ STATICFILES_DIRS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# ---------------------------------------------------------
+#  CÓDIGOS QR
+# ---------------------------------------------------------
+# Los QR se renderizan a pedido en /qr/<id>.png y /qr/<id>.svg.
+# Guardar además una copia en media/qr_codes es opcional.
+QR_GUARDAR_ARCHIVOS = os.environ.get("QR_GUARDAR_ARCHIVOS", "") == "1"
+QR_LRU_MAX = 2048  # imágenes codificadas que se mantienen en memoria por proceso
+
+# Claves para firmar los QR: "id:secreto" separados por comas, con id de un
+# carácter (0-9, A-Z). Todas las claves de la lista se aceptan al escanear; los
+# QR nuevos se firman con QR_CLAVE_ACTIVA. Para rotar: agregar la clave nueva,
+# activarla, correr regenerate_qrs (si se guardan los PNG) y, cuando ya no circulen
+# QR viejos, quitar la anterior.
+QR_CLAVES = {
+    clave_id.strip().upper(): secreto
+    for clave_id, secreto in (par.split(":", 1) for par in os.environ.get("QR_CLAVES", "").split(",") if ":" in par)
+} or {"1": SECRET_KEY}
+QR_CLAVE_ACTIVA = os.environ.get("QR_CLAVE_ACTIVA", next(iter(QR_CLAVES)))
+# Los QR antiguos (URL del perfil, sin firma) se aceptan hasta esta fecha
+# (AAAA-MM-DD, inclusive), para dar tiempo a que todos reciban el nuevo con
+# `enviar_credenciales`. Hasta entonces cualquiera que conozca un id puede
+# marcar su asistencia; sin fecha, solo se aceptan QR firmados.
+QR_LEGADO_HASTA = date.fromisoformat(os.environ["QR_LEGADO_HASTA"]) if os.environ.get("QR_LEGADO_HASTA") else None
+
+# ---------------------------------------------------------
+#  EVENTOS EN VIVO (paneles de asistencia)
+# ---------------------------------------------------------
+# Requieren el servidor ASGI. Con varios workers usa
+# "paneladm.eventos.BrokerCache" y una caché compartida (Redis/Memcached).
+EVENTOS_BACKEND = os.environ.get("EVENTOS_BACKEND", "paneladm.eventos.BrokerLocal")
+
+# ---------------------------------------------------------
+#  ETIQUETAS PRE-RENDERIZADAS
+# ---------------------------------------------------------
+# Rutas a archivos TTF/OTF. Sin ETIQUETAS_FUENTE se usa la fuente de Pillow,
+# que no trae tildes; se recomienda Poppins Bold, la misma de la versión HTML.
+# Sin ETIQUETAS_FUENTE_EMOJI (p. ej. NotoColorEmoji) los emojis los agrega la página.
+ETIQUETAS_FUENTE = os.environ.get("ETIQUETAS_FUENTE") or None
+ETIQUETAS_FUENTE_EMOJI = os.environ.get("ETIQUETAS_FUENTE_EMOJI") or None
+
 # ---------------------------------------------------------
 #  CONFIGURACIÓN DE EMAIL
 # ---------------------------------------------------------
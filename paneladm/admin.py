@@ -1,3 +1,38 @@
 from django.contrib import admin
+from .asistencia import marcar_asistencia, quitar_asistencias
+from .models import Asistencia, CorreoSaliente
 
-# Register your models here.
+class CorreoSalienteAdmin(admin.ModelAdmin):
+    list_display = ('asunto', 'destinatario', 'estado', 'intentos', 'proximo_intento', 'enviado_en')
+    list_filter = ('estado',)
+    search_fields = ('destinatario', 'asunto')
+
+admin.site.register(CorreoSaliente, CorreoSalienteAdmin)
+
+class AsistenciaAdmin(admin.ModelAdmin):
+    list_display = ('reunion', 'usuario', 'checked_in_at', 'estacion', 'registrado_por')
+    list_filter = ('estacion',)
+    list_select_related = ('reunion', 'usuario', 'registrado_por')
+    raw_id_fields = ('usuario', 'registrado_por')
+
+    # Altas y bajas pasan por paneladm/asistencia.py para mantener cantidad_asistencias.
+    def get_readonly_fields(self, request, obj=None):
+        # Mover una fila a otra reunión u otro usuario descuadraría los contadores.
+        return ('reunion', 'usuario') if obj else ()
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            return super().save_model(request, obj, form, change)
+        marcar_asistencia(
+            obj.reunion_id, obj.usuario_id, registrado_por=obj.registrado_por,
+            estacion=obj.estacion or 'admin', checked_in_at=obj.checked_in_at,
+        )
+        obj.pk = Asistencia.objects.values_list('pk', flat=True).get(reunion_id=obj.reunion_id, usuario_id=obj.usuario_id)
+
+    def delete_model(self, request, obj):
+        quitar_asistencias(Asistencia.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        quitar_asistencias(queryset)
+
+admin.site.register(Asistencia, AsistenciaAdmin)
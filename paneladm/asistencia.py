@@ -0,0 +1,323 @@
+"""
+Registro de asistencia (check-in) en una sola transacción.
+
+`Asistencia` tiene una restricción única (reunion, usuario): en lugar de
+preguntar antes si el usuario ya está, se inserta la fila dentro de un
+savepoint y un IntegrityError significa "ya registrado". En la misma
+transacción se incrementa `cantidad_asistencias` con un UPDATE atómico, así
+que la fila y el contador nunca se desincronizan.
+
+Varias estaciones (tótems, ayudantes) pueden escanear a la misma persona a
+la vez. Todo lo que toca asistencias bloquea en el mismo orden: las filas de
+los usuarios (por id), después la de la reunión y al final las de
+Asistencia, así que esperan su turno sin deadlocks y solo una cuenta. La
+reunión va antes que el INSERT porque en InnoDB el INSERT toma un bloqueo
+compartido sobre la fila padre (la clave foránea): si el contador de la
+reunión se actualizara después, dos estaciones que registran a personas
+distintas se bloquearían mutuamente. El comando `carga_checkin` lo comprueba
+contra un servidor real.
+
+Los escáneres pueden mandar una clave de idempotencia: si reintentan tras un
+timeout, reciben el mismo resultado del primer intento en vez de un "ya
+registrado", y nunca se cuenta dos veces.
+
+Todo lo que crea o borra filas de Asistencia (vistas, admin, tótems, borrar
+una reunión) pasa por este módulo, que ajusta el contador del usuario y el
+`num_asistentes` de la reunión (ver paneladm/contadores.py) en la misma
+transacción. Lo que igual se descuadre lo corrigen `reconciliar_contadores`
+(comando `reconciliar_asistencias`) y `recalcular_contadores_reuniones`.
+"""
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from usuario.cache import invalidar_usuario, invalidar_usuarios
+from usuario.models import Usuario
+from usuario.qr import leer_codigo_qr
+from .contadores import ajustar, descontar
+from .eventos import publicar_ingresos
+from .models import Asistencia, Reunion
+from .roster import registrar_cambio
+
+TIEMPO_IDEMPOTENCIA = 10 * 60  # segundos que se recuerda una clave
+
+
+class Checkin(NamedTuple):
+    usuario: Usuario
+    nuevo: bool  # False si el usuario ya figuraba como asistente
+    imprimir_etiqueta: bool
+
+
+def _clave_idempotencia(reunion_id, clave):
+    return f'checkin:{reunion_id}:{clave}'
+
+
+def marcar_asistencia(reunion_id, usuario_id, clave=None, registrado_por=None, estacion='', checked_in_at=None):
+    """
+    Registra a `usuario_id` como asistente de `reunion_id` y devuelve un `Checkin`.
+    `registrado_por` (quien escaneó), `estacion` y la hora (por defecto, ahora)
+    quedan en la fila de Asistencia.
+    Lanza Http404 si la reunión o el usuario no existen.
+    """
+    if clave:
+        anterior = cache.get(_clave_idempotencia(reunion_id, clave))
+        if anterior is not None:
+            return anterior
+
+    imprimir_etiqueta = get_object_or_404(
+        Reunion.objects.values_list('imprimir_etiqueta_al_asistir', flat=True), id=reunion_id
+    )
+    usuario = get_object_or_404(Usuario, id=usuario_id)
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                # Los contadores van primero: el UPDATE del usuario bloquea su fila, así
+                # que las estaciones que escanean a la misma persona se turnan ahí, y
+                # el de la reunión la bloquea en exclusiva antes del INSERT (ver arriba).
+                # Si la fila de Asistencia ya existe, el savepoint deshace ambos UPDATE.
+                Usuario.objects.filter(id=usuario_id).update(cantidad_asistencias=F('cantidad_asistencias') + 1)
+                ajustar('num_asistentes', [reunion_id], 1)
+                Asistencia.objects.create(
+                    reunion_id=reunion_id, usuario_id=usuario_id,
+                    registrado_por=registrado_por, estacion=estacion,
+                    checked_in_at=checked_in_at or timezone.now(),
+                )
+        except IntegrityError:
+            nuevo = False
+        else:
+            nuevo = True
+            usuario.cantidad_asistencias += 1
+            transaction.on_commit(lambda: invalidar_usuario(usuario_id))
+
+        resultado = Checkin(usuario, nuevo, imprimir_etiqueta)
+        if clave:
+            transaction.on_commit(
+                lambda: cache.set(_clave_idempotencia(reunion_id, clave), resultado, TIEMPO_IDEMPOTENCIA)
+            )
+
+    if clave and not nuevo:
+        # Un reintento que llegó mientras el primer intento seguía en curso
+        # esperó su bloqueo; si ese intento registró, se responde lo mismo.
+        anterior = cache.get(_clave_idempotencia(reunion_id, clave))
+        if anterior is not None:
+            return anterior
+    return resultado
+
+
+def _bloquear(usuario_ids, reunion_ids):
+    """Bloquea en el orden de todo el módulo: los usuarios por id y después las reuniones por id."""
+    if connection.features.has_select_for_update:
+        list(Usuario.objects.filter(id__in=usuario_ids).order_by('id').select_for_update().values_list('id', flat=True))
+        list(Reunion.objects.filter(id__in=reunion_ids).order_by('id').select_for_update().values_list('id', flat=True))
+
+
+def quitar_asistencias(asistencias):
+    """
+    Borra las filas del queryset `asistencias` y descuenta a cada usuario las
+    suyas, en una transacción. Devuelve cuántas filas se borraron.
+
+    Bloquea como el check-in: primero los usuarios y las reuniones afectadas,
+    y recién después (con una lectura con bloqueo) las filas de Asistencia. Si
+    entre la primera lectura y los bloqueos alguien registró a otra persona,
+    se vuelve a empezar con el conjunto nuevo.
+    """
+    while True:
+        with transaction.atomic():
+            vistas = set(asistencias.values_list('usuario_id', 'reunion_id'))
+            if not vistas:
+                return 0
+            _bloquear({u for u, _ in vistas}, {r for _, r in vistas})
+            filas = list(asistencias.select_for_update().values_list('id', 'usuario_id', 'reunion_id'))
+            if filas and {(u, r) for _, u, r in filas} <= vistas:
+                return _borrar_asistencias(filas)
+            if not filas:
+                return 0
+
+
+def _borrar_asistencias(filas):
+    """Borra `filas` (id, usuario_id, reunion_id), ya bloqueadas, y descuenta los contadores."""
+    por_usuario = {}
+    for _, usuario_id, _ in filas:
+        por_usuario[usuario_id] = por_usuario.get(usuario_id, 0) + 1
+    Asistencia.objects.filter(id__in=[id_ for id_, _, _ in filas]).delete()
+    descontar('num_asistentes', [reunion_id for _, _, reunion_id in filas])
+    # Casi siempre es una fila por usuario: un UPDATE por cada cantidad distinta.
+    por_cantidad = {}
+    for usuario_id, n in por_usuario.items():
+        por_cantidad.setdefault(n, []).append(usuario_id)
+    for n, usuario_ids in por_cantidad.items():
+        Usuario.objects.filter(id__in=usuario_ids).update(
+            cantidad_asistencias=Greatest(F('cantidad_asistencias') - n, 0)
+        )
+    transaction.on_commit(lambda: invalidar_usuarios(list(por_usuario)))
+    return len(filas)
+
+
+def quitar_asistencia(reunion_id, usuario_id):
+    """Elimina la asistencia y descuenta el contador del usuario. Devuelve True si existía."""
+    return bool(quitar_asistencias(Asistencia.objects.filter(reunion_id=reunion_id, usuario_id=usuario_id)))
+
+
+def eliminar_reunion(reunion_id):
+    """
+    Borra la reunión descontando antes una asistencia a cada uno de sus
+    asistentes. `quitar_asistencias` deja bloqueada la reunión (después de
+    sus asistentes), así que nadie más se registra antes del borrado.
+    """
+    with transaction.atomic():
+        quitar_asistencias(Asistencia.objects.filter(reunion_id=reunion_id))
+        Reunion.objects.filter(id=reunion_id).delete()
+
+
+def curva_llegadas(reunion_id, minutos=5):
+    """
+    Ingresos por intervalo de `minutos` (hora local), para el gráfico de llegadas.
+    Lee solo `checked_in_at` por el índice (reunion, checked_in_at).
+    Devuelve (etiquetas, cantidades).
+    """
+    horas = Asistencia.objects.filter(reunion_id=reunion_id).order_by('checked_in_at').values_list('checked_in_at', flat=True)
+    conteo = {}
+    for hora in horas:
+        hora = timezone.localtime(hora)
+        inicio = hora.replace(minute=hora.minute - hora.minute % minutos, second=0, microsecond=0)
+        conteo[inicio] = conteo.get(inicio, 0) + 1
+    return [h.strftime('%H:%M') for h in conteo], list(conteo.values())
+
+
+# --- Sincronización por lotes (tótems sin conexión) ---
+
+MAX_REGISTROS_LOTE = 500
+
+
+def _leer_registro(registro, ahora):
+    """Valida un registro del tótem; devuelve (usuario_id, hora, estacion) o None si no sirve."""
+    if not isinstance(registro, dict):
+        return None
+    # Los tótems mandan el código del QR; los de versiones anteriores, `usuario_id`.
+    usuario_id = leer_codigo_qr(registro.get('codigo', registro.get('usuario_id')))
+    if usuario_id is None:
+        return None
+    try:
+        hora = parse_datetime(str(registro.get('scanned_at') or ''))
+    except ValueError:
+        hora = None
+    if hora is None:
+        hora = ahora
+    elif timezone.is_naive(hora):
+        hora = timezone.make_aware(hora)
+    # Un reloj adelantado en el tótem no puede dejar ingresos en el futuro.
+    hora = min(hora, ahora)
+    return usuario_id, hora, str(registro.get('estacion') or '')[:50]
+
+
+def sincronizar_asistencias(reunion_id, registros, registrado_por=None):
+    """
+    Registra de una vez los escaneos que un tótem acumuló sin conexión.
+
+    Todo ocurre en una transacción. Con las filas de los usuarios bloqueadas
+    (nadie más puede registrarlos mientras tanto) se leen los que ya figuraban
+    como asistentes; el resto es lo que inserta este lote, y un solo UPDATE
+    suma 1 al contador de cada uno. Así un lote reenviado (el tótem no recibió
+    la respuesta) no cuenta a nadie dos veces.
+
+    Devuelve una lista alineada con `registros`. Cada elemento lleva un
+    `estado`: 'registrado', 'ya_registrado' (figuraba antes de este lote),
+    'duplicado' (repetido dentro del lote), 'no_existe' o 'invalido'. Incluye
+    la `clave` del registro si la traía.
+    """
+    ahora = timezone.now()
+    leidos = [_leer_registro(r, ahora) for r in registros]
+    ids = {l[0] for l in leidos if l}
+    existentes = dict(Usuario.objects.filter(id__in=ids).values_list('id', 'nombre'))
+
+    # Si un usuario viene repetido en el lote, vale el escaneo más temprano.
+    candidatos = {}
+    for leido in leidos:
+        if leido and leido[0] in existentes and (leido[0] not in candidatos or leido[1] < candidatos[leido[0]][1]):
+            candidatos[leido[0]] = leido
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            # Mismo orden de bloqueo que `marcar_asistencia`: primero los usuarios
+            # (por id, para que dos lotes no se crucen), después la reunión y las asistencias.
+            list(Usuario.objects.filter(id__in=candidatos).order_by('id').select_for_update().values_list('id', flat=True))
+        previos = set(
+            Asistencia.objects.filter(reunion_id=reunion_id, usuario_id__in=candidatos).values_list('usuario_id', flat=True)
+        )
+        insertados = set(candidatos) - previos
+        if insertados:
+            Usuario.objects.filter(id__in=insertados).update(cantidad_asistencias=F('cantidad_asistencias') + 1)
+            # La reunión antes del INSERT, como en `marcar_asistencia`.
+            ajustar('num_asistentes', [reunion_id], len(insertados))
+        Asistencia.objects.bulk_create(
+            [
+                Asistencia(reunion_id=reunion_id, usuario_id=uid, checked_in_at=hora, estacion=estacion, registrado_por=registrado_por)
+                for uid, (_, hora, estacion) in candidatos.items() if uid in insertados
+            ],
+            ignore_conflicts=True,
+        )
+        if insertados:
+            transaction.on_commit(lambda: invalidar_usuarios(insertados))
+            # bulk_create no dispara post_save: se avisa al padrón y a los paneles a mano.
+            transaction.on_commit(lambda: registrar_cambio(reunion_id, insertados))
+            transaction.on_commit(lambda: publicar_ingresos(reunion_id, insertados))
+
+    resultados = []
+    for registro, leido in zip(registros, leidos):
+        resultado = {'clave': registro.get('clave') if isinstance(registro, dict) else None}
+        if not leido:
+            resultado['estado'] = 'invalido'
+        elif leido[0] not in existentes:
+            resultado.update(usuario_id=leido[0], estado='no_existe')
+        else:
+            uid = leido[0]
+            if uid in previos:
+                estado = 'ya_registrado'
+            else:
+                estado = 'registrado' if candidatos[uid] is leido else 'duplicado'
+            resultado.update(usuario_id=uid, nombre=existentes[uid], estado=estado)
+        resultados.append(resultado)
+    return resultados
+
+
+# --- Reconciliación de contadores ---
+
+def contadores_desviados():
+    """
+    Usuarios cuyo `cantidad_asistencias` no coincide con sus filas de
+    Asistencia, en una sola consulta agrupada. Devuelve una lista de
+    (id, nombre, apellido, guardado, real).
+    """
+    return list(
+        Usuario.objects.values_list('id', 'nombre', 'apellido', 'cantidad_asistencias')
+        .annotate(real=Count('asistencias'))
+        .filter(~Q(cantidad_asistencias=F('real')))
+        .order_by('id')
+    )
+
+
+def reconciliar_contadores(aplicar=True):
+    """
+    Recalcula los contadores desviados con un solo UPDATE que cuenta las filas
+    de Asistencia en la base de datos. Devuelve lo que encontró
+    `contadores_desviados` (el reporte). Reemplaza también los valores
+    editados a mano.
+    """
+    with transaction.atomic():
+        desviados = contadores_desviados()
+        if desviados and aplicar:
+            ids = [d[0] for d in desviados]
+            reales = (
+                Asistencia.objects.filter(usuario=OuterRef('pk')).order_by()
+                .values('usuario').annotate(n=Count('id')).values('n')
+            )
+            Usuario.objects.filter(id__in=ids).update(cantidad_asistencias=Coalesce(Subquery(reales), 0))
+            transaction.on_commit(lambda: invalidar_usuarios(ids))
+    return desviados
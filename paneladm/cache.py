@@ -0,0 +1,76 @@
+"""
+Contadores del panel guardados en la caché.
+
+El número de tickets de soporte abiertos se mantiene con las señales de
+`SoporteTicket` (+1/-1 por cada cambio) y caduca cada `TIEMPO_RECONCILIACION`
+segundos; la siguiente lectura tras caducar lo vuelve a contar en la base de
+datos, lo que corrige cualquier desvío acumulado.
+
+Los totales de la búsqueda de usuarios del panel se guardan por (término,
+rubro) y solo se usan como referencia aproximada.
+"""
+import hashlib
+
+from django.core.cache import cache
+
+CLAVE_TICKETS_ABIERTOS = 'soporte:tickets_abiertos'
+TIEMPO_RECONCILIACION = 10 * 60  # segundos
+
+
+def reconciliar_tickets_abiertos():
+    """Cuenta los tickets abiertos en la base de datos y guarda el resultado."""
+    from .models import SoporteTicket
+
+    total = SoporteTicket.objects.filter(estado='abierto').count()
+    cache.set(CLAVE_TICKETS_ABIERTOS, total, TIEMPO_RECONCILIACION)
+    return total
+
+
+def tickets_abiertos():
+    """Número de tickets abiertos; sin consultas mientras el contador esté en caché."""
+    total = cache.get(CLAVE_TICKETS_ABIERTOS)
+    if total is None:
+        total = reconciliar_tickets_abiertos()
+    return total
+
+
+def ajustar_tickets_abiertos(delta):
+    if not delta:
+        return
+    try:
+        cache.incr(CLAVE_TICKETS_ABIERTOS, delta)
+    except ValueError:
+        # No hay contador en caché: la próxima lectura lo reconstruye.
+        pass
+
+
+# ---------------------------------------------------------
+#  Totales aproximados de la búsqueda de usuarios del panel
+# ---------------------------------------------------------
+TIEMPO_CONTEOS_USUARIOS = 5 * 60  # segundos
+
+
+def clave_conteo_usuarios(termino, rubro):
+    texto = f'{termino.strip().lower()}\x00{rubro}'
+    return 'panel:usuarios:conteo:' + hashlib.sha1(texto.encode()).hexdigest()
+
+
+def guardar_conteo_usuarios(termino, rubro, total):
+    cache.set(clave_conteo_usuarios(termino, rubro), total, TIEMPO_CONTEOS_USUARIOS)
+
+
+def conteo_usuarios(termino, rubro):
+    """
+    Total guardado para (termino, rubro), sin consultar la base: {'total': n,
+    'cota': bool} o None. Si el término no está, sirve el de su prefijo más
+    largo que sí esté, como cota superior (`cota`): la búsqueda es por
+    prefijo, así que alargar el término solo puede quitar resultados.
+    """
+    termino = termino.strip().lower()
+    prefijos = [termino[:n] for n in range(len(termino), -1, -1)]
+    claves = [clave_conteo_usuarios(p, rubro) for p in prefijos]
+    guardados = cache.get_many(claves)
+    for prefijo, clave in zip(prefijos, claves):
+        if clave in guardados:
+            return {'total': guardados[clave], 'cota': prefijo != termino}
+    return None
@@ -0,0 +1,90 @@
+"""
+Contadores de asistentes e interesados de cada reunión (`Reunion.num_asistentes`
+y `Reunion.num_interesados`), para que los listados, las estadísticas y los
+exportes no cuenten filas con un JOIN por reunión.
+
+- `num_asistentes` lo ajustan los servicios de paneladm/asistencia.py, en la
+  misma transacción que crean o borran las filas de Asistencia.
+- `num_interesados` lo ajustan las señales `m2m_changed` de
+  `Reunion.interesados` (ver paneladm/models.py).
+- Al borrar un usuario se descuentan ambos antes del borrado en cascada, que
+  no pasa por ninguno de los dos caminos.
+
+Lo que igual se descuadre (SQL directo, restauraciones) lo corrige
+`recalcular_reuniones` (comando `recalcular_contadores_reuniones`).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+CAMPOS = ('num_asistentes', 'num_interesados')
+
+
+def ajustar(campo, reunion_ids, n):
+    """Suma `n` al contador `campo` de cada reunión; si `n` es negativo, sin bajar de 0."""
+    from .models import Reunion
+
+    reunion_ids = list(reunion_ids)
+    if not reunion_ids or not n:
+        return
+    valor = F(campo) + n if n > 0 else Greatest(F(campo) + n, 0)
+    Reunion.objects.filter(id__in=reunion_ids).update(**{campo: valor})
+
+
+def descontar(campo, reunion_ids):
+    """Resta 1 por cada aparición de una reunión en `reunion_ids`: un UPDATE por cantidad distinta."""
+    por_cantidad = {}
+    for reunion_id, n in Counter(reunion_ids).items():
+        por_cantidad.setdefault(n, []).append(reunion_id)
+    for n, ids in por_cantidad.items():
+        ajustar(campo, ids, -n)
+
+
+def _reales():
+    from .models import Asistencia, Reunion
+
+    asistentes = (
+        Asistencia.objects.filter(reunion=OuterRef('pk')).order_by()
+        .values('reunion').annotate(n=Count('id')).values('n')
+    )
+    interesados = (
+        Reunion.interesados.through.objects.filter(reunion=OuterRef('pk')).order_by()
+        .values('reunion').annotate(n=Count('id')).values('n')
+    )
+    return {
+        'num_asistentes': Coalesce(Subquery(asistentes), 0),
+        'num_interesados': Coalesce(Subquery(interesados), 0),
+    }
+
+
+def reuniones_desviadas():
+    """
+    Reuniones con algún contador distinto de sus filas, en una consulta.
+    Devuelve una lista de (id, detalle, asistentes guardado, real,
+    interesados guardado, real).
+    """
+    from .models import Reunion
+
+    reales = _reales()
+    return list(
+        Reunion.objects.annotate(real_asistentes=reales['num_asistentes'], real_interesados=reales['num_interesados'])
+        .filter(~Q(num_asistentes=F('real_asistentes')) | ~Q(num_interesados=F('real_interesados')))
+        .order_by('id')
+        .values_list('id', 'detalle', 'num_asistentes', 'real_asistentes', 'num_interesados', 'real_interesados')
+    )
+
+
+def recalcular_reuniones(aplicar=True):
+    """
+    Corrige los contadores desviados con un solo UPDATE que cuenta las filas
+    en la base de datos. Devuelve el reporte de `reuniones_desviadas`.
+    """
+    from .models import Reunion
+
+    with transaction.atomic():
+        desviadas = reuniones_desviadas()
+        if desviadas and aplicar:
+            Reunion.objects.filter(id__in=[d[0] for d in desviadas]).update(**_reales())
+    return desviadas
@@ -0,0 +1,113 @@
+"""
+Bandeja de salida de correos (ver `CorreoSaliente`).
+
+`encolar_correo` es lo único que usan las vistas: inserta una fila y vuelve de
+inmediato. `enviar_pendientes` reserva un lote, abre una sola conexión SMTP
+para todo el lote fuera de cualquier transacción (ninguna fila queda bloqueada
+mientras se habla con el servidor) y registra el resultado de cada correo. Los fallos se reintentan
+con espera exponencial hasta MAX_INTENTOS; después quedan como 'fallido'.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from usuario.qr import generar_qr_png, nombre_archivo_qr
+from .models import CorreoSaliente
+
+MAX_INTENTOS = 6
+ESPERA_BASE = 60  # segundos; se duplica en cada intento
+ESPERA_MAXIMA = 60 * 60
+ARRENDAMIENTO = 10 * 60  # segundos que un worker se reserva un lote mientras lo envía
+
+
+def encolar_correo(asunto, cuerpo, destinatario, adjuntar_qr_de=None, remitente=None):
+    return CorreoSaliente.objects.create(
+        asunto=asunto,
+        cuerpo=cuerpo,
+        remitente=remitente or settings.DEFAULT_FROM_EMAIL,
+        destinatario=destinatario,
+        adjuntar_qr_de=adjuntar_qr_de,
+    )
+
+
+def espera_reintento(intentos):
+    return timedelta(seconds=min(ESPERA_BASE * 2 ** (intentos - 1), ESPERA_MAXIMA))
+
+
+def construir_mensaje(correo, conexion):
+    email = EmailMessage(correo.asunto, correo.cuerpo, correo.remitente, [correo.destinatario], connection=conexion)
+    if correo.adjuntar_qr_de_id:
+        email.attach(nombre_archivo_qr(correo.adjuntar_qr_de_id), generar_qr_png(correo.adjuntar_qr_de_id), 'image/png')
+    return email
+
+
+def reservar_pendientes(tamano):
+    """
+    Toma hasta `tamano` correos pendientes en una transacción corta y los
+    reserva corriendo su `proximo_intento` en ARRENDAMIENTO: mientras se envían,
+    ningún otro worker los ve como pendientes. Si el worker muere a mitad de
+    camino, vuelven a estar disponibles cuando vence la reserva.
+    """
+    with transaction.atomic():
+        ahora = timezone.now()
+        pendientes = CorreoSaliente.objects.filter(estado='pendiente', proximo_intento__lte=ahora).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Varios workers pueden reservar en paralelo sin tomar los mismos correos.
+            pendientes = pendientes.select_for_update(skip_locked=True)
+        correos = list(pendientes[:tamano])
+        if correos:
+            CorreoSaliente.objects.filter(id__in=[c.id for c in correos]).update(
+                proximo_intento=ahora + timedelta(seconds=ARRENDAMIENTO)
+            )
+    return correos
+
+
+def enviar_pendientes(tamano=50):
+    """
+    Envía un lote de correos pendientes y devuelve (enviados, fallidos).
+    El envío SMTP ocurre fuera de toda transacción: se reserva el lote, se
+    envía y el resultado se registra en una segunda transacción corta.
+    """
+    correos = reservar_pendientes(tamano)
+    if not correos:
+        return 0, 0
+
+    errores = {}
+    conexion = get_connection()
+    abierta = False
+    try:
+        for correo in correos:
+            try:
+                # Con la conexión abierta de antemano, send() la reutiliza en vez
+                # de abrir y cerrar una por correo.
+                if not abierta:
+                    conexion.open()
+                    abierta = True
+                construir_mensaje(correo, conexion).send()
+            except Exception as e:
+                # Si la conexión quedó rota, el siguiente envío abre una nueva.
+                conexion.close()
+                abierta = False
+                errores[correo.id] = str(e)
+    finally:
+        conexion.close()
+
+    with transaction.atomic():
+        ahora = timezone.now()
+        for correo in correos:
+            correo.intentos += 1
+            if correo.id in errores:
+                correo.ultimo_error = errores[correo.id]
+                if correo.intentos >= MAX_INTENTOS:
+                    correo.estado = 'fallido'
+                else:
+                    correo.proximo_intento = ahora + espera_reintento(correo.intentos)
+                correo.save(update_fields=['intentos', 'ultimo_error', 'estado', 'proximo_intento'])
+            else:
+                correo.estado = 'enviado'
+                correo.enviado_en = ahora
+                correo.save(update_fields=['estado', 'intentos', 'enviado_en'])
+    return len(correos) - len(errores), len(errores)
@@ -0,0 +1,285 @@
+"""
+Eventos de asistencia en vivo para los paneles (Server-Sent Events).
+
+Cada ingreso o salida confirmado en la base de datos se publica en el broker,
+que lo reparte a los clientes conectados a `eventos_reunion` de esa reunión.
+La vista es asíncrona y necesita el servidor ASGI (`Ecosistema/asgi.py`): cada
+cliente conectado es una corrutina que espera en su cola, no un hilo.
+
+El broker se elige con EVENTOS_BACKEND:
+
+- `BrokerLocal` (por defecto) reparte dentro del proceso. Sirve con un solo
+  worker ASGI.
+- `BrokerCache` publica en la caché compartida (contador y una clave por
+  evento, como el padrón) y cada proceso con clientes la consulta y reparte
+  localmente. Sirve con varios workers si la caché es compartida.
+
+Contrapresión: cada cliente tiene una cola de MAX_EVENTOS_PENDIENTES. Un
+cliente que no alcanza a leer no frena a los demás ni hace crecer la memoria:
+al llenarse su cola se descarta lo pendiente, recibe un evento `reiniciar`
+(que le indica recargar el estado completo) y se cierra su conexión.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+MAX_EVENTOS_PENDIENTES = 100  # por cliente
+LATIDO = 15  # segundos sin eventos antes de mandar un comentario para mantener viva la conexión
+DURACION_MAXIMA = 10 * 60  # segundos; luego el stream termina y EventSource se reconecta solo
+TIEMPO_EVENTOS = 60 * 60  # segundos que BrokerCache guarda cada evento
+
+
+class Suscripcion:
+    """Cola acotada de un cliente. Se crea y se lee dentro del event loop del servidor."""
+
+    def __init__(self, reunion_id, al_desbordar=None, maximo=MAX_EVENTOS_PENDIENTES):
+        self.reunion_id = reunion_id
+        self.loop = asyncio.get_running_loop()
+        self.cola = asyncio.Queue(maxsize=maximo)
+        self.desbordada = False
+        self.al_desbordar = al_desbordar
+
+    def _entregar(self, evento):
+        if self.desbordada:
+            return
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.desbordada = True
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait(None)
+            # Deja de recibir ya, aunque el cliente (quizás desconectado) no vuelva a leer.
+            if self.al_desbordar:
+                self.al_desbordar(self)
+
+    async def siguiente(self, espera=LATIDO):
+        """Próximo evento, None si hay que cerrar por desborde; lanza TimeoutError tras `espera`."""
+        return await asyncio.wait_for(self.cola.get(), espera)
+
+
+def _entregar_a_todos(suscripciones, evento):
+    for suscripcion in suscripciones:
+        suscripcion._entregar(evento)
+
+
+class BrokerLocal:
+    """Reparte los eventos entre los clientes conectados a este proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscripciones = {}
+
+    def suscribir(self, reunion_id):
+        suscripcion = Suscripcion(reunion_id, al_desbordar=self.desuscribir)
+        with self._lock:
+            self._suscripciones.setdefault(reunion_id, set()).add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            suscripciones = self._suscripciones.get(suscripcion.reunion_id, set())
+            suscripciones.discard(suscripcion)
+            if not suscripciones:
+                self._suscripciones.pop(suscripcion.reunion_id, None)
+
+    def conectados(self, reunion_id=None):
+        with self._lock:
+            if reunion_id is None:
+                return sum(len(s) for s in self._suscripciones.values())
+            return len(self._suscripciones.get(reunion_id, ()))
+
+    def escuchando(self, reunion_id):
+        """Si vale la pena armar un evento para la reunión."""
+        return self.conectados(reunion_id) > 0
+
+    def _repartir(self, reunion_id, evento):
+        """Seguro de llamar desde cualquier hilo (p. ej. un `on_commit` de una vista síncrona)."""
+        with self._lock:
+            suscripciones = list(self._suscripciones.get(reunion_id, ()))
+        # Una sola llamada entre hilos por event loop, no una por cliente.
+        por_loop = {}
+        for suscripcion in suscripciones:
+            por_loop.setdefault(suscripcion.loop, []).append(suscripcion)
+        for loop, grupo in por_loop.items():
+            try:
+                loop.call_soon_threadsafe(_entregar_a_todos, grupo, evento)
+            except RuntimeError:
+                pass  # el loop ya se cerró
+
+    def publicar(self, reunion_id, evento):
+        self._repartir(reunion_id, evento)
+
+
+class BrokerCache(BrokerLocal):
+    """
+    Broker para varios workers sobre la caché de Django (Redis o Memcached
+    compartidos). Un hilo por proceso revisa cada INTERVALO segundos las
+    reuniones que tienen clientes conectados aquí.
+    """
+    INTERVALO = 0.5
+    # Segundos que se espera un evento cuyo número ya está en el contador: el
+    # publicador incrementa antes de escribir la clave del evento.
+    GRACIA = 5.0
+    # Segundos que vale la marca de que una reunión tiene clientes; el hilo de
+    # consulta la renueva mientras este proceso tenga alguno conectado.
+    TIEMPO_OYENTES = 10
+
+    def __init__(self):
+        super().__init__()
+        self._vistos = {}
+        self._faltantes = {}  # (reunion_id, n) -> desde cuándo se espera
+        self._renovado = 0.0
+        self._hilo = None
+
+    def escuchando(self, reunion_id):
+        # Los clientes pueden estar conectados a otro worker: se mira la marca
+        # compartida, así un check-in sin paneles abiertos no consulta nada más.
+        return cache.get(self._clave_oyentes(reunion_id)) is not None
+
+    @staticmethod
+    def _clave_contador(reunion_id):
+        return f'eventos:{reunion_id}:n'
+
+    @staticmethod
+    def _clave_oyentes(reunion_id):
+        return f'eventos:{reunion_id}:oyentes'
+
+    @staticmethod
+    def _clave_evento(reunion_id, n):
+        return f'eventos:{reunion_id}:{n}'
+
+    def publicar(self, reunion_id, evento):
+        clave = self._clave_contador(reunion_id)
+        cache.add(clave, 0, None)
+        try:
+            n = cache.incr(clave)
+        except ValueError:
+            # El contador expiró entre add e incr: se vuelve a crear.
+            cache.add(clave, 0, None)
+            n = cache.incr(clave)
+        cache.set(self._clave_evento(reunion_id, n), evento, TIEMPO_EVENTOS)
+
+    def suscribir(self, reunion_id):
+        suscripcion = super().suscribir(reunion_id)
+        cache.set(self._clave_oyentes(reunion_id), 1, self.TIEMPO_OYENTES)
+        with self._lock:
+            self._vistos.setdefault(reunion_id, cache.get(self._clave_contador(reunion_id), 0))
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._consultar, name='eventos-cache', daemon=True)
+                self._hilo.start()
+        return suscripcion
+
+    def _consultar(self):
+        while True:
+            time.sleep(self.INTERVALO)
+            with self._lock:
+                for reunion_id in list(self._vistos):
+                    if reunion_id not in self._suscripciones:
+                        del self._vistos[reunion_id]
+                for faltante in [f for f in self._faltantes if f[0] not in self._vistos]:
+                    del self._faltantes[faltante]
+                vistos = dict(self._vistos)
+            if vistos and time.monotonic() - self._renovado >= self.TIEMPO_OYENTES / 3:
+                cache.set_many({self._clave_oyentes(r): 1 for r in vistos}, self.TIEMPO_OYENTES)
+                self._renovado = time.monotonic()
+            for reunion_id, visto in vistos.items():
+                self._revisar(reunion_id, visto)
+
+    def _revisar(self, reunion_id, visto):
+        n = cache.get(self._clave_contador(reunion_id), 0)
+        if n < visto:
+            # La caché perdió el contador: se empieza de nuevo desde lo que haya.
+            visto = 0
+        if n > visto:
+            claves = {self._clave_evento(reunion_id, i): i for i in range(visto + 1, n + 1)}
+            eventos = cache.get_many(list(claves))
+            ahora = time.monotonic()
+            for clave, i in claves.items():
+                if clave in eventos:
+                    self._repartir(reunion_id, eventos[clave])
+                elif ahora - self._faltantes.setdefault((reunion_id, i), ahora) < self.GRACIA:
+                    # Aún no se escribe: no se avanza más allá, para no perderlo
+                    # (ni entregar los siguientes antes que él).
+                    n = i - 1
+                    break
+                # Entregado, o lo dejamos pasar tras la gracia (expiró o el publicador murió).
+                self._faltantes.pop((reunion_id, i), None)
+        with self._lock:
+            if reunion_id in self._vistos:
+                self._vistos[reunion_id] = n
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obtener_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'EVENTOS_BACKEND', 'paneladm.eventos.BrokerLocal'))()
+        return _broker
+
+
+def formatear_evento(evento):
+    """Un evento en formato SSE: `event: <tipo>` y el JSON en `data:`."""
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+async def flujo_eventos(broker, suscripcion):
+    """
+    Generador del cuerpo de la respuesta SSE de un cliente. Django 4.2 no avisa
+    a la vista cuando el cliente se va; el servidor falla al escribirle (en el
+    próximo evento o latido) y DURACION_MAXIMA acota lo que pueda quedar colgado.
+    """
+    fin = time.monotonic() + DURACION_MAXIMA
+    try:
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < fin:
+            try:
+                evento = await suscripcion.siguiente()
+            except asyncio.TimeoutError:
+                yield ': latido\n\n'
+                continue
+            if evento is None:
+                yield formatear_evento({'tipo': 'reiniciar'})
+                return
+            yield formatear_evento(evento)
+    finally:
+        broker.desuscribir(suscripcion)
+
+
+def _datos_asistentes(usuario_ids):
+    from django.templatetags.static import static
+    from usuario.models import Usuario
+
+    usuarios = Usuario.objects.filter(id__in=usuario_ids).only(
+        'id', 'nombre', 'apellido', 'rut', 'rubro', 'rubro_otro', 'foto'
+    )
+    return [
+        {
+            'id': u.id, 'nombre': u.nombre, 'apellido': u.apellido, 'rut': u.rut,
+            'rubro': u.get_rubro_real_display or '',
+            'foto_url': u.foto.url if u.foto else static('img/predeterminado.png'),
+        }
+        for u in usuarios
+    ]
+
+
+def publicar_ingresos(reunion_id, usuario_ids):
+    """Avisa a los paneles de la reunión. Llamar después del commit."""
+    broker = obtener_broker()
+    if broker.escuchando(reunion_id):
+        broker.publicar(reunion_id, {'tipo': 'ingreso', 'asistentes': _datos_asistentes(usuario_ids)})
+
+
+def publicar_salidas(reunion_id, usuario_ids):
+    broker = obtener_broker()
+    if broker.escuchando(reunion_id):
+        broker.publicar(reunion_id, {'tipo': 'salida', 'ids': list(usuario_ids)})
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from paneladm.asistencia import marcar_asistencia
+from paneladm.models import Reunion
+from usuario.models import Usuario
+
+
+class _Rollback(Exception):
+    pass
+
+
+def checkin_anterior(reunion_id, usuario_id):
+    """La secuencia que hacía `marcar_asistencia_qr` antes, como referencia."""
+    reunion = Reunion.objects.get(id=reunion_id)
+    usuario = Usuario.objects.get(id=usuario_id)
+    if reunion.asistentes.filter(id=usuario.id).exists():
+        return
+    if not reunion.asistentes.filter(id=usuario.id).exists():
+        reunion.asistentes.add(usuario)
+        usuario.cantidad_asistencias = F('cantidad_asistencias') + 1
+        usuario.save()
+        usuario.refresh_from_db()
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide escaneos/segundo del check-in anterior y del actual contra la base de datos configurada "
+        "(SQLite o MySQL), sobre datos de prueba que se descartan al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escaneos', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        n = options['escaneos']
+        self.stdout.write(f"Base de datos: {connection.vendor}")
+        try:
+            with transaction.atomic():
+                Usuario.objects.bulk_create([
+                    Usuario(
+                        nombre=f'Bench{i}', apellido='Prueba', rut=f'9{i:08d}', email=f'bench{i}@example.com',
+                        password='pbkdf2_sha256$bench', etiqueta_emojis='🚀',
+                    )
+                    for i in range(n)
+                ])
+                ids = list(Usuario.objects.filter(email__startswith='bench').order_by('id').values_list('id', flat=True))
+                for nombre, checkin in [('anterior', checkin_anterior), ('actual', marcar_asistencia)]:
+                    reunion = Reunion.objects.create(
+                        detalle=f'Bench {nombre}', descripcion='...', ubicacion='Concepción', fecha=timezone.now(),
+                    )
+                    self.medir(nombre, checkin, reunion.id, ids)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def medir(self, nombre, checkin, reunion_id, ids):
+        with CaptureQueriesContext(connection) as ctx:
+            checkin(reunion_id, ids[0])
+        inicio = time.perf_counter()
+        for usuario_id in ids[1:]:
+            checkin(reunion_id, usuario_id)
+        # Un reintento del mismo escaneo (ya registrado).
+        checkin(reunion_id, ids[0])
+        velocidad = len(ids) / (time.perf_counter() - inicio)
+        self.stdout.write(f"{nombre:<9} {velocidad:8.1f} escaneos/s   {len(ctx.captured_queries)} consultas por escaneo")
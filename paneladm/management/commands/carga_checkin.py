@@ -0,0 +1,209 @@
+import http.client
+import logging
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from paneladm.models import Asistencia, Reunion
+from usuario.models import Usuario
+from usuario.qr import firmar_token
+
+PREFIJO = 'carga-checkin'
+
+
+class ManejadorSilencioso(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Estacion(threading.Thread):
+    """Un escáner (tótem o ayudante) que manda sus escaneos uno tras otro por una conexión."""
+
+    def __init__(self, nombre, puerto, cabeceras, rutas, largada):
+        super().__init__(name=nombre, daemon=True)
+        self.puerto = puerto
+        self.cabeceras = dict(cabeceras, **{'X-Estacion': nombre})
+        self.rutas = rutas
+        self.largada = largada
+        self.latencias = []
+        self.estados = Counter()
+
+    def run(self):
+        conexion = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=30)
+        self.largada.wait()
+        for ruta in self.rutas:
+            inicio = time.perf_counter()
+            try:
+                conexion.request('POST', ruta, body=b'', headers=self.cabeceras)
+                respuesta = conexion.getresponse()
+                respuesta.read()
+                estado = respuesta.status
+            except (OSError, http.client.HTTPException):
+                conexion.close()
+                conexion = http.client.HTTPConnection('127.0.0.1', self.puerto, timeout=30)
+                estado = 'conexión'
+            self.latencias.append(time.perf_counter() - inicio)
+            self.estados[estado] += 1
+        conexion.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga del check-in con varias estaciones a la vez: levanta un servidor WSGI con hilos, "
+        "hace que cada asistente sea escaneado por varias estaciones casi al mismo tiempo y comprueba "
+        "que nadie quede contado dos veces. Informa la latencia p50/p95/p99. Los datos de prueba se borran al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--estaciones', type=int, default=8)
+        parser.add_argument('--asistentes', type=int, default=200)
+        parser.add_argument('--repeticiones', type=int, default=3,
+                            help="Estaciones distintas que escanean a cada asistente.")
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] > options['estaciones']:
+            raise CommandError("--repeticiones no puede superar a --estaciones.")
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError(
+                "Se necesita una base de datos en disco o un servidor: los hilos del servidor no comparten una base en memoria."
+            )
+
+        self.stdout.write(f"Base de datos: {connection.vendor}")
+        escaner, reunion, ids = self.sembrar(options['asistentes'])
+        sesion = SessionStore()
+        sesion['usuario_id'] = escaner.id
+        sesion.create()
+        try:
+            self.probar(options, reunion.id, ids, sesion.session_key)
+        finally:
+            sesion.delete()
+            # Borrar la reunión se lleva las asistencias en cascada.
+            Reunion.objects.filter(id=reunion.id).delete()
+            Usuario.objects.filter(email__endswith=f'@{PREFIJO}.invalid').delete()
+
+    def sembrar(self, n):
+        Usuario.objects.bulk_create([
+            Usuario(
+                nombre=f'Carga{i}', apellido='Checkin', rut=f'8{i:08d}', email=f'{i}@{PREFIJO}.invalid',
+                password='pbkdf2_sha256$carga', etiqueta_emojis='🚀',
+            )
+            for i in range(n)
+        ] + [
+            Usuario(
+                nombre='Estación', apellido='Carga', rut='899999999', email=f'totem@{PREFIJO}.invalid',
+                password='pbkdf2_sha256$carga', es_totem=True,
+            )
+        ])
+        # MySQL no devuelve los ids en bulk_create, así que se vuelven a leer.
+        escaner = Usuario.objects.get(email=f'totem@{PREFIJO}.invalid')
+        ids = list(
+            Usuario.objects.filter(email__endswith=f'@{PREFIJO}.invalid', es_totem=False)
+            .order_by('id').values_list('id', flat=True)
+        )
+        reunion = Reunion.objects.create(
+            detalle='Carga de check-in', descripcion='...', ubicacion='Concepción', fecha=timezone.now(),
+            imprimir_etiqueta_al_asistir=False,
+        )
+        return escaner, reunion, ids
+
+    def repartir(self, options, reunion_id, ids):
+        """
+        Cada asistente queda en la cola de `repeticiones` estaciones distintas y
+        en la misma posición, para que los escaneos repetidos lleguen juntos.
+        """
+        azar = random.Random(options['semilla'])
+        colas = [[] for _ in range(options['estaciones'])]
+        for usuario_id in ids:
+            ruta = reverse('panel-admin:marcar_asistencia_qr', args=[reunion_id, firmar_token(usuario_id)])
+            for estacion in azar.sample(range(options['estaciones']), options['repeticiones']):
+                colas[estacion].append(ruta)
+        return colas
+
+    def probar(self, options, reunion_id, ids, session_key):
+        # Cookie y cabecera CSRF iguales, como las manda el navegador de un tótem.
+        token = get_random_string(32)
+        cabeceras = {
+            'Host': 'localhost',
+            'Cookie': f'{settings.SESSION_COOKIE_NAME}={session_key}; {settings.CSRF_COOKIE_NAME}={token}',
+            'X-CSRFToken': token,
+        }
+
+        servidor = ThreadedWSGIServer(('127.0.0.1', 0), ManejadorSilencioso, allow_reuse_address=False)
+        servidor.set_app(WSGIHandler())
+        hilo_servidor = threading.Thread(target=servidor.serve_forever, daemon=True)
+        hilo_servidor.start()
+        # Los 409 de los escaneos repetidos son esperables: no se registra cada uno.
+        registro = logging.getLogger('django.request')
+        nivel = registro.level
+        registro.setLevel(logging.ERROR)
+        try:
+            largada = threading.Barrier(options['estaciones'])
+            estaciones = [
+                Estacion(f'estacion-{i}', servidor.server_port, cabeceras, cola, largada)
+                for i, cola in enumerate(self.repartir(options, reunion_id, ids))
+            ]
+            inicio = time.perf_counter()
+            for estacion in estaciones:
+                estacion.start()
+            for estacion in estaciones:
+                estacion.join()
+            transcurrido = time.perf_counter() - inicio
+        finally:
+            registro.setLevel(nivel)
+            servidor.shutdown()
+            servidor.server_close()
+
+        self.informar(estaciones, transcurrido, reunion_id, ids)
+
+    def informar(self, estaciones, transcurrido, reunion_id, ids):
+        estados = sum((e.estados for e in estaciones), Counter())
+        latencias = sorted(l for e in estaciones for l in e.latencias)
+        total = len(latencias)
+        self.stdout.write(
+            f"{len(estaciones)} estaciones, {total} escaneos en {transcurrido:.2f}s ({total / transcurrido:.1f} escaneos/s)"
+        )
+        self.stdout.write("Respuestas: " + ", ".join(f"{estado}: {n}" for estado, n in sorted(estados.items(), key=str)))
+        if total > 1:
+            cuantiles = statistics.quantiles(latencias, n=100)
+            self.stdout.write(
+                f"Latencia p50 {cuantiles[49] * 1000:.1f} ms   p95 {cuantiles[94] * 1000:.1f} ms   "
+                f"p99 {cuantiles[98] * 1000:.1f} ms"
+            )
+
+        filas_dobles = (
+            Asistencia.objects.filter(reunion_id=reunion_id).values('usuario_id')
+            .annotate(n=Count('id')).filter(n__gt=1).count()
+        )
+        registrados = Asistencia.objects.filter(reunion_id=reunion_id).count()
+        contadores = Counter(Usuario.objects.filter(id__in=ids).values_list('cantidad_asistencias', flat=True))
+        dobles = sum(n for cantidad, n in contadores.items() if cantidad > 1)
+        self.stdout.write(
+            f"Asistencias: {registrados}/{len(ids)}   filas repetidas: {filas_dobles}   contados dos veces: {dobles}"
+        )
+
+        problemas = []
+        if filas_dobles or dobles:
+            problemas.append("hay asistentes contados dos veces")
+        if registrados != len(ids) or contadores.get(1, 0) != len(ids):
+            problemas.append("hay asistentes sin registrar")
+        if estados.get(200, 0) != len(ids):
+            problemas.append(f"se esperaban {len(ids)} respuestas 200")
+        if set(estados) - {200, 409}:
+            problemas.append("hubo respuestas de error")
+        if problemas:
+            raise CommandError("; ".join(problemas) + ".")
+        self.stdout.write(self.style.SUCCESS("Sin dobles conteos."))
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.urls import reverse
+
+from Ecosistema.asgi import application
+from paneladm.eventos import obtener_broker
+from usuario.models import Usuario
+
+
+class Oyente:
+    """Un cliente SSE que habla ASGI directamente con la aplicación."""
+
+    def __init__(self, ruta, cookie, retraso):
+        self.ruta = ruta
+        self.cookie = cookie
+        self.retraso = retraso
+        self.latencias = []
+        self.reiniciado = False
+        self.cerrar = asyncio.Event()
+        self.conectado = asyncio.Event()
+        self.estado = None
+        self.pedido_enviado = False
+
+    async def receive(self):
+        if not self.pedido_enviado:
+            self.pedido_enviado = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.cerrar.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, mensaje):
+        if self.cerrar.is_set():
+            # Como un servidor ASGI al escribir a un cliente que ya se fue.
+            raise OSError('Cliente desconectado')
+        if mensaje['type'] == 'http.response.start':
+            self.estado = mensaje['status']
+            self.conectado.set()
+            return
+        ahora = time.perf_counter()
+        for bloque in mensaje.get('body', b'').decode().split('\n\n'):
+            if bloque.startswith('event: reiniciar'):
+                self.reiniciado = True
+            elif bloque.startswith('event: prueba'):
+                datos = json.loads(bloque.split('data: ', 1)[1])
+                self.latencias.append(ahora - datos['enviado'])
+        if self.retraso:
+            await asyncio.sleep(self.retraso)
+
+    async def escuchar(self):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': self.ruta, 'raw_path': self.ruta.encode(), 'query_string': b'',
+            'headers': [(b'host', b'localhost'), (b'cookie', self.cookie.encode())],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+        try:
+            await application(scope, self.receive, self.send)
+        except OSError:
+            pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de los eventos en vivo: abre muchas conexiones SSE contra la aplicación ASGI, "
+        "publica eventos desde otro hilo (como lo haría un on_commit) y mide la latencia de entrega. "
+        "Una parte de los oyentes lee lento para comprobar que se desconectan sin frenar al resto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--oyentes', type=int, default=300)
+        parser.add_argument('--lentos', type=int, default=10, help='Oyentes que tardan --retraso segundos por mensaje.')
+        parser.add_argument('--retraso', type=float, default=1.0)
+        parser.add_argument('--eventos', type=int, default=300)
+        parser.add_argument('--por-segundo', type=float, default=20.0)
+        parser.add_argument('--reunion', type=int, default=0, help='Id usado en la ruta; 0 no molesta a ningún panel real.')
+        parser.add_argument('--usuario', type=int, help='Cuenta privilegiada para la sesión (por defecto, el primer admin).')
+
+    def handle(self, *args, **options):
+        privilegiados = Usuario.objects.filter(Q(es_admin=True) | Q(es_ayudante=True) | Q(es_totem=True))
+        if options['usuario']:
+            privilegiados = privilegiados.filter(id=options['usuario'])
+        usuario = privilegiados.order_by('id').first()
+        if usuario is None:
+            raise CommandError('Se necesita una cuenta de administrador, ayudante o tótem.')
+
+        sesion = SessionStore()
+        sesion['usuario_id'] = usuario.id
+        sesion.create()
+        try:
+            asyncio.run(self.probar(options, f'{settings.SESSION_COOKIE_NAME}={sesion.session_key}'))
+        finally:
+            sesion.delete()
+
+    async def probar(self, options, cookie):
+        ruta = reverse('panel-admin:eventos_reunion', args=[options['reunion']])
+        oyentes = [
+            Oyente(ruta, cookie, options['retraso'] if i < options['lentos'] else 0)
+            for i in range(options['oyentes'])
+        ]
+        tareas = [asyncio.create_task(o.escuchar()) for o in oyentes]
+        inicio = time.perf_counter()
+        await asyncio.gather(*(o.conectado.wait() for o in oyentes))
+        if any(o.estado != 200 for o in oyentes):
+            for o in oyentes:
+                o.cerrar.set()
+            await asyncio.gather(*tareas, return_exceptions=True)
+            raise CommandError(f'El stream respondió {oyentes[0].estado} (¿EVENTOS_BACKEND y la sesión están bien?).')
+        self.stdout.write(f"{len(oyentes)} oyentes conectados en {time.perf_counter() - inicio:.2f}s")
+
+        broker = obtener_broker()
+        await asyncio.sleep(0.1)
+
+        def publicar():
+            pausa = 1 / options['por_segundo']
+            for i in range(options['eventos']):
+                broker.publicar(options['reunion'], {'tipo': 'prueba', 'n': i, 'enviado': time.perf_counter()})
+                time.sleep(pausa)
+
+        await sync_to_async(publicar, thread_sensitive=False)()
+        rapidos = [o for o in oyentes if not o.retraso]
+        limite = time.perf_counter() + 10
+        while time.perf_counter() < limite and any(len(o.latencias) < options['eventos'] for o in rapidos):
+            await asyncio.sleep(0.05)
+
+        for o in oyentes:
+            o.cerrar.set()
+        # Cada stream se entera de la desconexión al mandar el próximo mensaje.
+        obtener_broker().publicar(options['reunion'], {'tipo': 'cierre', 'enviado': time.perf_counter()})
+        await asyncio.gather(*tareas, return_exceptions=True)
+        await asyncio.sleep(0.1)
+
+        latencias = sorted(l for o in oyentes for l in o.latencias)
+        completos = sum(len(o.latencias) == options['eventos'] for o in rapidos)
+        self.stdout.write(f"Entregas: {len(latencias)} ({completos}/{len(rapidos)} oyentes rápidos recibieron todo)")
+        if latencias:
+            cuantiles = statistics.quantiles(latencias, n=100)
+            self.stdout.write(
+                f"Latencia p50 {cuantiles[49] * 1000:.1f} ms   p95 {cuantiles[94] * 1000:.1f} ms   "
+                f"p99 {cuantiles[98] * 1000:.1f} ms"
+            )
+        self.stdout.write(f"Oyentes lentos desconectados: {sum(o.reiniciado for o in oyentes)}/{options['lentos']}")
+        self.stdout.write(f"Suscripciones que quedaron abiertas: {broker.conectados(options['reunion'])}")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from paneladm.correos import enviar_pendientes
+
+
+class Command(BaseCommand):
+    help = "Worker que envía los correos de la bandeja de salida (CorreoSaliente)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50, help="Correos por conexión SMTP.")
+        parser.add_argument('--intervalo', type=float, default=5.0, help="Segundos de espera cuando no hay correos.")
+        parser.add_argument('--una-vez', action='store_true', help="Envía lo pendiente y termina.")
+
+    def handle(self, *args, **options):
+        while True:
+            enviados, fallidos = enviar_pendientes(options['lote'])
+            if enviados or fallidos:
+                self.stdout.write(f"{enviados} correos enviados, {fallidos} con error.")
+                continue
+            if options['una_vez']:
+                return
+            time.sleep(options['intervalo'])
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from paneladm.correos import encolar_correo
+from paneladm.models import CorreoSaliente
+from usuario.models import Usuario
+
+TAMANO_LOTE = 500
+
+ASUNTO = "Tu nuevo código QR para los eventos de EcosistemaLA"
+
+CUERPO = '''Hola {nombre},
+
+Cambiamos los códigos QR de ingreso a los eventos. Adjuntamos tu código
+nuevo: preséntalo en la entrada desde tu teléfono o impreso.
+
+El QR anterior (el que llevaba la dirección de tu perfil) dejará de
+funcionar pronto. También puedes ver tu código en cualquier momento
+ingresando al sitio web: meetingup.cl
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+EcosistemaLA - Comunidad Emprendedora
+meetingup.cl
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Encola un correo con el QR firmado para cada usuario con email, para reemplazar los QR antiguos "
+        "antes de QR_LEGADO_HASTA. Se puede repetir: no vuelve a encolar a quien ya tiene el correo en la bandeja."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reunion', type=int, help="Solo los interesados en esta reunión.")
+        parser.add_argument('--dry-run', action='store_true', help="Informa cuántos correos se encolarían, sin encolarlos.")
+
+    def handle(self, *args, **options):
+        usuarios = Usuario.objects.exclude(email='')
+        if options['reunion']:
+            usuarios = usuarios.filter(reuniones_interesado=options['reunion'])
+        ya_encolados = CorreoSaliente.objects.filter(asunto=ASUNTO, adjuntar_qr_de__isnull=False).values('adjuntar_qr_de')
+        usuarios = usuarios.exclude(id__in=ya_encolados).order_by('id')
+
+        if options['dry_run']:
+            self.stdout.write(f"Se encolarían {usuarios.count()} correos.")
+            return
+
+        encolados, ultimo_id = 0, 0
+        while True:
+            lote = list(usuarios.filter(id__gt=ultimo_id).values_list('id', 'nombre', 'email')[:TAMANO_LOTE])
+            if not lote:
+                break
+            with transaction.atomic():
+                for usuario_id, nombre, email in lote:
+                    encolar_correo(ASUNTO, CUERPO.format(nombre=nombre), email, adjuntar_qr_de=Usuario(id=usuario_id))
+            encolados += len(lote)
+            ultimo_id = lote[-1][0]
+        self.stdout.write(self.style.SUCCESS(f"{encolados} correos encolados; los envía el worker `enviar_correos`."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from paneladm.contadores import recalcular_reuniones
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara Reunion.num_asistentes y Reunion.num_interesados con las filas de asistencia e interés, "
+        "informa las diferencias y las corrige con un solo UPDATE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo-reporte', action='store_true', help="Informa las diferencias sin corregirlas.")
+        parser.add_argument('--mostrar', type=int, default=50, help="Máximo de reuniones a listar en el reporte.")
+
+    def handle(self, *args, **options):
+        desviadas = recalcular_reuniones(aplicar=not options['solo_reporte'])
+        if not desviadas:
+            self.stdout.write("Todos los contadores de reuniones coinciden.")
+            return
+        for reunion_id, detalle, asistentes, reales_a, interesados, reales_i in desviadas[:options['mostrar']]:
+            self.stdout.write(
+                f"  #{reunion_id:<6} {detalle}: asistentes {asistentes} -> {reales_a}, interesados {interesados} -> {reales_i}"
+            )
+        if len(desviadas) > options['mostrar']:
+            self.stdout.write(f"  ... y {len(desviadas) - options['mostrar']} más")
+        accion = "a corregir" if options['solo_reporte'] else "corregidas"
+        self.stdout.write(f"{len(desviadas)} reuniones {accion}.")
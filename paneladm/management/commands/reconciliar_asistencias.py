@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from paneladm.asistencia import reconciliar_contadores
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara Usuario.cantidad_asistencias con las filas de Asistencia, informa las diferencias "
+        "y las corrige con un solo UPDATE. Con --intervalo queda corriendo como tarea periódica."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo-reporte', action='store_true', help="Informa las diferencias sin corregirlas.")
+        parser.add_argument('--intervalo', type=float, default=0, help="Minutos entre ejecuciones; 0 ejecuta una vez.")
+        parser.add_argument('--mostrar', type=int, default=50, help="Máximo de usuarios a listar en el reporte.")
+
+    def handle(self, *args, **options):
+        while True:
+            self.reconciliar(options)
+            if not options['intervalo']:
+                return
+            time.sleep(options['intervalo'] * 60)
+
+    def reconciliar(self, options):
+        desviados = reconciliar_contadores(aplicar=not options['solo_reporte'])
+        if not desviados:
+            self.stdout.write("Todos los contadores coinciden con las asistencias registradas.")
+            return
+        for usuario_id, nombre, apellido, guardado, real in desviados[:options['mostrar']]:
+            self.stdout.write(f"  #{usuario_id:<6} {nombre} {apellido}: {guardado} -> {real} ({real - guardado:+d})")
+        if len(desviados) > options['mostrar']:
+            self.stdout.write(f"  ... y {len(desviados) - options['mostrar']} más")
+        diferencia = sum(real - guardado for *_, guardado, real in desviados)
+        accion = "a corregir" if options['solo_reporte'] else "corregidos"
+        self.stdout.write(f"{len(desviados)} contadores {accion} (diferencia neta {diferencia:+d}).")
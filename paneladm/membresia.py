@@ -0,0 +1,59 @@
+"""
+¿Un usuario está interesado en una reunión o ya asistió?
+
+Las dos relaciones tienen una fila por par (reunion, usuario) con índice
+único: `Asistencia` y la tabla intermedia de `Reunion.interesados`. Aquí se
+consultan directamente esas tablas con `exists()`, sin cargar a todos los
+asistentes ni pasar por la tabla de usuarios, así el costo no depende de
+cuánta gente tenga la reunión.
+
+Para una página con muchas tarjetas, `membresias` trae en una sola consulta
+(UNION ALL de ambas tablas) los ids de reunión de ese usuario.
+"""
+from typing import NamedTuple
+
+from django.db.models import IntegerField, Value
+
+from .models import Asistencia, Reunion
+
+Interes = Reunion.interesados.through
+
+ASISTE, INTERESADO = 1, 2
+
+
+class Membresias(NamedTuple):
+    asistidas: frozenset
+    interesadas: frozenset
+
+
+SIN_MEMBRESIAS = Membresias(frozenset(), frozenset())
+
+
+def es_asistente(usuario_id, reunion_id):
+    return Asistencia.objects.filter(reunion_id=reunion_id, usuario_id=usuario_id).exists()
+
+
+def es_interesado(usuario_id, reunion_id):
+    return Interes.objects.filter(reunion_id=reunion_id, usuario_id=usuario_id).exists()
+
+
+def membresias(usuario_id, reunion_ids):
+    """
+    Reuniones de `reunion_ids` a las que el usuario asistió y en las que está
+    interesado, en una consulta. Sin usuario o sin reuniones no consulta nada.
+    """
+    reunion_ids = list(reunion_ids)
+    if not usuario_id or not reunion_ids:
+        return SIN_MEMBRESIAS
+    asistencias = (
+        Asistencia.objects.filter(usuario_id=usuario_id, reunion_id__in=reunion_ids)
+        .annotate(tipo=Value(ASISTE, output_field=IntegerField())).values_list('reunion_id', 'tipo')
+    )
+    intereses = (
+        Interes.objects.filter(usuario_id=usuario_id, reunion_id__in=reunion_ids)
+        .annotate(tipo=Value(INTERESADO, output_field=IntegerField())).values_list('reunion_id', 'tipo')
+    )
+    asistidas, interesadas = set(), set()
+    for reunion_id, tipo in asistencias.union(intereses, all=True):
+        (asistidas if tipo == ASISTE else interesadas).add(reunion_id)
+    return Membresias(frozenset(asistidas), frozenset(interesadas))
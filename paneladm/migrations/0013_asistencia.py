@@ -0,0 +1,75 @@
+# Generated by Django 4.2.23 on 2026-10-18 01:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+TAMANO_LOTE = 1000
+
+
+def copiar_asistentes(apps, schema_editor):
+    """Copia la tabla intermedia automática a Asistencia; la hora de ingreso es la de la reunión."""
+    Reunion = apps.get_model('paneladm', 'Reunion')
+    Asistencia = apps.get_model('paneladm', 'Asistencia')
+    Intermedia = Reunion.asistentes.through
+    filas = Intermedia.objects.values_list('reunion_id', 'usuario_id', 'reunion__fecha').order_by('id')
+    lote = []
+    for reunion_id, usuario_id, fecha in filas.iterator(chunk_size=TAMANO_LOTE):
+        lote.append(Asistencia(reunion_id=reunion_id, usuario_id=usuario_id, checked_in_at=fecha))
+        if len(lote) == TAMANO_LOTE:
+            Asistencia.objects.bulk_create(lote)
+            lote = []
+    Asistencia.objects.bulk_create(lote)
+
+
+def restaurar_asistentes(apps, schema_editor):
+    Reunion = apps.get_model('paneladm', 'Reunion')
+    Asistencia = apps.get_model('paneladm', 'Asistencia')
+    Intermedia = Reunion.asistentes.through
+    Intermedia.objects.bulk_create(
+        [Intermedia(reunion_id=r, usuario_id=u) for r, u in Asistencia.objects.values_list('reunion_id', 'usuario_id')],
+        batch_size=TAMANO_LOTE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuario', '0015_trabajoqr'),
+        ('paneladm', '0012_correosaliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Asistencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checked_in_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Hora de ingreso')),
+                ('estacion', models.CharField(blank=True, max_length=50, verbose_name='Estación')),
+                ('registrado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='asistencias_registradas', to='usuario.usuario')),
+                ('reunion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='registros_asistencia', to='paneladm.reunion')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='asistencias', to='usuario.usuario')),
+            ],
+            options={
+                'verbose_name': 'Asistencia',
+                'verbose_name_plural': 'Asistencias',
+                'indexes': [
+                    models.Index(fields=['reunion', 'checked_in_at'], name='paneladm_as_reunion_737e4b_idx'),
+                    models.Index(fields=['usuario', 'checked_in_at'], name='paneladm_as_usuario_0816b5_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('reunion', 'usuario'), name='asistencia_unica_por_reunion'),
+                ],
+            },
+        ),
+        migrations.RunPython(copiar_asistentes, restaurar_asistentes),
+        migrations.RemoveField(
+            model_name='reunion',
+            name='asistentes',
+        ),
+        migrations.AddField(
+            model_name='reunion',
+            name='asistentes',
+            field=models.ManyToManyField(blank=True, related_name='reuniones_asistidas', through='paneladm.Asistencia', through_fields=('reunion', 'usuario'), to='usuario.usuario'),
+        ),
+    ]
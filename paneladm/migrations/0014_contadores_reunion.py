@@ -0,0 +1,44 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:21
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def llenar_contadores(apps, schema_editor):
+    Reunion = apps.get_model('paneladm', 'Reunion')
+    Asistencia = apps.get_model('paneladm', 'Asistencia')
+    Interes = Reunion.interesados.through
+    asistentes = (
+        Asistencia.objects.filter(reunion=OuterRef('pk')).order_by()
+        .values('reunion').annotate(n=Count('id')).values('n')
+    )
+    interesados = (
+        Interes.objects.filter(reunion=OuterRef('pk')).order_by()
+        .values('reunion').annotate(n=Count('id')).values('n')
+    )
+    Reunion.objects.update(
+        num_asistentes=Coalesce(Subquery(asistentes), 0),
+        num_interesados=Coalesce(Subquery(interesados), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paneladm', '0013_asistencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reunion',
+            name='num_asistentes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Asistentes'),
+        ),
+        migrations.AddField(
+            model_name='reunion',
+            name='num_interesados',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Interesados'),
+        ),
+        migrations.RunPython(llenar_contadores, migrations.RunPython.noop),
+    ]
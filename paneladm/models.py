@@ -1,5 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
 from django.utils import timezone
+from datetime import timedelta
+from .cache import ajustar_tickets_abiertos
+from .contadores import ajustar, descontar
+from .eventos import publicar_ingresos, publicar_salidas
+from .roster import registrar_cambio
+from usuario.cache import invalidar_paginas_publicas
 
 class Reunion(models.Model):
     detalle = models.CharField(max_length=200, verbose_name="Título o Detalle")
@@ -7,13 +15,19 @@ class Reunion(models.Model):
     fecha = models.DateTimeField(verbose_name="Fecha y Hora")
     ubicacion = models.CharField(max_length=255, verbose_name="Ubicación")
     imagen = models.ImageField(upload_to='reuniones/', null=True, blank=True, verbose_name="Imagen (Opcional)")
-    asistentes = models.ManyToManyField('usuario.Usuario', related_name='reuniones_asistidas', blank=True)
+    asistentes = models.ManyToManyField(
+        'usuario.Usuario', related_name='reuniones_asistidas', blank=True,
+        through='Asistencia', through_fields=('reunion', 'usuario'),
+    )
     interesados = models.ManyToManyField('usuario.Usuario', related_name='reuniones_interesado', blank=True)
     imprimir_etiqueta_al_asistir = models.BooleanField(
         default=True,
         verbose_name="¿Imprimir etiqueta al escanear QR?",
         help_text="Si se marca, se abrirá la ventana para imprimir la etiqueta del asistente al escanear su QR."
     )
+    # Contadores para listados y estadísticas (ver paneladm/contadores.py).
+    num_asistentes = models.PositiveIntegerField(default=0, editable=False, verbose_name="Asistentes")
+    num_interesados = models.PositiveIntegerField(default=0, editable=False, verbose_name="Interesados")
 
     def __str__(self):
         return self.detalle
@@ -22,6 +36,35 @@ class Reunion(models.Model):
         verbose_name = "Reunión"
         verbose_name_plural = "Reuniones"
 
+class Asistencia(models.Model):
+    """
+    Registro de ingreso de un usuario a una reunión (tabla intermedia de
+    `Reunion.asistentes`). Guarda cuándo llegó y quién o qué estación lo escaneó.
+    """
+    reunion = models.ForeignKey(Reunion, on_delete=models.CASCADE, related_name='registros_asistencia')
+    usuario = models.ForeignKey('usuario.Usuario', on_delete=models.CASCADE, related_name='asistencias')
+    checked_in_at = models.DateTimeField(default=timezone.now, verbose_name="Hora de ingreso")
+    registrado_por = models.ForeignKey(
+        'usuario.Usuario', on_delete=models.SET_NULL, null=True, blank=True, related_name='asistencias_registradas'
+    )
+    estacion = models.CharField(max_length=50, blank=True, verbose_name="Estación")
+
+    class Meta:
+        verbose_name = "Asistencia"
+        verbose_name_plural = "Asistencias"
+        constraints = [
+            models.UniqueConstraint(fields=['reunion', 'usuario'], name='asistencia_unica_por_reunion'),
+        ]
+        indexes = [
+            # Curva de llegadas y exportes de una reunión, ordenados por hora.
+            models.Index(fields=['reunion', 'checked_in_at']),
+            # Historial de asistencias de un usuario.
+            models.Index(fields=['usuario', 'checked_in_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario_id} en {self.reunion_id} ({self.checked_in_at:%d-%m-%Y %H:%M})"
+
 class Encuesta(models.Model):
     reunion = models.OneToOneField(Reunion, on_delete=models.CASCADE, related_name="encuesta")
     titulo = models.CharField(max_length=200, default="Encuesta de Satisfacción")
@@ -77,4 +120,153 @@ class TicketRespuesta(models.Model):
         ordering = ['fecha_creacion']
 
     def __str__(self):
-        return f"Respuesta de {self.usuario.nombre} en ticket #{self.ticket.id}"
\ No newline at end of file
+        return f"Respuesta de {self.usuario.nombre} en ticket #{self.ticket.id}"
+
+class CorreoSaliente(models.Model):
+    """
+    Bandeja de salida. Las vistas solo encolan; el comando `enviar_correos`
+    los despacha por lotes reutilizando una conexión SMTP y reintenta los
+    fallidos con espera exponencial.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('enviado', 'Enviado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    remitente = models.CharField(max_length=255)
+    destinatario = models.EmailField()
+    # El QR se dibuja al enviar (es determinista), así la fila no guarda la imagen.
+    adjuntar_qr_de = models.ForeignKey('usuario.Usuario', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Correo saliente"
+        verbose_name_plural = "Correos salientes"
+        indexes = [models.Index(fields=['estado', 'proximo_intento'])]
+
+    def __str__(self):
+        return f"{self.asunto} → {self.destinatario} ({self.get_estado_display()})"
+
+
+# --- Contador de tickets abiertos (ver paneladm/cache.py) ---
+
+@receiver(post_init, sender=SoporteTicket)
+def recordar_estado_ticket(sender, instance, **kwargs):
+    # Estado tal como se leyó de la base de datos, para calcular la diferencia al guardar.
+    # Se lee de __dict__ para no cargar el campo si viene diferido.
+    instance._estado_guardado = instance.__dict__.get('estado')
+
+@receiver(post_save, sender=SoporteTicket)
+def contar_ticket_guardado(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'estado' not in update_fields:
+        return
+    antes = None if created else instance._estado_guardado
+    delta = (instance.estado == 'abierto') - (antes == 'abierto')
+    instance._estado_guardado = instance.estado
+    transaction.on_commit(lambda: ajustar_tickets_abiertos(delta))
+
+@receiver(post_delete, sender=SoporteTicket)
+def contar_ticket_eliminado(sender, instance, **kwargs):
+    if instance._estado_guardado == 'abierto':
+        transaction.on_commit(lambda: ajustar_tickets_abiertos(-1))
+
+
+# --- Caché de las páginas públicas (ver usuario/cache.py) ---
+
+@receiver(post_save, sender=Reunion)
+@receiver(post_delete, sender=Reunion)
+def invalidar_paginas_publicas_reunion(sender, instance, **kwargs):
+    transaction.on_commit(invalidar_paginas_publicas)
+
+@receiver(post_init, sender=RespuestaEncuesta)
+def recordar_destacado_respuesta(sender, instance, **kwargs):
+    instance._destacado_guardado = instance.__dict__.get('destacado')
+
+@receiver(post_save, sender=RespuestaEncuesta)
+@receiver(post_delete, sender=RespuestaEncuesta)
+def invalidar_paginas_publicas_respuesta(sender, instance, **kwargs):
+    # Solo los testimonios destacados aparecen en la portada.
+    if instance.destacado or instance._destacado_guardado:
+        transaction.on_commit(invalidar_paginas_publicas)
+    instance._destacado_guardado = instance.destacado
+
+
+# --- Padrón de las estaciones de escaneo (ver paneladm/roster.py) ---
+
+@receiver(post_save, sender=Asistencia)
+@receiver(post_delete, sender=Asistencia)
+def registrar_cambio_asistencia(sender, instance, created=True, **kwargs):
+    if created:
+        transaction.on_commit(lambda: registrar_cambio(instance.reunion_id, [instance.usuario_id]))
+
+# --- Eventos en vivo para los paneles (ver paneladm/eventos.py) ---
+
+@receiver(post_save, sender=Asistencia)
+def publicar_ingreso(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: publicar_ingresos(instance.reunion_id, [instance.usuario_id]))
+
+@receiver(post_delete, sender=Asistencia)
+def publicar_salida(sender, instance, **kwargs):
+    transaction.on_commit(lambda: publicar_salidas(instance.reunion_id, [instance.usuario_id]))
+
+@receiver(m2m_changed, sender=Reunion.interesados.through)
+def registrar_cambio_interesados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # Tras el clear ya no se sabe quiénes estaban.
+        relacionados = instance.reuniones_interesado if reverse else instance.interesados
+        pk_set = set(relacionados.values_list('id', flat=True))
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if reverse:
+        for reunion_id in pk_set:
+            transaction.on_commit(lambda reunion_id=reunion_id: registrar_cambio(reunion_id, [instance.pk]))
+    elif pk_set:
+        transaction.on_commit(lambda: registrar_cambio(instance.pk, pk_set))
+
+@receiver(post_save, sender='usuario.Usuario')
+def registrar_cambio_usuario(sender, instance, created, **kwargs):
+    # Nombre, rubro o foto pueden haber cambiado: se avisa a los padrones de las reuniones vigentes.
+    if created:
+        return
+    def registrar():
+        desde = timezone.now() - timedelta(days=1)
+        reuniones = set(Reunion.objects.filter(fecha__gte=desde, interesados=instance).values_list('id', flat=True))
+        reuniones |= set(Asistencia.objects.filter(usuario=instance, reunion__fecha__gte=desde).values_list('reunion_id', flat=True))
+        for reunion_id in reuniones:
+            registrar_cambio(reunion_id, [instance.pk])
+    transaction.on_commit(registrar)
+
+# --- Contadores de asistentes e interesados (ver paneladm/contadores.py) ---
+
+@receiver(m2m_changed, sender=Reunion.interesados.through)
+def contar_interesados(sender, instance, action, reverse, pk_set, **kwargs):
+    # Con reverse=True `instance` es un usuario y `pk_set` son reuniones.
+    if action == 'post_add' and pk_set:
+        # add() informa solo los que no estaban.
+        if reverse:
+            ajustar('num_interesados', pk_set, 1)
+        else:
+            ajustar('num_interesados', [instance.pk], len(pk_set))
+    elif action in ('pre_remove', 'pre_clear'):
+        # remove() informa lo pedido, no lo que existía: se mira antes de borrar.
+        filas = sender.objects.filter(**{'usuario_id' if reverse else 'reunion_id': instance.pk})
+        if action == 'pre_remove':
+            filas = filas.filter(**{'reunion_id__in' if reverse else 'usuario_id__in': pk_set})
+        instance._reuniones_sin_interes = list(filas.values_list('reunion_id', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        descontar('num_interesados', instance.__dict__.pop('_reuniones_sin_interes', []))
+
+@receiver(pre_delete, sender='usuario.Usuario')
+def descontar_usuario_eliminado(sender, instance, **kwargs):
+    # El borrado en cascada de sus asistencias e intereses no pasa por los servicios ni por m2m_changed.
+    descontar('num_asistentes', Asistencia.objects.filter(usuario=instance).values_list('reunion_id', flat=True))
+    descontar('num_interesados', Reunion.interesados.through.objects.filter(usuario=instance).values_list('reunion_id', flat=True))
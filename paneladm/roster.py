@@ -0,0 +1,122 @@
+"""
+Padrón (roster) de una reunión para las estaciones de escaneo.
+
+El padrón son los interesados y asistentes de la reunión, en un formato
+compacto (listas en el orden de CAMPOS). Las estaciones lo descargan una vez y
+luego piden solo los cambios con `?since=<version>`, así reconocen un QR y
+muestran el nombre sin esperar al servidor; al servidor solo va la escritura.
+
+La versión vive en la caché como "<época>.<n>". Cada cambio incrementa `n` y
+guarda qué usuarios cambiaron en esa versión. Si la caché pierde el contador
+se empieza una época nueva, y un `since` de otra época, demasiado antiguo o
+con cambios ya expirados recibe el padrón completo.
+"""
+import uuid
+
+from django.core.cache import cache
+
+CAMPOS = ['id', 'nombre', 'rubro', 'foto', 'asistio']
+MAX_CAMBIOS_DELTA = 500
+TIEMPO_ROSTER = 24 * 60 * 60  # segundos que se guardan los cambios y los padrones completos
+
+
+def _clave_epoca(reunion_id):
+    return f'roster:{reunion_id}:epoca'
+
+
+def _clave_contador(reunion_id, epoca):
+    return f'roster:{reunion_id}:{epoca}:n'
+
+
+def _clave_cambio(reunion_id, epoca, n):
+    return f'roster:{reunion_id}:{epoca}:cambio:{n}'
+
+
+def _estado(reunion_id):
+    """Devuelve (época, n) actuales, empezando una época nueva si la caché los perdió."""
+    epoca = cache.get(_clave_epoca(reunion_id))
+    if epoca is not None:
+        n = cache.get(_clave_contador(reunion_id, epoca))
+        if n is not None:
+            return epoca, n
+    epoca = uuid.uuid4().hex[:8]
+    cache.set(_clave_contador(reunion_id, epoca), 0, None)
+    cache.set(_clave_epoca(reunion_id), epoca, None)
+    return epoca, 0
+
+
+def version_roster(reunion_id):
+    epoca, n = _estado(reunion_id)
+    return f'{epoca}.{n}'
+
+
+def registrar_cambio(reunion_id, usuario_ids):
+    """Anota que cambiaron las filas de `usuario_ids` en el padrón de la reunión."""
+    epoca, _ = _estado(reunion_id)
+    try:
+        n = cache.incr(_clave_contador(reunion_id, epoca))
+    except ValueError:
+        # El contador expiró entre las dos lecturas: la próxima consulta abre otra época.
+        cache.delete(_clave_epoca(reunion_id))
+        return
+    cache.set(_clave_cambio(reunion_id, epoca, n), list(usuario_ids), TIEMPO_ROSTER)
+
+
+def _filas(reunion_id, usuario_ids=None):
+    from usuario.miniaturas import url_miniatura
+    from usuario.models import Usuario
+    from .models import Asistencia, Reunion
+
+    interesados = Reunion.interesados.through.objects.filter(reunion_id=reunion_id)
+    asistencias = Asistencia.objects.filter(reunion_id=reunion_id)
+    if usuario_ids is not None:
+        interesados = interesados.filter(usuario_id__in=usuario_ids)
+        asistencias = asistencias.filter(usuario_id__in=usuario_ids)
+    asistieron = set(asistencias.values_list('usuario_id', flat=True))
+    ids = asistieron | set(interesados.values_list('usuario_id', flat=True))
+
+    usuarios = Usuario.objects.filter(id__in=ids).only('id', 'nombre', 'apellido', 'rubro', 'rubro_otro', 'foto')
+    return [
+        [u.id, f'{u.nombre} {u.apellido}', u.get_rubro_real_display, url_miniatura(u.id, u.foto.name) if u.foto else None, u.id in asistieron]
+        for u in usuarios
+    ]
+
+
+def _cambios_desde(reunion_id, since):
+    """Usuarios que cambiaron después de `since`, o None si hay que mandar el padrón completo."""
+    epoca, n = _estado(reunion_id)
+    try:
+        epoca_cliente, n_cliente = since.split('.')
+        n_cliente = int(n_cliente)
+    except (AttributeError, ValueError):
+        return None
+    if epoca_cliente != epoca or n_cliente > n or n - n_cliente > MAX_CAMBIOS_DELTA:
+        return None
+    claves = [_clave_cambio(reunion_id, epoca, i) for i in range(n_cliente + 1, n + 1)]
+    cambios = cache.get_many(claves)
+    if len(cambios) != len(claves):
+        return None
+    return {uid for ids in cambios.values() for uid in ids}
+
+
+def construir_roster(reunion_id, since=None):
+    version = version_roster(reunion_id)
+    cambiados = _cambios_desde(reunion_id, since) if since else None
+
+    if cambiados is None:
+        clave = f'roster:{reunion_id}:completo:{version}'
+        payload = cache.get(clave)
+        if payload is None:
+            payload = {'version': version, 'completo': True, 'campos': CAMPOS, 'usuarios': _filas(reunion_id), 'eliminados': []}
+            cache.set(clave, payload, TIEMPO_ROSTER)
+        return payload
+
+    filas = _filas(reunion_id, cambiados) if cambiados else []
+    presentes = {fila[0] for fila in filas}
+    return {
+        'version': version,
+        'completo': False,
+        'campos': CAMPOS,
+        'usuarios': filas,
+        'eliminados': sorted(cambiados - presentes),
+    }
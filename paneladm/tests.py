@@ -1,3 +1,728 @@
-from django.test import TestCase
+import asyncio
+import socket
+import tempfile
+import time
+import unittest
+from unittest import mock
+from datetime import timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+from usuario import miniaturas
+from usuario.models import Usuario
+from usuario.qr import firmar_token
+from . import correos, eventos, views
+from .cache import clave_conteo_usuarios, tickets_abiertos
+from .correos import MAX_INTENTOS, encolar_correo, enviar_pendientes
+from .asistencia import (
+    contadores_desviados, curva_llegadas, marcar_asistencia, quitar_asistencias, reconciliar_contadores,
+    sincronizar_asistencias,
+)
+from .contadores import reuniones_desviadas
+from .models import Asistencia, CorreoSaliente, Reunion, SoporteTicket
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TicketsAbiertosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ayudante = Usuario.objects.create(
+            nombre='Aldo', apellido='Ayudante', rut='333333333', email='aldo@example.com',
+            password='secreto123', es_ayudante=True,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def crear_ticket(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return SoporteTicket.objects.create(usuario=self.ayudante, asunto='Ayuda', mensaje='...', **kwargs)
+
+    def test_el_contador_sigue_los_cambios_de_estado(self):
+        self.assertEqual(tickets_abiertos(), 0)
+        ticket = self.crear_ticket()
+        self.crear_ticket(estado='cerrado')
+        self.assertEqual(tickets_abiertos(), 1)
+
+        ticket = SoporteTicket.objects.get(pk=ticket.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.estado = 'en_progreso'
+            ticket.save()
+        self.assertEqual(tickets_abiertos(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.estado = 'abierto'
+            ticket.save()
+        self.assertEqual(tickets_abiertos(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SoporteTicket.objects.get(pk=ticket.pk).delete()
+        self.assertEqual(tickets_abiertos(), 0)
+
+    def test_el_badge_se_muestra_sin_contar_tickets(self):
+        self.crear_ticket()
+        tickets_abiertos()
+        session = self.client.session
+        session['usuario_id'] = self.ayudante.id
+        session.save()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('panel-admin:gestion_soporte'))
+        self.assertEqual(response.context['tickets_abiertos_count'], 1)
+        consultas_count = [
+            q for q in ctx.captured_queries
+            if 'COUNT(' in q['sql'] and SoporteTicket._meta.db_table in q['sql']
+        ]
+        self.assertEqual(consultas_count, [])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BandejaSalidaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create(
+            nombre='Iris', apellido='Inscrita', rut='111111111', email='iris@example.com', password='x',
+        )
+        cls.reunion = Reunion.objects.create(
+            detalle='Networking', descripcion='...', fecha=timezone.now() + timedelta(days=3), ubicacion='Sala 1',
+        )
+
+    def test_la_inscripcion_solo_encola_el_correo(self):
+        response = self.client.post(
+            reverse('panel-admin:inscribirse_reunion', args=[self.reunion.id]),
+            {'paso': 'verificar_rut', 'rut': '11.111.111-1'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        correo = CorreoSaliente.objects.get()
+        self.assertEqual(correo.destinatario, 'iris@example.com')
+        self.assertEqual(correo.adjuntar_qr_de, self.usuario)
+
+    def test_el_worker_envia_con_el_qr_adjunto(self):
+        encolar_correo('Hola', 'Cuerpo', 'iris@example.com', adjuntar_qr_de=self.usuario)
+        call_command('enviar_correos', una_vez=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        nombre, contenido, tipo = mail.outbox[0].attachments[0]
+        self.assertEqual(tipo, 'image/png')
+        self.assertEqual(CorreoSaliente.objects.get().estado, 'enviado')
+
+    def test_el_envio_ocurre_fuera_de_la_transaccion_con_el_lote_reservado(self):
+        encolar_correo('Hola', 'Cuerpo', 'iris@example.com')
+        bloques = len(connection.atomic_blocks)  # los del propio TestCase
+        durante = []
+        original = correos.construir_mensaje
+
+        def construir(correo, conexion):
+            # Mientras se envía no hay transacción abierta y otro worker no toma el correo.
+            durante.append((len(connection.atomic_blocks), enviar_pendientes()))
+            return original(correo, conexion)
+
+        with mock.patch.object(correos, 'construir_mensaje', construir):
+            self.assertEqual(enviar_pendientes(), (1, 0))
+        self.assertEqual(durante, [(bloques, (0, 0))])
+        self.assertEqual(CorreoSaliente.objects.get().estado, 'enviado')
+
+    def test_enviar_credenciales_encola_el_qr_nuevo_una_sola_vez(self):
+        Usuario.objects.create(nombre='Sin', apellido='Correo', rut='222222222', email='', password='x')
+        call_command('enviar_credenciales', stdout=StringIO())
+        call_command('enviar_credenciales', stdout=StringIO())
+        correo = CorreoSaliente.objects.get()
+        self.assertEqual((correo.destinatario, correo.adjuntar_qr_de), ('iris@example.com', self.usuario))
+
+    @override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+        EMAIL_HOST='127.0.0.1', EMAIL_PORT=puerto_libre(), EMAIL_USE_TLS=False, EMAIL_TIMEOUT=1,
+    )
+    def test_los_fallos_se_reintentan_con_espera_creciente(self):
+        correo = encolar_correo('Hola', 'Cuerpo', 'iris@example.com')
+        esperas = []
+        for _ in range(MAX_INTENTOS):
+            CorreoSaliente.objects.filter(pk=correo.pk).update(proximo_intento=timezone.now())
+            antes = timezone.now()
+            self.assertEqual(enviar_pendientes(), (0, 1))
+            correo.refresh_from_db()
+            esperas.append(correo.proximo_intento - antes)
+        self.assertEqual(correo.estado, 'fallido')
+        self.assertEqual(correo.intentos, MAX_INTENTOS)
+        self.assertLess(esperas[0], esperas[1])
+
+
+@unittest.skipUnless(Controller, "aiosmtpd no está instalado")
+class BandejaSalidaSMTPTests(TestCase):
+    """Envía contra un servidor SMTP local (aiosmtpd) para comprobar que el lote usa una sola conexión."""
+
+    class Receptor:
+        def __init__(self):
+            self.sesiones = set()
+            self.destinatarios = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.sesiones.add(id(session))
+            self.destinatarios.extend(envelope.rcpt_tos)
+            return '250 OK'
+
+    def test_un_lote_reutiliza_la_conexion(self):
+        receptor = self.Receptor()
+        controlador = Controller(receptor, hostname='127.0.0.1', port=puerto_libre())
+        controlador.start()
+        self.addCleanup(controlador.stop)
+
+        for i in range(3):
+            encolar_correo('Hola', 'Cuerpo', f'persona{i}@example.com')
+        with self.settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST=controlador.hostname, EMAIL_PORT=controlador.port, EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+        ):
+            self.assertEqual(enviar_pendientes(), (3, 0))
+        self.assertEqual(len(receptor.sesiones), 1)
+        self.assertEqual(len(receptor.destinatarios), 3)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CheckinTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ayudante = Usuario.objects.create(
+            nombre='Aldo', apellido='Ayudante', rut='333333333', email='aldo@example.com',
+            password='secreto123', es_ayudante=True,
+        )
+        cls.asistente = Usuario.objects.create(
+            nombre='Iris', apellido='Inscrita', rut='111111111', email='iris@example.com', password='x',
+        )
+        cls.reunion = Reunion.objects.create(
+            detalle='Networking', descripcion='...', fecha=timezone.now(), ubicacion='Sala 1',
+        )
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['usuario_id'] = self.ayudante.id
+        session.save()
+        self.url = reverse('panel-admin:marcar_asistencia_qr', args=[self.reunion.id, firmar_token(self.asistente.id)])
+
+    def escanear(self, **headers):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, headers=headers)
+
+    def test_un_escaneo_repetido_no_cuenta_dos_veces(self):
+        self.assertEqual(self.escanear().status_code, 200)
+        self.assertEqual(self.escanear().status_code, 409)
+        self.asistente.refresh_from_db()
+        self.assertEqual(self.asistente.cantidad_asistencias, 1)
+        self.assertEqual(self.reunion.asistentes.count(), 1)
+
+    def test_la_asistencia_guarda_quien_y_donde(self):
+        self.escanear(**{'X-Estacion': 'Entrada norte'})
+        asistencia = Asistencia.objects.get()
+        self.assertEqual(asistencia.registrado_por, self.ayudante)
+        self.assertEqual(asistencia.estacion, 'Entrada norte')
+        self.assertEqual(curva_llegadas(self.reunion.id)[1], [1])
+
+    def test_quitar_asistencia_descuenta_el_contador(self):
+        self.escanear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('panel-admin:quitar_asistencia', args=[self.reunion.id, self.asistente.id]))
+        self.asistente.refresh_from_db()
+        self.assertEqual(self.asistente.cantidad_asistencias, 0)
+        self.assertFalse(Asistencia.objects.exists())
+
+    def test_un_reintento_con_la_misma_clave_repite_la_respuesta(self):
+        primera = self.escanear(**{'Idempotency-Key': 'abc'})
+        reintento = self.escanear(**{'Idempotency-Key': 'abc'})
+        self.assertEqual(reintento.status_code, 200)
+        self.assertEqual(reintento.json(), primera.json())
+        self.asistente.refresh_from_db()
+        self.assertEqual(self.asistente.cantidad_asistencias, 1)
+
+    def test_usuario_inexistente(self):
+        url = reverse('panel-admin:marcar_asistencia_qr', args=[self.reunion.id, firmar_token(99999)])
+        self.assertEqual(self.client.post(url).status_code, 404)
+
+    def test_un_codigo_falso_se_rechaza_sin_consultar_la_reunion(self):
+        # Sin QR_LEGADO_HASTA, un id numérico sin firma también se rechaza.
+        falso = firmar_token(self.asistente.id + 1)[:17] + firmar_token(self.asistente.id)[17:]
+        for codigo in [falso, str(self.asistente.id)]:
+            url = reverse('panel-admin:marcar_asistencia_qr', args=[self.reunion.id, codigo])
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.post(url).status_code, 400)
+            self.assertFalse([q for q in ctx.captured_queries if 'paneladm_' in q['sql']])
+        self.assertFalse(Asistencia.objects.exists())
+
+    def test_un_qr_antiguo_vencido_se_rechaza_con_un_mensaje_claro(self):
+        url = reverse('panel-admin:marcar_asistencia_qr', args=[self.reunion.id, str(self.asistente.id)])
+        with override_settings(QR_LEGADO_HASTA=timezone.localdate() - timedelta(days=1)):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('QR es antiguo', response.json()['message'])
+        with override_settings(QR_LEGADO_HASTA=timezone.localdate()):
+            self.assertEqual(self.client.post(url).status_code, 200)
+
+    def test_sincronizar_lote_sin_conexion(self):
+        otro = Usuario.objects.create(nombre='Otto', apellido='Otro', rut='222222222', email='otto@example.com', password='x')
+        self.escanear()  # ya registrado en línea antes de caer la red
+        registros = [
+            {'clave': 'a', 'codigo': firmar_token(otro.id), 'scanned_at': '2025-01-01T10:00:00Z', 'estacion': 'Norte'},
+            {'clave': 'b', 'codigo': firmar_token(otro.id), 'scanned_at': '2025-01-01T10:05:00Z', 'estacion': 'Norte'},
+            {'clave': 'c', 'codigo': firmar_token(self.asistente.id), 'scanned_at': '2025-01-01T10:01:00Z'},
+            {'clave': 'd', 'codigo': firmar_token(99999)},
+            {'clave': 'e', 'codigo': '1' + 'A' * 16 + '1'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('panel-admin:sincronizar_asistencia', args=[self.reunion.id]),
+                data={'registros': registros}, content_type='application/json',
+            )
+        estados = {r['clave']: r['estado'] for r in response.json()['resultados']}
+        self.assertEqual(estados, {'a': 'registrado', 'b': 'duplicado', 'c': 'ya_registrado', 'd': 'no_existe', 'e': 'invalido'})
+        otro.refresh_from_db()
+        self.assertEqual(otro.cantidad_asistencias, 1)
+        asistencia = Asistencia.objects.get(usuario=otro)
+        self.assertEqual((asistencia.checked_in_at.minute, asistencia.estacion), (0, 'Norte'))
+        self.asistente.refresh_from_db()
+        self.assertEqual(self.asistente.cantidad_asistencias, 1)
+
+    def test_lote_reenviado_no_cuenta_dos_veces(self):
+        # El tótem reenvía el lote si no alcanzó a recibir la respuesta.
+        registros = [{'clave': 'a', 'codigo': firmar_token(self.asistente.id), 'scanned_at': '2025-01-01T10:00:00Z', 'estacion': 'Norte'}]
+        url = reverse('panel-admin:sincronizar_asistencia', args=[self.reunion.id])
+        estados = []
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, data={'registros': registros}, content_type='application/json')
+            estados.append(response.json()['resultados'][0]['estado'])
+        self.assertEqual(estados, ['registrado', 'ya_registrado'])
+        self.asistente.refresh_from_db()
+        self.reunion.refresh_from_db()
+        self.assertEqual((self.asistente.cantidad_asistencias, self.reunion.num_asistentes), (1, 1))
+
+
+class CheckinConcurrenteTests(TransactionTestCase):
+    """
+    Varias estaciones escanean a las mismas personas a la vez contra un
+    servidor con hilos. Necesita una base que acepte varias conexiones
+    (MySQL, o SQLite en disco con TEST NAME), por eso se omite con SQLite en memoria.
+    """
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Los hilos del servidor no comparten una base SQLite en memoria.')
+
+    def test_nadie_queda_contado_dos_veces(self):
+        salida = StringIO()
+        call_command('carga_checkin', estaciones=6, asistentes=40, repeticiones=3, stdout=salida)
+        self.assertIn('contados dos veces: 0', salida.getvalue())
+        self.assertIn('p99', salida.getvalue())
+        self.assertFalse(Usuario.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RosterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.totem = Usuario.objects.create(
+            nombre='Tito', apellido='Totem', rut='333333333', email='totem@example.com', password='x', es_totem=True,
+        )
+        cls.interesado = Usuario.objects.create(
+            nombre='Iris', apellido='Inscrita', rut='111111111', email='iris@example.com', password='x',
+        )
+        cls.reunion = Reunion.objects.create(
+            detalle='Networking', descripcion='...', fecha=timezone.now(), ubicacion='Sala 1',
+        )
+        cls.reunion.interesados.add(cls.interesado)
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['usuario_id'] = self.totem.id
+        session.save()
+        self.url = reverse('panel-admin:roster_reunion', args=[self.reunion.id])
+
+    def test_padron_completo_con_etag(self):
+        response = self.client.get(self.url)
+        data = response.json()
+        self.assertTrue(data['completo'])
+        self.assertEqual(data['usuarios'], [[self.interesado.id, 'Iris Inscrita', self.interesado.get_rubro_real_display, None, False]])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_delta_desde_una_version(self):
+        version = self.client.get(self.url).json()['version']
+        nuevo = Usuario.objects.create(nombre='Nora', apellido='Nueva', rut='222222222', email='nora@example.com', password='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reunion.interesados.add(nuevo)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reunion.interesados.remove(self.interesado)
+
+        data = self.client.get(self.url, {'since': version}).json()
+        self.assertFalse(data['completo'])
+        self.assertEqual([fila[0] for fila in data['usuarios']], [nuevo.id])
+        self.assertEqual(data['eliminados'], [self.interesado.id])
+
+        # Una versión desconocida (p. ej. tras vaciar la caché) recibe el padrón completo.
+        self.assertTrue(self.client.get(self.url, {'since': 'otra.3'}).json()['completo'])
+
+    def test_la_foto_va_como_miniatura(self):
+        original = BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(original, 'JPEG')
+        self.interesado.foto.save('iris.jpg', ContentFile(original.getvalue()))
+
+        url_foto = self.client.get(self.url).json()['usuarios'][0][3]
+        self.assertTrue(url_foto.startswith(reverse('miniatura_foto', args=[self.interesado.id]) + '?v='))
+        response = self.client.get(url_foto)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(Image.open(BytesIO(response.content)).size, (miniaturas.LADO, miniaturas.LADO))
+        self.assertLess(len(response.content), len(original.getvalue()))
+
+
+class BuscarUsuariosReunionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ayudante = Usuario.objects.create(
+            nombre='Aldo', apellido='Ayudante', rut='333333333', email='aldo@example.com',
+            password='secreto123', es_ayudante=True,
+        )
+        cls.jose = Usuario.objects.create(
+            nombre='José', apellido='Núñez', rut='12.345.678-5', email='jose@example.com', password='x',
+        )
+        cls.josefa = Usuario.objects.create(
+            nombre='Josefa', apellido='Pérez', rut='98765432-1', email='josefa@example.com', password='x',
+        )
+        cls.reunion = Reunion.objects.create(
+            detalle='Networking', descripcion='...', fecha=timezone.now(), ubicacion='Sala 1',
+        )
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['usuario_id'] = self.ayudante.id
+        session.save()
+        self.url = reverse('panel-admin:buscar_usuarios_reunion', args=[self.reunion.id])
+
+    def ids(self, **params):
+        return [r['id'] for r in self.client.get(self.url, params).json()['results']]
+
+    def test_prefijo_sin_tildes_ni_mayusculas(self):
+        self.assertEqual(self.ids(q='JOSE'), [self.jose.id, self.josefa.id])
+        self.assertEqual(self.ids(q='jose n'), [self.jose.id])
+        self.assertEqual(self.ids(q='nun'), [self.jose.id])
+        self.assertEqual(self.ids(q='12.345'), [self.jose.id])
+        self.assertEqual(self.ids(q='osé'), [])
+
+    def test_excluye_asistentes_y_pagina(self):
+        Asistencia.objects.create(reunion=self.reunion, usuario=self.jose)
+        self.assertEqual(self.ids(q='jose'), [self.josefa.id])
+        with mock.patch.object(views, 'RESULTADOS_POR_PAGINA', 1):
+            data = self.client.get(self.url, {'page': 1}).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertTrue(data['pagination']['more'])
+
+
+@mock.patch('paneladm.usuarios.POR_PAGINA', 2)
+class BuscarUsuariosPanelTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create(
+            nombre='Zoe', apellido='Admin', rut='333333334', email='zoe@example.com', password='x', es_admin=True,
+        )
+        cls.anas = [
+            Usuario.objects.create(
+                nombre='Ana', apellido=f'Ñuñoa{i}', rut=f'2222222{i:02d}', email=f'ana{i}@example.com', password='x',
+                rubro='educacion',
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['usuario_id'] = self.admin.id
+        session.save()
+        self.url = reverse('panel-admin:buscar_usuarios_ajax')
+        self.client.get(self.url)  # sesión en caché
+
+    def recorrer(self, **params):
+        ids, data = [], {'siguiente': None}
+        while True:
+            if data['siguiente']:
+                params['cursor'] = data['siguiente']
+            data = self.client.get(self.url, params).json()
+            ids += [u['id'] for u in data['usuarios']]
+            if not data['siguiente']:
+                return ids, data['total']
+
+    def test_cada_tecla_es_una_consulta_sin_count(self):
+        for termino in ('a', 'an', 'ana', 'ana n'):
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(self.url, {'q': termino}).json()
+            consultas = [q['sql'] for q in ctx.captured_queries if 'django_session' not in q['sql']]
+            self.assertEqual(len(consultas), 1, consultas)
+            self.assertNotIn('COUNT(', consultas[0])
+            self.assertEqual(len(data['usuarios']), 2)
+
+    def test_cursor_recorre_todo_y_los_totales_se_reutilizan(self):
+        ids, total = self.recorrer(q='ANA')
+        self.assertEqual(ids, [u.id for u in self.anas])
+        # Solo está el total sin término (lo guardó la primera carga): es una cota.
+        self.assertEqual(total, {'total': 6, 'cota': True})
+
+        # Si la primera página trae todo, el total exacto queda en caché.
+        data = self.client.get(self.url, {'q': 'ana nunoa3'}).json()
+        self.assertEqual(data['total'], {'total': 1, 'cota': False})
+        self.assertEqual(data['usuarios'][0]['rubro'], 'Educación y Formación')
+        self.assertEqual(cache.get(clave_conteo_usuarios('Ana Nunoa3 ', '')), 1)
+
+        # Sin término, el total de la lista se cuenta una vez y queda guardado;
+        # después sirve de cota para los términos de ese rubro.
+        self.assertEqual(self.recorrer(rubro='educacion'), ([u.id for u in self.anas], {'total': 5, 'cota': False}))
+        with self.assertNumQueries(2):  # sesión + la página
+            data = self.client.get(self.url, {'q': 'an', 'rubro': 'educacion'}).json()
+        self.assertEqual(data['total'], {'total': 5, 'cota': True})
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'WyJ4Il0'}).status_code, 400)
+
+    def test_todas_las_busquedas_del_panel_incluyen_el_email(self):
+        reunion = Reunion.objects.create(detalle='R', descripcion='...', fecha=timezone.now(), ubicacion='Sala')
+        Asistencia.objects.create(reunion=reunion, usuario=self.anas[2])
+
+        def filas_excel(response):
+            return openpyxl.load_workbook(BytesIO(response.content)).active.max_row - 1  # sin el encabezado
+
+        self.assertEqual([u['id'] for u in self.client.get(self.url, {'q': 'ana1@'}).json()['usuarios']], [self.anas[1].id])
+        self.assertEqual(filas_excel(self.client.get(reverse('panel-admin:exportar_usuarios_excel'), {'q': 'ana3@'})), 1)
+        respuesta = self.client.get(reverse('panel-admin:ver_asistentes_reunion', args=[reunion.id]), {'q': 'ana2@'})
+        self.assertEqual([u.id for u in respuesta.context['asistentes']], [self.anas[2].id])
+        self.assertEqual(filas_excel(self.client.get(
+            reverse('panel-admin:exportar_asistentes_reunion_excel', args=[reunion.id]), {'q': 'ana2@'},
+        )), 1)
+        data = self.client.get(reverse('panel-admin:buscar_usuarios_reunion', args=[reunion.id]), {'q': 'ana4@'}).json()
+        self.assertEqual([u['id'] for u in data['results']], [self.anas[4].id])
+
+
+class EventosTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ayudante = Usuario.objects.create(
+            nombre='Aldo', apellido='Ayudante', rut='333333333', email='aldo@example.com',
+            password='secreto123', es_ayudante=True,
+        )
+        cls.reunion = Reunion.objects.create(
+            detalle='Networking', descripcion='...', fecha=timezone.now(), ubicacion='Sala 1',
+        )
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['usuario_id'] = self.ayudante.id
+        session.save()
+        self.async_client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    async def test_un_cliente_lento_se_desconecta_sin_acumular(self):
+        broker = eventos.BrokerLocal()
+        suscripcion = broker.suscribir(1)
+        for n in range(eventos.MAX_EVENTOS_PENDIENTES + 1):
+            broker.publicar(1, {'tipo': 'ingreso', 'n': n})
+        await asyncio.sleep(0)
+        self.assertIsNone(await suscripcion.siguiente())
+        self.assertEqual(broker.conectados(1), 0)
+
+    def test_broker_cache_espera_un_evento_aun_no_escrito(self):
+        broker = eventos.BrokerCache()
+        repartidos = []
+        broker._repartir = lambda reunion_id, evento: repartidos.append(evento['n'])
+        broker._vistos[1] = 0
+
+        def revisar():
+            broker._revisar(1, broker._vistos[1])
+
+        # El publicador ya incrementó el contador pero no alcanzó a escribir el evento 1.
+        cache.set(broker._clave_contador(1), 1, None)
+        revisar()
+        self.assertEqual((repartidos, broker._vistos[1]), ([], 0))
+        cache.set(broker._clave_evento(1, 1), {'n': 1})
+        revisar()
+        self.assertEqual((repartidos, broker._vistos[1]), ([1], 1))
+
+        # Un evento que no llega nunca se deja pasar tras la gracia, sin perder los siguientes.
+        cache.set(broker._clave_contador(1), 3, None)
+        cache.set(broker._clave_evento(1, 3), {'n': 3})
+        revisar()
+        self.assertEqual(repartidos, [1])
+        with mock.patch.object(eventos.time, 'monotonic', return_value=time.monotonic() + broker.GRACIA + 1):
+            revisar()
+        self.assertEqual((repartidos, broker._vistos[1], broker._faltantes), ([1, 3], 3, {}))
+
+    async def test_broker_cache_sabe_si_otro_worker_tiene_clientes(self):
+        este_worker, otro_worker = eventos.BrokerCache(), eventos.BrokerCache()
+        self.assertFalse(otro_worker.escuchando(1))
+        suscripcion = este_worker.suscribir(1)
+        self.assertTrue(otro_worker.escuchando(1))
+        self.assertFalse(otro_worker.escuchando(2))
+        este_worker.desuscribir(suscripcion)
+
+    def test_sin_clientes_un_ingreso_no_consulta_la_base(self):
+        with mock.patch.object(eventos, '_broker', eventos.BrokerCache()), self.assertNumQueries(0):
+            eventos.publicar_ingresos(self.reunion.id, [self.ayudante.id])
+
+    async def test_el_stream_recibe_los_ingresos(self):
+        url = reverse('panel-admin:eventos_reunion', args=[self.reunion.id])
+        response = await self.async_client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content.__aiter__()
+        self.assertEqual(await stream.__anext__(), b'retry: 3000\n\n')
+
+        await sync_to_async(eventos.publicar_ingresos)(self.reunion.id, [self.ayudante.id])
+        mensaje = (await stream.__anext__()).decode()
+        self.assertTrue(mensaje.startswith('event: ingreso\n'))
+        self.assertIn('"nombre": "Aldo"', mensaje)
+        await stream.aclose()
+
+    def test_el_stream_requiere_asgi(self):
+        response = self.client.get(reverse('panel-admin:eventos_reunion', args=[self.reunion.id]))
+        self.assertEqual(response.status_code, 503)
+
+
+class ReconciliacionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create(
+            nombre='Ana', apellido='Admin', rut='111111111', email='ana@example.com',
+            password='secreto123', es_admin=True,
+        )
+        cls.usuarios = [
+            Usuario.objects.create(nombre=f'U{i}', apellido='Conteo', rut=f'7777777{i:02d}', email=f'c{i}@example.com', password='x')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.reuniones = [
+            Reunion.objects.create(detalle=f'R{i}', descripcion='...', fecha=timezone.now(), ubicacion='Sala')
+            for i in range(2)
+        ]
+        for reunion in self.reuniones:
+            for usuario in self.usuarios:
+                marcar_asistencia(reunion.id, usuario.id)
+
+    def contadores(self):
+        return list(Usuario.objects.filter(id__in=[u.id for u in self.usuarios]).order_by('id').values_list('cantidad_asistencias', flat=True))
+
+    def test_eliminar_reunion_descuenta_a_sus_asistentes(self):
+        session = self.client.session
+        session['usuario_id'] = self.admin.id
+        session.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('panel-admin:eliminar_reunion', args=[self.reuniones[0].id]))
+        self.assertEqual(self.contadores(), [1, 1, 1])
+        self.assertEqual(contadores_desviados(), [])
+
+    def test_reconciliar_corrige_los_contadores_desviados(self):
+        # Borrados que no pasan por el servicio, como un DELETE a mano.
+        Reunion.objects.filter(id=self.reuniones[0].id).delete()
+        Usuario.objects.filter(id=self.usuarios[0].id).update(cantidad_asistencias=9)
+
+        salida = StringIO()
+        call_command('reconciliar_asistencias', solo_reporte=True, stdout=salida)
+        self.assertIn('3 contadores a corregir', salida.getvalue())
+        self.assertEqual(self.contadores(), [9, 2, 2])
+
+        # Un SELECT agrupado y un UPDATE (más el savepoint de la transacción).
+        with self.assertNumQueries(4):
+            reconciliar_contadores()
+        self.assertEqual(self.contadores(), [1, 1, 1])
+        self.assertEqual(contadores_desviados(), [])
+
+
+class ContadoresReunionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuarios = [
+            Usuario.objects.create(nombre=f'U{i}', apellido='Cuenta', rut=f'6666666{i:02d}', email=f'r{i}@example.com', password='x')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.reunion = Reunion.objects.create(detalle='Conteo', descripcion='...', fecha=timezone.now(), ubicacion='Sala')
+
+    def contadores(self):
+        self.reunion.refresh_from_db()
+        return self.reunion.num_asistentes, self.reunion.num_interesados
+
+    def test_interes_por_ambos_lados_de_la_relacion(self):
+        a, b, c = self.usuarios
+        self.reunion.interesados.add(a, b)
+        self.reunion.interesados.add(a)  # ya estaba: no suma
+        c.reuniones_interesado.add(self.reunion)
+        self.assertEqual(self.contadores(), (0, 3))
+
+        self.reunion.interesados.remove(b)
+        self.reunion.interesados.remove(b)  # ya no estaba: no resta
+        self.assertEqual(self.contadores(), (0, 2))
+        c.reuniones_interesado.clear()
+        self.assertEqual(self.contadores(), (0, 1))
+        self.reunion.interesados.clear()
+        self.assertEqual(self.contadores(), (0, 0))
+        self.assertEqual(reuniones_desviadas(), [])
+
+    def test_asistencias_y_usuarios_eliminados(self):
+        a, b, c = self.usuarios
+        marcar_asistencia(self.reunion.id, a.id)
+        marcar_asistencia(self.reunion.id, a.id)  # repetido
+        sincronizar_asistencias(self.reunion.id, [
+            {'codigo': firmar_token(a.id)}, {'codigo': firmar_token(b.id)}, {'codigo': firmar_token(c.id)},
+        ])
+        self.reunion.interesados.add(b, c)
+        self.assertEqual(self.contadores(), (3, 2))
+
+        quitar_asistencias(Asistencia.objects.filter(reunion=self.reunion, usuario=a))
+        self.assertEqual(self.contadores(), (2, 2))
+        Usuario.objects.filter(id=c.id).delete()
+        self.assertEqual(self.contadores(), (1, 1))
+        self.assertEqual(reuniones_desviadas(), [])
+
+    def test_recalcular_corrige_los_desvios(self):
+        self.reunion.interesados.add(*self.usuarios)
+        Reunion.objects.filter(id=self.reunion.id).update(num_asistentes=7, num_interesados=0)
+
+        salida = StringIO()
+        call_command('recalcular_contadores_reuniones', solo_reporte=True, stdout=salida)
+        self.assertIn('asistentes 7 -> 0, interesados 0 -> 3', salida.getvalue())
+        self.assertEqual(self.contadores(), (7, 0))
+
+        call_command('recalcular_contadores_reuniones', stdout=StringIO())
+        self.assertEqual(self.contadores(), (0, 3))
+        self.assertEqual(reuniones_desviadas(), [])
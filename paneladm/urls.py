@@ -19,12 +19,17 @@ urlpatterns = [
     path('reuniones/eliminar/<int:reunion_id>/', views.eliminar_reunion, name='eliminar_reunion'),
     path('asistencia/', views.control_asistencia, name='control_asistencia'),
     path('reuniones/<int:reunion_id>/asistencia/', views.registrar_asistencia, name='registrar_asistencia'),
+    path('reuniones/<int:reunion_id>/buscar-usuarios/', views.buscar_usuarios_reunion, name='buscar_usuarios_reunion'),
     path('asistentes/', views.gestion_asistentes, name='gestion_asistentes'),
     path('asistentes/<int:reunion_id>/', views.ver_asistentes_reunion, name='ver_asistentes_reunion'),
     path('asistentes/<int:reunion_id>/exportar-excel/', views.exportar_asistentes_reunion_excel, name='exportar_asistentes_reunion_excel'),
     path('reuniones/<int:reunion_id>/quitar-asistencia/<int:usuario_id>/', views.quitar_asistencia, name='quitar_asistencia'),
-    path('reuniones/<int:reunion_id>/marcar-asistencia/<int:usuario_id>/', views.marcar_asistencia_qr, name='marcar_asistencia_qr'),
+    path('reuniones/<int:reunion_id>/marcar-asistencia/<str:codigo>/', views.marcar_asistencia_qr, name='marcar_asistencia_qr'),
+    path('reuniones/<int:reunion_id>/sincronizar-asistencia/', views.sincronizar_asistencia, name='sincronizar_asistencia'),
+    path('reuniones/<int:reunion_id>/roster/', views.roster_reunion, name='roster_reunion'),
+    path('reuniones/<int:reunion_id>/eventos/', views.eventos_reunion, name='eventos_reunion'),
     path('interesados/', views.gestion_interesados, name='gestion_interesados'),
+    path('interesados/<int:reunion_id>/etiquetas.pdf', views.hoja_etiquetas_reunion, name='hoja_etiquetas_reunion'),
     path('encuestas/', views.gestion_encuestas, name='gestion_encuestas'),
     path('encuestas/<int:encuesta_id>/respuestas/', views.ver_respuestas_encuesta, name='ver_respuestas_encuesta'),
     path('encuestas/eliminar/<int:encuesta_id>/', views.eliminar_encuesta, name='eliminar_encuesta'),
@@ -0,0 +1,90 @@
+"""
+Búsqueda de usuarios del panel (Gestión de Usuarios), paginada por cursor.
+
+Cada tecla que escribe el admin es una sola consulta: filtro por prefijo con
+índice (nombre completo, apellido, RUT o email), orden por `nombre_busqueda`
+e id, y la fila siguiente a la última de la página anterior. No hay
+`COUNT(*)`: el total que muestra la tabla sale de la caché (ver
+`paneladm.cache.conteo_usuarios`) y solo se guarda cuando sale gratis, es
+decir, cuando la primera página ya trae todos los resultados. El total sin
+término (la lista completa, por rubro) se cuenta una vez y queda en caché.
+"""
+from django.db.models import Q
+from django.templatetags.static import static
+
+from usuario.busqueda import filtro_prefijo
+from usuario.directorio import NOMBRES_RUBRO, codificar_cursor, filtrar_despues
+from usuario.models import Usuario
+from .cache import conteo_usuarios, guardar_conteo_usuarios
+
+POR_PAGINA = 15
+ORDEN = (('nombre_busqueda', False), ('id', False))
+CAMPOS = (
+    'id', 'nombre', 'apellido', 'email', 'rut', 'rubro', 'rubro_otro', 'telefono',
+    'cantidad_asistencias', 'es_admin', 'foto', 'nombre_busqueda',
+)
+
+
+def fila_usuario(fila):
+    """Fila de la tabla de usuarios a partir de una fila de `values()`."""
+    if fila['rubro'] == 'otro':
+        rubro = fila['rubro_otro'] or 'Otro'
+    else:
+        rubro = NOMBRES_RUBRO.get(fila['rubro'], fila['rubro'])
+    return {
+        'id': fila['id'],
+        'nombre': fila['nombre'],
+        'apellido': fila['apellido'],
+        'email': fila['email'],
+        'rut': fila['rut'],
+        'rubro': rubro or '',
+        'telefono': fila['telefono'] or '',
+        'cantidad_asistencias': fila['cantidad_asistencias'],
+        'es_admin': fila['es_admin'],
+        'foto_url': Usuario._meta.get_field('foto').storage.url(fila['foto']) if fila['foto'] else static('img/predeterminado.png'),
+    }
+
+
+def filtro_busqueda(termino, ruta=''):
+    """
+    Q de las búsquedas de usuarios del panel (gestión, asistentes, exportes,
+    registro manual): nombre completo, apellido, RUT o email que empieza con
+    `termino`. `ruta` antepone una relación, p. ej. 'usuario__'.
+    """
+    termino = termino.strip()
+    return filtro_prefijo(termino, ruta) | Q(**{f'{ruta}email__istartswith': termino})
+
+
+def filtrar_usuarios(termino='', rubro=''):
+    usuarios = Usuario.objects.all()
+    termino = termino.strip()
+    if termino:
+        usuarios = usuarios.filter(filtro_busqueda(termino))
+    if rubro:
+        usuarios = usuarios.filter(rubro=rubro)
+    return usuarios
+
+
+def pagina_usuarios(termino='', rubro='', cursor=None):
+    """
+    Devuelve (filas, cursor siguiente o None, total aproximado o None). Lanza
+    `usuario.directorio.CursorInvalido` si el cursor no sirve.
+    """
+    usuarios = filtrar_usuarios(termino, rubro).order_by('nombre_busqueda', 'id')
+    if cursor:
+        usuarios = filtrar_despues(usuarios, ORDEN, cursor)
+    filas = list(usuarios.values(*CAMPOS)[:POR_PAGINA + 1])
+    siguiente = None
+    if len(filas) > POR_PAGINA:
+        filas = filas[:POR_PAGINA]
+        siguiente = codificar_cursor([filas[-1][campo] for campo, _ in ORDEN])
+
+    total = conteo_usuarios(termino, rubro)
+    if not cursor and not siguiente:
+        # La primera página trae todo: el total exacto sale gratis.
+        total = {'total': len(filas), 'cota': False}
+        guardar_conteo_usuarios(termino, rubro, len(filas))
+    elif total is None and not termino.strip():
+        total = {'total': filtrar_usuarios('', rubro).count(), 'cota': False}
+        guardar_conteo_usuarios('', rubro, total['total'])
+    return [fila_usuario(fila) for fila in filas], siguiente, total
@@ -1,38 +1,53 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from usuario.models import Usuario, RUBRO_CHOICES # Asegurarse de que Usuario está importado
 from usuario.forms import AdminUsuarioForm, AyudanteUsuarioForm, UsuarioForm, validate_rut
-from .models import Reunion, Encuesta, RespuestaEncuesta, SoporteTicket, TicketRespuesta
+from .models import Asistencia, Reunion, Encuesta, RespuestaEncuesta, SoporteTicket, TicketRespuesta
+from .asistencia import (
+    MAX_REGISTROS_LOTE, curva_llegadas, eliminar_reunion as eliminar_reunion_servicio, marcar_asistencia,
+    quitar_asistencia as quitar_asistencia_servicio, sincronizar_asistencias,
+)
+from .correos import encolar_correo
+from .eventos import flujo_eventos, obtener_broker
+from .membresia import es_interesado
+from .roster import construir_roster, version_roster
+from .usuarios import POR_PAGINA as POR_PAGINA_USUARIOS, filtro_busqueda, pagina_usuarios
+from usuario.directorio import CursorInvalido
+from usuario.etiquetas import preparar_reunion, ruta_hoja_reunion
+from usuario.facetas import opciones_rubro
+from usuario.qr import es_codigo_legado, leer_codigo_qr
+from usuario.rut import cuerpo_o_none
 from .forms import ReunionForm, EncuestaForm, SoporteTicketAdminForm, TicketRespuestaForm
 from django.urls import reverse
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse, HttpRequest
+from django.http import FileResponse, JsonResponse, HttpResponse, HttpRequest, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.db.models import Q, F, Count, Avg, Sum
 from django.utils import timezone
 from datetime import timedelta
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.mail import send_mail, EmailMessage
+from django.views.decorators.http import condition
 from django.conf import settings
 import openpyxl
 from openpyxl.styles import Font, Alignment
 from openpyxl.utils import get_column_letter
+import asyncio
 import json
+import os
 import random
 
 from django.contrib.auth.hashers import check_password
 # Create your views here.
 def admin_required(view_func):
     def wrapper(request, *args, **kwargs):
-        usuario_id = request.session.get('usuario_id')
-        if not usuario_id:
+        usuario_actual = request.usuario
+        if not usuario_actual:
             return redirect('login')
 
-        try:
-            usuario_actual = Usuario.objects.get(id=usuario_id)
-            # Ahora, ni admin ni ayudante pueden acceder a vistas solo para superadmin (si las hubiera)
-            if not usuario_actual.es_admin and not usuario_actual.es_ayudante:
-                return redirect('inicio')
-        except Usuario.DoesNotExist:
-            return redirect('login')
+        # Ahora, ni admin ni ayudante pueden acceder a vistas solo para superadmin (si las hubiera)
+        if not usuario_actual.es_admin and not usuario_actual.es_ayudante:
+            return redirect('inicio')
         return view_func(request, *args, **kwargs)
     return wrapper
     
@@ -41,10 +56,9 @@ def solo_admin_required(view_func):
     Decorador que restringe el acceso SOLO a los usuarios que son administradores (`es_admin`).
     """
     def wrapper(request, *args, **kwargs):
-        usuario_id = request.session.get('usuario_id')
-        if not usuario_id:
+        usuario_actual = request.usuario
+        if not usuario_actual:
             return redirect('login')
-        usuario_actual = get_object_or_404(Usuario, id=usuario_id)
         if not usuario_actual.es_admin:
             messages.error(request, "No tienes permiso para realizar esta acción.")
             return redirect('panel-admin:panel_admin') # Redirige al panel principal si no es admin
@@ -56,67 +70,64 @@ def totem_required(view_func):
     Decorador que restringe el acceso SOLO a los usuarios que son de tipo Tótem (`es_totem`).
     """
     def wrapper(request, *args, **kwargs):
-        usuario_id = request.session.get('usuario_id')
-        if not usuario_id:
+        usuario_actual = request.usuario
+        if not usuario_actual:
             return redirect('login')
-        usuario_actual = get_object_or_404(Usuario, id=usuario_id)
         if not usuario_actual.es_totem:
             messages.error(request, "Esta sección es solo para terminales de tipo Tótem.")
             return redirect('inicio')
         return view_func(request, *args, **kwargs)
     return wrapper
 
+def _denegar_no_privilegiado(request):
+    """Respuesta de rechazo si el usuario no es Administrador, Ayudante ni Tótem; si no, None."""
+    if not request.session.get('usuario_id'):
+        return redirect('login')
+    usuario_actual = request.usuario
+    if not usuario_actual:
+        return JsonResponse({'status': 'error', 'message': 'Usuario no encontrado.'}, status=403)
+    if not (usuario_actual.es_admin or usuario_actual.es_ayudante or usuario_actual.es_totem):
+        return JsonResponse({'status': 'error', 'message': 'Permiso denegado.'}, status=403)
+    return None
+
 def privileged_user_required(view_func):
     """
     Decorador que permite el acceso a Administradores, Ayudantes y Tótems.
-    Ideal para endpoints de API usados por diferentes roles.
+    Ideal para endpoints de API usados por diferentes roles. También sirve para
+    vistas asíncronas: la sesión y el usuario se leen en un hilo aparte.
     """
+    if asyncio.iscoroutinefunction(view_func):
+        async def async_wrapper(request, *args, **kwargs):
+            denegado = await sync_to_async(_denegar_no_privilegiado)(request)
+            if denegado is not None:
+                return denegado
+            return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
     def wrapper(request, *args, **kwargs):
-        usuario_id = request.session.get('usuario_id')
-        if not usuario_id:
-            return redirect('login')
-        try:
-            usuario_actual = Usuario.objects.get(id=usuario_id)
-            if not (usuario_actual.es_admin or usuario_actual.es_ayudante or usuario_actual.es_totem):
-                return JsonResponse({'status': 'error', 'message': 'Permiso denegado.'}, status=403)
-        except Usuario.DoesNotExist:
-            return JsonResponse({'status': 'error', 'message': 'Usuario no encontrado.'}, status=403)
+        denegado = _denegar_no_privilegiado(request)
+        if denegado is not None:
+            return denegado
         return view_func(request, *args, **kwargs)
     return wrapper
 
 @admin_required
 def gestion_usuarios(request):
-    usuario_actual = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
-    rubros = Usuario.objects.exclude(rubro__exact='').values_list('rubro', flat=True).distinct().order_by('rubro')
+    usuario_actual = request.usuario
+    # Rubros con usuarios y su total, desde la caché (ver usuario/facetas.py).
+    rubros = opciones_rubro('panel')
     
     query = request.GET.get('q', '')
     rubro_filter = request.GET.get('rubro', '')
 
-    usuarios_list = Usuario.objects.all().order_by('nombre', 'apellido')
-
-    if query:
-        usuarios_list = usuarios_list.filter(
-            Q(nombre__icontains=query) |
-            Q(apellido__icontains=query) |
-            Q(email__icontains=query) |
-            Q(rut__icontains=query)
-        )
-    
-    if rubro_filter:
-        usuarios_list = usuarios_list.filter(rubro=rubro_filter)
-
-    # Paginación
-    paginator = Paginator(usuarios_list, 15) # 15 usuarios por página
-    page_number = request.GET.get('page')
-    try:
-        usuarios_page = paginator.page(page_number)
-    except PageNotAnInteger:
-        usuarios_page = paginator.page(1)
-    except EmptyPage:
-        usuarios_page = paginator.page(paginator.num_pages)
+    # Primera página; las demás las pide la tabla a `buscar_usuarios_ajax` con el cursor.
+    usuarios, siguiente, total = pagina_usuarios(query, rubro_filter)
 
     return render(request, 'panel_admin_usuarios.html', {
-        'usuarios': usuarios_page, # Enviamos el objeto de página
+        'usuarios': usuarios,
+        'siguiente': siguiente,
+        'total': total,
+        'por_pagina': POR_PAGINA_USUARIOS,
         'rubros': rubros, 
         'query': query, 
         'rubro_filter': rubro_filter, 
@@ -126,53 +137,21 @@ def gestion_usuarios(request):
 @admin_required
 def buscar_usuarios_ajax(request):
     """
-    Vista para manejar las peticiones AJAX de búsqueda de usuarios.
+    Búsqueda de usuarios de la tabla de Gestión de Usuarios, paginada por
+    `cursor` (ver paneladm/usuarios.py). `total` es aproximado y puede venir
+    en null.
     """
-    query = request.GET.get('q', '')
-    rubro_filter = request.GET.get('rubro', '')
-    page_number = request.GET.get('page', 1)
-
-    usuarios_list = Usuario.objects.all().order_by('nombre', 'apellido')
-
-    if query:
-        usuarios_list = usuarios_list.filter(Q(nombre__icontains=query) | Q(apellido__icontains=query) | Q(email__icontains=query) | Q(rut__icontains=query))
-    if rubro_filter:
-        usuarios_list = usuarios_list.filter(rubro=rubro_filter)
-
-    # Paginación para la respuesta AJAX
-    paginator = Paginator(usuarios_list, 15)
     try:
-        page_obj = paginator.page(page_number)
-    except (EmptyPage, PageNotAnInteger):
-        page_obj = paginator.page(1)
-
-    from django.templatetags.static import static
-    # Preparamos los datos para la respuesta JSON
-    data = [{
-        'id': u.id,
-        'nombre': u.nombre,
-        'apellido': u.apellido,
-        'email': u.email,
-        'rut': u.rut,
-        'rubro': u.get_rubro_real_display,
-        'telefono': u.telefono or '',
-        'cantidad_asistencias': u.cantidad_asistencias,
-        'es_admin': u.es_admin,
-        'foto_url': u.foto.url if u.foto else static('img/predeterminado.png')
-    } for u in page_obj.object_list]
-
-    # Incluimos la información de paginación en la respuesta JSON
-    return JsonResponse({
-        'usuarios': data,
-        'has_previous': page_obj.has_previous(),
-        'has_next': page_obj.has_next(),
-        'current_page': page_obj.number,
-        'total_pages': paginator.num_pages,
-    })
+        usuarios, siguiente, total = pagina_usuarios(
+            request.GET.get('q', ''), request.GET.get('rubro', ''), request.GET.get('cursor') or None,
+        )
+    except CursorInvalido:
+        return JsonResponse({'error': 'Cursor inválido.'}, status=400)
+    return JsonResponse({'usuarios': usuarios, 'siguiente': siguiente, 'total': total})
 
 @admin_required
 def editar_usuario_admin(request, usuario_id):
-    usuario_actual = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+    usuario_actual = request.usuario
     usuario_a_editar = get_object_or_404(Usuario, id=usuario_id)
 
     # Determinar qué formulario usar según el rol del usuario actual
@@ -239,12 +218,7 @@ def exportar_usuarios_excel(request):
     usuarios = Usuario.objects.all().order_by('nombre', 'apellido')
 
     if query:
-        usuarios = usuarios.filter(
-            Q(nombre__icontains=query) |
-            Q(apellido__icontains=query) |
-            Q(email__icontains=query) |
-            Q(rut__icontains=query)
-        )
+        usuarios = usuarios.filter(filtro_busqueda(query))
     
     if rubro_filter:
         usuarios = usuarios.filter(rubro=rubro_filter)
@@ -328,7 +302,8 @@ def editar_reunion(request, reunion_id):
 def eliminar_reunion(request, reunion_id):
     if request.method == 'POST':
         reunion = get_object_or_404(Reunion, id=reunion_id)
-        reunion.delete()
+        # Descuenta la asistencia a cada asistente en la misma transacción.
+        eliminar_reunion_servicio(reunion.id)
         messages.success(request, 'Reunión eliminada correctamente.')
     return redirect('panel-admin:gestion_reuniones')
 
@@ -352,13 +327,10 @@ def registrar_asistencia(request, reunion_id):
     if request.method == 'POST' and 'manual_add' in request.POST:
         usuario_id = request.POST.get('usuario_id')
         if usuario_id:
-            usuario_a_agregar = get_object_or_404(Usuario, id=usuario_id)
+            checkin = marcar_asistencia(reunion.id, usuario_id, registrado_por=request.usuario, estacion='manual')
+            usuario_a_agregar = checkin.usuario
             
-            if not reunion.asistentes.filter(id=usuario_a_agregar.id).exists():
-                reunion.asistentes.add(usuario_a_agregar)
-                usuario_a_agregar.cantidad_asistencias = F('cantidad_asistencias') + 1
-                usuario_a_agregar.save()
-                
+            if checkin.nuevo:
                 # Si se debe imprimir etiqueta, preparamos la URL para la redirección.
                 if reunion.imprimir_etiqueta_al_asistir:
                     redirect_url = f"{reverse('panel-admin:registrar_asistencia', args=[reunion_id])}?print_user={usuario_a_agregar.id}"
@@ -371,12 +343,40 @@ def registrar_asistencia(request, reunion_id):
             return redirect('panel-admin:registrar_asistencia', reunion_id=reunion_id)
 
     asistentes = reunion.asistentes.all().order_by('nombre')
-    usuarios_no_asistentes = Usuario.objects.exclude(id__in=asistentes.values_list('id', flat=True)).order_by('nombre')
 
+    # El desplegable de registro manual busca en buscar_usuarios_reunion a medida que se escribe.
     return render(request, 'panel_admin_asistencia.html', {
         'reunion': reunion,
         'asistentes': asistentes,
-        'usuarios_no_asistentes': usuarios_no_asistentes
+    })
+
+RESULTADOS_POR_PAGINA = 20
+
+@admin_required
+def buscar_usuarios_reunion(request, reunion_id):
+    """
+    Endpoint API (formato de Select2) para el registro manual: usuarios que aún
+    no asisten a la reunión cuyo nombre, apellido, RUT o email empieza con `q`.
+    Pagina con `page` y pide una fila de más para saber si hay otra página.
+    """
+    get_object_or_404(Reunion.objects.only('id'), id=reunion_id)
+    try:
+        pagina = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        pagina = 1
+    usuarios = Usuario.objects.exclude(asistencias__reunion_id=reunion_id).order_by('nombre_busqueda', 'id')
+    termino = request.GET.get('q', '').strip()
+    if termino:
+        usuarios = usuarios.filter(filtro_busqueda(termino))
+
+    inicio = (pagina - 1) * RESULTADOS_POR_PAGINA
+    filas = list(usuarios.values('id', 'nombre', 'apellido', 'rut')[inicio:inicio + RESULTADOS_POR_PAGINA + 1])
+    return JsonResponse({
+        'results': [
+            {'id': u['id'], 'text': f"{u['nombre']} {u['apellido']}", 'rut': u['rut']}
+            for u in filas[:RESULTADOS_POR_PAGINA]
+        ],
+        'pagination': {'more': len(filas) > RESULTADOS_POR_PAGINA},
     })
 
 @admin_required # Ayudante puede quitar asistencia
@@ -388,12 +388,8 @@ def quitar_asistencia(request, reunion_id, usuario_id):
         reunion = get_object_or_404(Reunion, id=reunion_id)
         usuario_a_quitar = get_object_or_404(Usuario, id=usuario_id)
 
-        if reunion.asistentes.filter(id=usuario_a_quitar.id).exists():
-            reunion.asistentes.remove(usuario_a_quitar)
-            # Decrementamos el contador de asistencias del usuario de forma segura
-            if usuario_a_quitar.cantidad_asistencias > 0:
-                usuario_a_quitar.cantidad_asistencias = F('cantidad_asistencias') - 1
-                usuario_a_quitar.save()
+        # Borra la fila de Asistencia y descuenta el contador en la misma transacción.
+        if quitar_asistencia_servicio(reunion.id, usuario_a_quitar.id):
             messages.success(request, f'Se ha quitado la asistencia de {usuario_a_quitar.nombre}.')
     
     return redirect('panel-admin:registrar_asistencia', reunion_id=reunion_id)
@@ -403,7 +399,7 @@ def gestion_asistentes(request):
     """
     Página que lista las reuniones para seleccionar y ver sus asistentes.
     """
-    reuniones = Reunion.objects.annotate(num_asistentes=Count('asistentes')).order_by('-fecha')
+    reuniones = Reunion.objects.order_by('-fecha')
     return render(request, 'panel_admin_gestion_asistentes.html', {
         'reuniones': reuniones
     })
@@ -419,12 +415,7 @@ def ver_asistentes_reunion(request, reunion_id):
 
     query = request.GET.get('q', '')
     if query:
-        asistentes_list = asistentes_list.filter(
-            Q(nombre__icontains=query) |
-            Q(apellido__icontains=query) |
-            Q(rut__icontains=query) |
-            Q(email__icontains=query)
-        )
+        asistentes_list = asistentes_list.filter(filtro_busqueda(query))
 
     paginator = Paginator(asistentes_list, 15) # 15 asistentes por página
     page_number = request.GET.get('page')
@@ -450,14 +441,9 @@ def exportar_asistentes_reunion_excel(request, reunion_id):
     reunion = get_object_or_404(Reunion, id=reunion_id)
     query = request.GET.get('q', '')
 
-    asistentes = reunion.asistentes.all().order_by('nombre', 'apellido')
+    asistencias = Asistencia.objects.filter(reunion=reunion).select_related('usuario').order_by('usuario__nombre', 'usuario__apellido')
     if query:
-        asistentes = asistentes.filter(
-            Q(nombre__icontains=query) |
-            Q(apellido__icontains=query) |
-            Q(rut__icontains=query) |
-            Q(email__icontains=query)
-        )
+        asistencias = asistencias.filter(filtro_busqueda(query, 'usuario__'))
 
     # Crear el libro y la hoja de Excel
     workbook = openpyxl.Workbook()
@@ -466,15 +452,19 @@ def exportar_asistentes_reunion_excel(request, reunion_id):
     filename = f"asistentes_{reunion.detalle.replace(' ', '_').lower()}.xlsx"
 
     # Añadir encabezados y darles estilo
-    headers = ['Nombre', 'Apellido', 'RUT', 'Email', 'Rubro', 'Teléfono']
+    headers = ['Nombre', 'Apellido', 'RUT', 'Email', 'Rubro', 'Teléfono', 'Hora de ingreso', 'Estación']
     sheet.append(headers)
     bold_font = Font(bold=True)
     for cell in sheet[1]:
         cell.font = bold_font
 
     # Añadir los datos de los asistentes
-    for asistente in asistentes:
-        sheet.append([asistente.nombre, asistente.apellido, asistente.rut, asistente.email, asistente.get_rubro_real_display, asistente.telefono or ''])
+    for asistencia in asistencias:
+        asistente = asistencia.usuario
+        sheet.append([
+            asistente.nombre, asistente.apellido, asistente.rut, asistente.email, asistente.get_rubro_real_display, asistente.telefono or '',
+            timezone.localtime(asistencia.checked_in_at).strftime('%d-%m-%Y %H:%M'), asistencia.estacion,
+        ])
 
     # Preparar la respuesta HTTP
     response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
@@ -483,39 +473,98 @@ def exportar_asistentes_reunion_excel(request, reunion_id):
     return response
 
 @privileged_user_required # Admin, Ayudante y Tótem pueden usar el QR para marcar asistencia
-def marcar_asistencia_qr(request, reunion_id, usuario_id):
+def marcar_asistencia_qr(request, reunion_id, codigo):
     """
     Endpoint API para marcar la asistencia de un usuario a una reunión.
+    `codigo` es el token firmado del QR; se verifica antes de tocar la base de
+    datos (ver usuario/qr.py). Acepta una clave de idempotencia en la cabecera
+    `Idempotency-Key` para que un escáner pueda reintentar sin riesgo (ver
+    paneladm/asistencia.py).
     """
     if request.method == 'POST':
-        reunion = get_object_or_404(Reunion, id=reunion_id)
-        usuario = get_object_or_404(Usuario, id=usuario_id)
+        usuario_id = leer_codigo_qr(codigo)
+        if usuario_id is None:
+            if es_codigo_legado(codigo):
+                mensaje = 'Este QR es antiguo y ya no es válido: muestra el QR nuevo que llegó por correo o el de tu perfil.'
+            else:
+                mensaje = 'El código QR no es válido.'
+            return JsonResponse({'status': 'error', 'message': mensaje}, status=400)
+        escaner = request.usuario
+        checkin = marcar_asistencia(
+            reunion_id, usuario_id,
+            clave=request.headers.get('Idempotency-Key'),
+            registrado_por=escaner,
+            # Los escáneres pueden identificarse (p. ej. "tótem entrada norte"); si no, se usa el rol.
+            estacion=request.headers.get('X-Estacion', '')[:50] or ('totem' if escaner.es_totem else 'panel'),
+        )
+        usuario = checkin.usuario
 
-        # Primero, verificamos si el usuario ya es un asistente.
-        if reunion.asistentes.filter(id=usuario.id).exists():
-            # Si ya existe, devolvemos un error y no hacemos nada más.
+        if not checkin.nuevo:
             return JsonResponse({'status': 'error', 'message': f'{usuario.nombre} ya se encuentra registrado en esta reunión.'}, status=409)
 
-        # Si no existe, procedemos a registrarlo.
-        if not reunion.asistentes.filter(id=usuario.id).exists():
-            reunion.asistentes.add(usuario)
-            usuario.cantidad_asistencias = F('cantidad_asistencias') + 1
-            usuario.save()
-
-            # Refrescar el objeto para obtener el valor actualizado de 'cantidad_asistencias'
-            usuario.refresh_from_db()
-
-            from django.templatetags.static import static
-            print_url = reverse('imprimir_etiqueta', args=[usuario.id]) if reunion.imprimir_etiqueta_al_asistir else None
-            return JsonResponse({
-                'status': 'ok', 
-                'message': f'Asistencia de {usuario.nombre} registrada.',
-                'asistente': { 'id': usuario.id, 'nombre': usuario.nombre, 'apellido': usuario.apellido, 'rut': usuario.rut, 'rubro': usuario.get_rubro_real_display or '', 'foto_url': usuario.foto.url if usuario.foto else static('img/predeterminado.png') },
-                'print_url': print_url
-            })
+        from django.templatetags.static import static
+        print_url = reverse('imprimir_etiqueta', args=[usuario.id]) if checkin.imprimir_etiqueta else None
+        return JsonResponse({
+            'status': 'ok', 
+            'message': f'Asistencia de {usuario.nombre} registrada.',
+            'asistente': { 'id': usuario.id, 'nombre': usuario.nombre, 'apellido': usuario.apellido, 'rut': usuario.rut, 'rubro': usuario.get_rubro_real_display or '', 'foto_url': usuario.foto.url if usuario.foto else static('img/predeterminado.png') },
+            'print_url': print_url
+        })
             
     return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
 
+@privileged_user_required
+async def eventos_reunion(request, reunion_id):
+    """
+    Stream SSE con los ingresos y salidas de la reunión (ver paneladm/eventos.py).
+    Solo funciona bajo ASGI: con WSGI cada conexión abierta ocuparía un hilo.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'status': 'error', 'message': 'Los eventos en vivo requieren el servidor ASGI.'}, status=503)
+    broker = obtener_broker()
+    response = StreamingHttpResponse(flujo_eventos(broker, broker.suscribir(reunion_id)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # que nginx no acumule el stream
+    return response
+
+def _etag_roster(request, reunion_id):
+    return f"{version_roster(reunion_id)}:{request.GET.get('since', '')}"
+
+@privileged_user_required
+@condition(etag_func=_etag_roster)
+def roster_reunion(request, reunion_id):
+    """
+    Endpoint API con el padrón de la reunión para las estaciones de escaneo.
+    Con `?since=<version>` devuelve solo los cambios (ver paneladm/roster.py).
+    """
+    get_object_or_404(Reunion.objects.only('id'), id=reunion_id)
+    response = JsonResponse(construir_roster(reunion_id, since=request.GET.get('since')))
+    # Se guarda en el navegador, pero siempre se revalida con el ETag.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@privileged_user_required
+def sincronizar_asistencia(request, reunion_id):
+    """
+    Endpoint API para los tótems sin conexión: recibe hasta MAX_REGISTROS_LOTE
+    escaneos `{"registros": [{"codigo", "scanned_at", "estacion", "clave"}, ...]}`
+    y devuelve el resultado de cada uno para que el tótem vacíe su cola.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    reunion = get_object_or_404(Reunion, id=reunion_id)
+    try:
+        registros = json.loads(request.body).get('registros')
+    except (json.JSONDecodeError, AttributeError):
+        registros = None
+    if not isinstance(registros, list):
+        return JsonResponse({'status': 'error', 'message': 'Petición inválida'}, status=400)
+    if len(registros) > MAX_REGISTROS_LOTE:
+        return JsonResponse({'status': 'error', 'message': f'Máximo {MAX_REGISTROS_LOTE} registros por petición.'}, status=413)
+
+    resultados = sincronizar_asistencias(reunion.id, registros, registrado_por=request.usuario)
+    return JsonResponse({'status': 'ok', 'resultados': resultados})
+
 @solo_admin_required
 def gestion_interesados(request):
     reuniones_proximas = Reunion.objects.filter(fecha__gte=timezone.now()).prefetch_related('interesados').order_by('fecha')
@@ -523,6 +572,22 @@ def gestion_interesados(request):
         'reuniones': reuniones_proximas
     })
 
+@solo_admin_required
+def hoja_etiquetas_reunion(request, reunion_id):
+    """
+    Descarga la hoja A4 con las etiquetas de los interesados. Si no se preparó
+    con `preparar_etiquetas` (o se pide ?regenerar=1) se arma aquí, dibujando
+    en este proceso solo las etiquetas que falten.
+    """
+    reunion = get_object_or_404(Reunion, id=reunion_id)
+    ruta = ruta_hoja_reunion(reunion.id)
+    if request.GET.get('regenerar') or not os.path.exists(ruta):
+        _, _, paginas = preparar_reunion(reunion, procesos=0)
+        if not paginas:
+            messages.info(request, 'La reunión no tiene interesados.')
+            return redirect('panel-admin:gestion_interesados')
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=f'etiquetas_reunion_{reunion.id}.pdf')
+
 @solo_admin_required
 def gestion_encuestas(request):
     if request.method == 'POST':
@@ -580,7 +645,7 @@ def gestion_soporte(request):
 @admin_required # Ayudante puede ver y responder tickets
 def ver_ticket_soporte(request, ticket_id):
     ticket = get_object_or_404(SoporteTicket, id=ticket_id)
-    admin_usuario = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+    admin_usuario = request.usuario
 
     if request.method == 'POST':
         if 'actualizar_estado' in request.POST:
@@ -619,7 +684,7 @@ def totem_seleccionar_reunion(request):
     reuniones_proximas = Reunion.objects.filter(fecha__gte=timezone.now()).order_by('fecha')
     contexto = {
         'reuniones': reuniones_proximas,
-        'usuario': get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+        'usuario': request.usuario
     }
     return render(request, 'totem_seleccionar_reunion.html', contexto)
 
@@ -641,7 +706,7 @@ def totem_verify_exit(request):
         try:
             data = json.loads(request.body)
             password = data.get('password')
-            usuario_totem = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+            usuario_totem = request.usuario
 
             # Usamos check_password para comparar la contraseña en texto plano con la hasheada en la BD
             if check_password(password, usuario_totem.password): 
@@ -660,7 +725,7 @@ def estadisticas_admin(request):
     """
     reuniones_para_filtro = Reunion.objects.all().order_by('-fecha')
     reunion_seleccionada_id_str = request.GET.get('reunion_id', None)
-    usuario_actual = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+    usuario_actual = request.usuario
 
     # --- 1. Función para aplanar los RUBRO_CHOICES anidados ---
     def flatten_choices(choices):
@@ -710,10 +775,10 @@ def estadisticas_admin(request):
         # --- VISTA DE ESTADÍSTICAS POR REUNIÓN ---
         reunion = get_object_or_404(Reunion, id=reunion_seleccionada_id)
         contexto['reunion_seleccionada'] = reunion
-        asistentes = reunion.asistentes.all()
-        interesados = reunion.interesados.all()
-        contexto['total_asistencias'] = asistentes.count()
-        contexto['data_conversion'] = [interesados.count(), asistentes.count()]
+        asistencias = Asistencia.objects.filter(reunion=reunion)
+        contexto['total_asistencias'] = reunion.num_asistentes
+        contexto['data_conversion'] = [reunion.num_interesados, reunion.num_asistentes]
+        contexto['labels_llegadas'], contexto['data_llegadas'] = curva_llegadas(reunion.id)
 
         if hasattr(reunion, 'encuesta'):
             respuestas = reunion.encuesta.respuestas.all()
@@ -722,7 +787,7 @@ def estadisticas_admin(request):
             contexto['labels_puntuacion'] = [f"{p['puntuacion']} Estrellas" for p in puntuaciones]
             contexto['data_puntuacion'] = [p['cantidad'] for p in puntuaciones]
 
-        top_rubros = asistentes.filter(rubro__isnull=False).exclude(rubro__exact='').values('rubro').annotate(cantidad=Count('id')).order_by('-cantidad')[:5]
+        top_rubros = asistencias.filter(usuario__rubro__isnull=False).exclude(usuario__rubro__exact='').values(rubro=F('usuario__rubro')).annotate(cantidad=Count('id')).order_by('-cantidad')[:5]
         contexto['labels_rubro'] = [rubros_dict.get(r['rubro'], r['rubro']) for r in top_rubros]
         contexto['data_rubro'] = [r['cantidad'] for r in top_rubros]
 
@@ -734,7 +799,7 @@ def estadisticas_admin(request):
         contexto['promedio_satisfaccion'] = RespuestaEncuesta.objects.aggregate(avg=Avg('puntuacion'))['avg'] or 0
         
         # Gráfico de Asistencia a últimas reuniones
-        reuniones_recientes = Reunion.objects.annotate(num_asistentes=Count('asistentes')).order_by('-fecha')[:10][::-1] # Invertido para orden cronológico
+        reuniones_recientes = Reunion.objects.only('detalle', 'num_asistentes').order_by('-fecha')[:10][::-1] # Invertido para orden cronológico
         contexto['labels_reuniones'] = [r.detalle for r in reuniones_recientes]
         contexto['data_asistencia'] = [r.num_asistentes for r in reuniones_recientes]
         
@@ -753,7 +818,7 @@ def exportar_estadisticas_excel(request):
     De lo contrario, exporta las estadísticas generales.
     """
     reunion_id = request.GET.get('reunion_id')
-    usuario_actual = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+    usuario_actual = request.usuario
     workbook = openpyxl.Workbook()
     bold_font = Font(bold=True, size=12)
     filename = "estadisticas_ecosistemala.xlsx"
@@ -767,8 +832,7 @@ def exportar_estadisticas_excel(request):
         reunion = get_object_or_404(Reunion, id=reunion_id)
         filename = f"estadisticas_{reunion.detalle.replace(' ', '_').lower()}_{reunion.fecha.strftime('%Y%m%d')}.xlsx"
 
-        asistentes = reunion.asistentes.all()
-        interesados = reunion.interesados.all()
+        asistencias = Asistencia.objects.filter(reunion=reunion).select_related('usuario')
 
         # Hoja de Resumen de la Reunión
         sheet_resumen = workbook.active
@@ -781,8 +845,8 @@ def exportar_estadisticas_excel(request):
             promedio_satisfaccion = reunion.encuesta.respuestas.aggregate(avg=Avg('puntuacion'))['avg'] or 0
 
         resumen_data = [
-            ("Interesados", interesados.count()),
-            ("Asistentes", asistentes.count()),
+            ("Interesados", reunion.num_interesados),
+            ("Asistentes", reunion.num_asistentes),
             ("Satisfacción Promedio", f"{promedio_satisfaccion:.2f} / 5" if promedio_satisfaccion else "N/A")
         ]
         for i, (label, value) in enumerate(resumen_data, start=3):
@@ -792,10 +856,21 @@ def exportar_estadisticas_excel(request):
 
         # Hoja de Lista de Asistentes
         sheet_asistentes = workbook.create_sheet(title="Lista de Asistentes")
-        sheet_asistentes.append(['Nombre', 'Apellido', 'Email', 'Rubro'])
+        sheet_asistentes.append(['Nombre', 'Apellido', 'Email', 'Rubro', 'Hora de ingreso'])
         for cell in sheet_asistentes[1]: cell.font = bold_font
-        for asistente in asistentes.order_by('nombre'):
-            sheet_asistentes.append([asistente.nombre, asistente.apellido, asistente.email, asistente.get_rubro_real_display])
+        for asistencia in asistencias.order_by('usuario__nombre'):
+            asistente = asistencia.usuario
+            sheet_asistentes.append([
+                asistente.nombre, asistente.apellido, asistente.email, asistente.get_rubro_real_display,
+                timezone.localtime(asistencia.checked_in_at).strftime('%H:%M'),
+            ])
+
+        # Hoja de Llegadas (ingresos cada 5 minutos)
+        sheet_llegadas = workbook.create_sheet(title="Llegadas")
+        sheet_llegadas.append(['Hora', 'Ingresos'])
+        for cell in sheet_llegadas[1]: cell.font = bold_font
+        for hora, cantidad in zip(*curva_llegadas(reunion.id)):
+            sheet_llegadas.append([hora, cantidad])
 
     elif usuario_actual.es_admin:
         # --- EXPORTAR ESTADÍSTICAS GENERALES (comportamiento actual) ---
@@ -804,7 +879,7 @@ def exportar_estadisticas_excel(request):
         total_asistencias = Usuario.objects.aggregate(total=Sum('cantidad_asistencias'))['total'] or 0
         promedio_satisfaccion = RespuestaEncuesta.objects.aggregate(avg=Avg('puntuacion'))['avg'] or 0
 
-        reuniones_asistencia = Reunion.objects.annotate(num_asistentes=Count('asistentes')).order_by('-fecha')
+        reuniones_asistencia = Reunion.objects.only('detalle', 'fecha', 'num_asistentes').order_by('-fecha')
         distribucion_puntuacion = RespuestaEncuesta.objects.values('puntuacion').annotate(cantidad=Count('id')).order_by('puntuacion')
         usuarios_por_rubro_qs = Usuario.objects.filter(rubro__isnull=False).exclude(rubro__exact='').values('rubro').annotate(cantidad=Count('id')).order_by('-cantidad')
         
@@ -886,7 +961,7 @@ def ruleta_sorteo(request):
     reuniones = Reunion.objects.all().order_by('-fecha')
     contexto = {
         'reuniones': reuniones,
-        'usuario_actual': get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+        'usuario_actual': request.usuario
     }
     return render(request, 'panel_admin_ruleta.html', contexto)
 
@@ -938,13 +1013,9 @@ def reunion_publica(request, reunion_id):
     
     # Verificar si el usuario actual ya está interesado (si está logueado)
     ya_interesado = False
-    usuario_actual = None
-    if request.session.get('usuario_id'):
-        try:
-            usuario_actual = Usuario.objects.get(id=request.session.get('usuario_id'))
-            ya_interesado = reunion.interesados.filter(id=usuario_actual.id).exists()
-        except Usuario.DoesNotExist:
-            pass
+    usuario_actual = request.usuario
+    if usuario_actual:
+        ya_interesado = es_interesado(usuario_actual.id, reunion.id)
     
     # Verificar si la reunión ya pasó + 2 horas (inscripciones cerradas)
     ahora = timezone.now()
@@ -977,18 +1048,15 @@ def inscribirse_reunion(request, reunion_id):
         return redirect('panel-admin:reunion_publica', reunion_id=reunion.id)
     
     # Si ya está logueado, inscribir directamente
-    if request.session.get('usuario_id'):
-        try:
-            usuario = Usuario.objects.get(id=request.session.get('usuario_id'))
-            # Agregar a interesados si no está ya
-            if not reunion.interesados.filter(id=usuario.id).exists():
-                reunion.interesados.add(usuario)
-                messages.success(request, f'¡Te has inscrito exitosamente en "{reunion.detalle}"!')
-            else:
-                messages.info(request, 'Ya estás inscrito en esta reunión.')
-            return redirect('panel-admin:reunion_publica', reunion_id=reunion.id)
-        except Usuario.DoesNotExist:
-            request.session.flush()
+    usuario = request.usuario
+    if usuario:
+        # Agregar a interesados si no está ya
+        if not es_interesado(usuario.id, reunion.id):
+            reunion.interesados.add(usuario)
+            messages.success(request, f'¡Te has inscrito exitosamente en "{reunion.detalle}"!')
+        else:
+            messages.info(request, 'Ya estás inscrito en esta reunión.')
+        return redirect('panel-admin:reunion_publica', reunion_id=reunion.id)
     
     if request.method == 'POST':
         paso = request.POST.get('paso', 'verificar_rut')
@@ -1015,11 +1083,11 @@ def inscribirse_reunion(request, reunion_id):
             rut_limpio = result  # result contiene el RUT normalizado
             
             try:
-                # El RUT existe, inscribir directamente
-                usuario = Usuario.objects.get(rut=rut_limpio)
+                # El RUT existe, inscribir directamente (se busca por el cuerpo, ver usuario/rut.py)
+                usuario = Usuario.objects.get(rut_cuerpo=cuerpo_o_none(rut_limpio))
                 
                 # Verificar si ya está inscrito
-                if reunion.interesados.filter(id=usuario.id).exists():
+                if es_interesado(usuario.id, reunion.id):
                     return render(request, 'inscripcion_reunion.html', {
                         'reunion': reunion,
                         'paso': 'verificar_rut',
@@ -1073,19 +1141,8 @@ EcosistemaLA - Comunidad Emprendedora
 meetingup.cl
                     '''
                     
-                    # Crear correo con EmailMessage para adjuntar el QR
-                    email = EmailMessage(
-                        asunto,
-                        mensaje,
-                        settings.DEFAULT_FROM_EMAIL,
-                        [usuario.email],
-                    )
-                    
-                    # Adjuntar el QR si existe
-                    if usuario.qr_code:
-                        email.attach_file(usuario.qr_code.path)
-                    
-                    email.send(fail_silently=True)
+                    # Se encola con el QR adjunto; lo envía el worker `enviar_correos`.
+                    encolar_correo(asunto, mensaje, usuario.email, adjuntar_qr_de=usuario)
                     
                 except Exception as e:
                     print(f"Error al enviar correo: {e}")
@@ -1126,9 +1183,6 @@ meetingup.cl
             if form.is_valid():
                 nuevo_usuario = form.save()
                 
-                # Refrescar el objeto para obtener el QR generado por el signal
-                nuevo_usuario.refresh_from_db()
-                
                 # Inscribir como interesado
                 reunion.interesados.add(nuevo_usuario)
                 
@@ -1174,19 +1228,8 @@ EcosistemaLA - Comunidad Emprendedora
 meetingup.cl
                     '''
                     
-                    # Crear correo con EmailMessage para adjuntar el QR
-                    email = EmailMessage(
-                        asunto,
-                        mensaje,
-                        settings.DEFAULT_FROM_EMAIL,
-                        [nuevo_usuario.email],
-                    )
-                    
-                    # Adjuntar el QR si existe
-                    if nuevo_usuario.qr_code:
-                        email.attach_file(nuevo_usuario.qr_code.path)
-                    
-                    email.send(fail_silently=True)
+                    # Se encola con el QR adjunto; lo envía el worker `enviar_correos`.
+                    encolar_correo(asunto, mensaje, nuevo_usuario.email, adjuntar_qr_de=nuevo_usuario)
                     
                 except Exception as e:
                     print(f"Error al enviar correo: {e}")
@@ -0,0 +1,106 @@
+// Padrón de una reunión para las estaciones de escaneo (ver paneladm/roster.py).
+// Se descarga completo una vez y luego se piden solo los cambios con ?since=.
+// Se guarda en localStorage para seguir reconociendo QR si se cae la conexión.
+class RosterReunion {
+    constructor(url, reunionId, intervalo = 30000) {
+        this.url = url;
+        this.clave = `roster-reunion-${reunionId}`;
+        this.intervalo = intervalo;
+        this.version = null;
+        this.usuarios = new Map();
+        try {
+            const guardado = JSON.parse(localStorage.getItem(this.clave) || 'null');
+            if (guardado) {
+                this.version = guardado.version;
+                guardado.usuarios.forEach(u => this.usuarios.set(u.id, u));
+            }
+        } catch (error) {
+            localStorage.removeItem(this.clave);
+        }
+    }
+
+    async actualizar() {
+        const url = this.version ? `${this.url}?since=${encodeURIComponent(this.version)}` : this.url;
+        try {
+            const response = await fetch(url, { headers: { 'Accept': 'application/json' }, cache: 'no-cache' });
+            if (!response.ok) return;
+            const data = await response.json();
+            if (data.completo) this.usuarios.clear();
+            data.usuarios.forEach(fila => {
+                const usuario = Object.fromEntries(data.campos.map((campo, i) => [campo, fila[i]]));
+                this.usuarios.set(usuario.id, usuario);
+            });
+            data.eliminados.forEach(id => this.usuarios.delete(id));
+            this.version = data.version;
+            this.guardar();
+        } catch (error) {
+            // Sin conexión: se sigue usando el padrón que ya teníamos.
+        }
+    }
+
+    guardar() {
+        try {
+            localStorage.setItem(this.clave, JSON.stringify({ version: this.version, usuarios: [...this.usuarios.values()] }));
+        } catch (error) {
+            // localStorage lleno o deshabilitado: el padrón queda solo en memoria.
+        }
+    }
+
+    iniciar() {
+        this.actualizar();
+        setInterval(() => this.actualizar(), this.intervalo);
+        return this;
+    }
+
+    buscar(usuarioId) {
+        return this.usuarios.get(Number(usuarioId));
+    }
+
+    marcarAsistencia(usuarioId, asistio = true) {
+        const usuario = this.buscar(usuarioId);
+        if (usuario) {
+            usuario.asistio = asistio;
+            this.guardar();
+        }
+    }
+
+    // Escucha los ingresos y salidas en vivo (paneladm/eventos.py) para no
+    // esperar al próximo `actualizar`. `alEvento(tipo, data)` es opcional.
+    escucharEventos(url, alEvento = null) {
+        if (!window.EventSource) return null;
+        const fuente = new EventSource(url);
+        fuente.addEventListener('ingreso', e => {
+            const data = JSON.parse(e.data);
+            data.asistentes.forEach(a => this.marcarAsistencia(a.id));
+            if (alEvento) alEvento('ingreso', data);
+        });
+        fuente.addEventListener('salida', e => {
+            const data = JSON.parse(e.data);
+            data.ids.forEach(id => this.marcarAsistencia(id, false));
+            if (alEvento) alEvento('salida', data);
+        });
+        // El servidor nos desconectó por lentos: se recarga el padrón y se vuelve a escuchar.
+        fuente.addEventListener('reiniciar', () => {
+            fuente.close();
+            this.actualizar().then(() => {
+                if (alEvento) alEvento('reiniciar', null);
+                this.escucharEventos(url, alEvento);
+            });
+        });
+        return fuente;
+    }
+}
+
+// Lee un QR de usuario: devuelve { codigo, usuarioId } o null si no es de este sitio.
+// `codigo` es lo que se manda al servidor, que verifica la firma (ver usuario/qr.py);
+// el id sirve solo para buscar en el padrón. Los QR nuevos son un token
+// <clave><firma de 16><id en base 36>; los antiguos, la URL del perfil, y
+// `rutaPerfil` es la ruta de perfil_publico con 999999 en lugar del id.
+function leerQR(texto, rutaPerfil) {
+    texto = (texto || '').trim();
+    const token = texto.toUpperCase().match(/^[0-9A-Z][A-Z2-7]{16}([0-9A-Z]{1,13})$/);
+    if (token) return { codigo: token[0], usuarioId: parseInt(token[1], 36) };
+    const patron = new RegExp(rutaPerfil.replace(/[.*+?^${}()|[\]\\]/g, '\\$&').replace('999999', '(\\d+)') + '?$');
+    const coincidencia = texto.match(patron);
+    return coincidencia ? { codigo: coincidencia[1], usuarioId: parseInt(coincidencia[1], 10) } : null;
+}
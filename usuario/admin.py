@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Usuario
+from .models import Usuario, TrabajoQR
 
 class UsuarioAdmin(admin.ModelAdmin):
     list_display = ('nombre', 'apellido', 'email', 'es_admin', 'es_ayudante', 'es_totem')
@@ -9,3 +9,8 @@ class UsuarioAdmin(admin.ModelAdmin):
     exclude = ('password',)
 
 admin.site.register(Usuario, UsuarioAdmin)
+
+class TrabajoQRAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'creado_en', 'intentos', 'ultimo_error')
+
+admin.site.register(TrabajoQR, TrabajoQRAdmin)
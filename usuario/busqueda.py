@@ -0,0 +1,233 @@
+"""
+Búsqueda de usuarios.
+
+Por prefijo: `Usuario` guarda copias normalizadas (minúsculas, sin tildes) del
+nombre completo, del apellido y del RUT sin puntos ni guion, cada una con su
+índice. Buscar es entonces un `LIKE 'termino%'` que recorre solo un tramo del
+índice, en vez de un `LIKE '%termino%'` sobre toda la tabla.
+
+Texto libre (directorio de miembros): `documento_busqueda` junta nombre,
+apellido, empresa, el nombre del rubro y lo que busca la persona, ya
+normalizado. En MySQL lo consulta un índice FULLTEXT en modo booleano; en las
+demás bases (SQLite en desarrollo) un índice invertido en memoria del proceso.
+Ambos exigen todas las palabras como prefijo y ordenan por relevancia.
+"""
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+MAX_PALABRAS = 8
+# El índice en memoria entrega como máximo esta cantidad de resultados.
+MAX_RESULTADOS_LOCAL = 1000
+CLAVE_VERSION = 'busqueda:documentos:version'
+
+
+def normalizar(texto):
+    """'  José  Núñez ' -> 'jose nunez'."""
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode()
+    return ' '.join(texto.lower().split())
+
+
+def normalizar_rut(rut):
+    """'12.345.678-k' -> '12345678K'."""
+    texto = str(rut or '').upper().replace('.', '').replace('-', '').replace(' ', '')
+    if texto.isalnum():
+        return texto
+    return ''.join(c for c in texto if c.isalnum())
+
+
+def campos_busqueda(usuario):
+    """Asigna los campos normalizados a partir de nombre, apellido y RUT."""
+    usuario.nombre_busqueda = normalizar(f'{usuario.nombre} {usuario.apellido}')[:201]
+    usuario.apellido_busqueda = normalizar(usuario.apellido)[:100]
+    usuario.rut_busqueda = normalizar_rut(usuario.rut)[:12]
+
+
+def filtro_prefijo(termino, ruta=''):
+    """
+    Q que encuentra a los usuarios cuyo nombre completo, apellido o RUT empieza
+    con `termino`. Los valores guardados ya están en minúsculas; se usa
+    `istartswith` porque en MySQL es un LIKE simple que aprovecha el índice.
+    Un RUT completo y válido se busca además por su cuerpo (igualdad sobre
+    el índice único). `ruta` antepone una relación, p. ej. 'usuario__'.
+    """
+    from .rut import cuerpo_o_none
+
+    texto = normalizar(termino)
+    filtro = Q(**{f'{ruta}nombre_busqueda__istartswith': texto}) | Q(**{f'{ruta}apellido_busqueda__istartswith': texto})
+    rut = normalizar_rut(termino)
+    if rut[:1].isdigit():
+        filtro |= Q(**{f'{ruta}rut_busqueda__istartswith': rut})
+        cuerpo = cuerpo_o_none(rut)
+        if cuerpo is not None:
+            filtro |= Q(**{f'{ruta}rut_cuerpo': cuerpo})
+    return filtro
+
+
+def palabras(texto):
+    """'Diseño UX/UI' -> ['diseno', 'ux', 'ui']."""
+    return re.findall(r'[a-z0-9]+', normalizar(texto))
+
+
+def documento(usuario):
+    """Texto de búsqueda del directorio: nombre, apellido, empresa, rubro y lo que busca."""
+    rubro = usuario.rubro_otro if usuario.rubro == 'otro' else usuario.get_rubro_display()
+    partes = (usuario.nombre, usuario.apellido, usuario.nombre_empresa, rubro, usuario.buscando)
+    return ' '.join(palabras(' '.join(p for p in partes if p)))
+
+
+def consulta_booleana(termino):
+    """'Diseño grá' -> '+diseno* +gra*', para MATCH ... AGAINST en modo booleano."""
+    return ' '.join(f'+{p}*' for p in palabras(termino)[:MAX_PALABRAS])
+
+
+class IndiceInvertido:
+    """
+    Palabra -> ids de usuario, con las palabras ordenadas para expandir
+    prefijos con `bisect`. Se construye al primer uso y lo mantienen las
+    señales de `Usuario`; si otro proceso cambió documentos (versión en la
+    caché distinta), se reconstruye antes de consultar.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.documentos = {}
+        self.ids_por_palabra = defaultdict(set)
+        self.palabras = []
+
+    def _agregar(self, usuario_id, texto):
+        unicas = frozenset(texto.split())
+        self.documentos[usuario_id] = unicas
+        for palabra in unicas:
+            if palabra not in self.ids_por_palabra:
+                bisect.insort(self.palabras, palabra)
+            self.ids_por_palabra[palabra].add(usuario_id)
+
+    def _quitar(self, usuario_id):
+        for palabra in self.documentos.pop(usuario_id, ()):
+            ids = self.ids_por_palabra[palabra]
+            ids.discard(usuario_id)
+            if not ids:
+                del self.ids_por_palabra[palabra]
+                del self.palabras[bisect.bisect_left(self.palabras, palabra)]
+
+    def _construir(self):
+        from .models import Usuario
+
+        cache.add(CLAVE_VERSION, 0, None)
+        version = cache.get(CLAVE_VERSION)
+        self.documentos, self.ids_por_palabra, self.palabras = {}, defaultdict(set), []
+        for usuario_id, texto in Usuario.objects.values_list('id', 'documento_busqueda').iterator(chunk_size=2000):
+            self._agregar(usuario_id, texto)
+        self.version = version
+
+    def actualizar(self, usuario_id, texto=None):
+        """Reemplaza (o quita, si `texto` es None) el documento de un usuario."""
+        with self.lock:
+            cache.add(CLAVE_VERSION, 0, None)
+            try:
+                nueva = cache.incr(CLAVE_VERSION)
+            except ValueError:
+                nueva = None
+            if self.version is None:
+                return
+            if nueva != self.version + 1:
+                # Otro proceso también escribió: se reconstruye en la próxima consulta.
+                self.version = None
+                return
+            self._quitar(usuario_id)
+            if texto is not None:
+                self._agregar(usuario_id, texto)
+            self.version = nueva
+
+    def _expandir(self, prefijo):
+        inicio = bisect.bisect_left(self.palabras, prefijo)
+        fin = bisect.bisect_left(self.palabras, prefijo + '\uffff', inicio)
+        return self.palabras[inicio:fin]
+
+    def puntajes(self, termino):
+        """
+        {usuario_id: puntaje} de los documentos que tienen todas las palabras
+        del término como prefijo. Cada palabra suma su idf, el doble si
+        coincide entera.
+        """
+        consulta = palabras(termino)[:MAX_PALABRAS]
+        if not consulta:
+            return {}
+        with self.lock:
+            if self.version is None or cache.get(CLAVE_VERSION) != self.version:
+                self._construir()
+            total = len(self.documentos) or 1
+            # Por palabra de la consulta: peso de cada palabra del índice que la tiene de prefijo.
+            pesos = []
+            for palabra in consulta:
+                pesos.append({
+                    encontrada: math.log(1 + total / len(self.ids_por_palabra[encontrada])) * (2 if encontrada == palabra else 1)
+                    for encontrada in self._expandir(palabra)
+                })
+            # Candidatos: intersección de los ids, partiendo del grupo más chico.
+            grupos = sorted(
+                (set().union(*(self.ids_por_palabra[e] for e in peso)) for peso in pesos), key=len,
+            )
+            candidatos = grupos[0].intersection(*grupos[1:])
+            resultado = dict.fromkeys(candidatos, 0.0)
+            for peso in pesos:
+                # De menor a mayor peso: en cada documento queda la mejor coincidencia.
+                mejor = {}
+                for encontrada in sorted(peso, key=peso.get):
+                    mejor.update(dict.fromkeys(self.ids_por_palabra[encontrada] & candidatos, peso[encontrada]))
+                for usuario_id, puntos in mejor.items():
+                    resultado[usuario_id] += puntos
+            return resultado
+
+
+indice_local = IndiceInvertido()
+
+
+def usa_fulltext():
+    return connection.vendor == 'mysql'
+
+
+def buscar(queryset, termino):
+    """
+    Filtra `queryset` (de `Usuario`) a los que coinciden con `termino`, lo
+    anota con `relevancia` y lo ordena de mayor a menor.
+    """
+    sin_resultados = queryset.annotate(relevancia=Value(0.0, output_field=FloatField())).none()
+    if usa_fulltext():
+        consulta = consulta_booleana(termino)
+        if not consulta:
+            return sin_resultados
+        relevancia = RawSQL('MATCH (documento_busqueda) AGAINST (%s IN BOOLEAN MODE)', [consulta], output_field=FloatField())
+        return queryset.annotate(relevancia=relevancia).filter(relevancia__gt=0).order_by('-relevancia', 'id')
+
+    puntajes = indice_local.puntajes(termino)
+    # Los mejores que además cumplen los filtros del queryset, en tandas.
+    ordenados = sorted(puntajes, key=lambda i: (-puntajes[i], i))
+    elegidos = []
+    for inicio in range(0, len(ordenados), MAX_RESULTADOS_LOCAL):
+        tanda = ordenados[inicio:inicio + MAX_RESULTADOS_LOCAL]
+        validos = set(queryset.filter(id__in=tanda).values_list('id', flat=True))
+        elegidos += [i for i in tanda if i in validos]
+        if len(elegidos) >= MAX_RESULTADOS_LOCAL:
+            break
+    elegidos = elegidos[:MAX_RESULTADOS_LOCAL]
+    if not elegidos:
+        return sin_resultados
+    por_puntaje = defaultdict(list)
+    for usuario_id in elegidos:
+        por_puntaje[round(puntajes[usuario_id], 4)].append(usuario_id)
+    relevancia = Case(
+        *(When(id__in=ids, then=Value(puntaje)) for puntaje, ids in por_puntaje.items()),
+        default=Value(0.0), output_field=FloatField(),
+    )
+    return queryset.filter(id__in=elegidos).annotate(relevancia=relevancia).order_by('-relevancia', 'id')
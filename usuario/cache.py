@@ -0,0 +1,109 @@
+"""
+Cachés de la app usuario.
+
+Usuario de sesión entre peticiones: cada usuario tiene una "versión" en la caché. El objeto `Usuario` se guarda junto
+a la versión con la que fue leído; si la versión actual no coincide, la entrada
+se descarta y se vuelve a leer desde la base de datos. Las señales de `Usuario`
+cambian la versión en cada guardado o eliminación, por lo que revocar un rol
+tiene efecto inmediato sin esperar a que expire nada.
+
+El objeto en caché puede estar desfasado respecto de la base (p. ej.
+`cantidad_asistencias` cambia con UPDATE masivos), así que quien lo guarde
+debe hacerlo con `update_fields`.
+
+El backend es el `CACHES['default']` de Django: memoria local con un solo worker,
+archivos o Redis cuando hay varios workers.
+"""
+import uuid
+
+from django.core.cache import cache
+
+TIEMPO_PRINCIPAL = 60 * 60  # segundos
+
+
+def _clave_version(usuario_id):
+    return f'usuario:{usuario_id}:version'
+
+
+def _clave_principal(usuario_id):
+    return f'usuario:{usuario_id}:principal'
+
+
+def invalidar_usuario(usuario_id):
+    """Cambia la versión del usuario para que su próxima lectura vaya a la base de datos."""
+    cache.set(_clave_version(usuario_id), uuid.uuid4().hex, None)
+
+
+def invalidar_usuarios(usuario_ids):
+    """Igual que `invalidar_usuario`, para actualizaciones masivas que no disparan señales."""
+    cache.set_many({_clave_version(uid): uuid.uuid4().hex for uid in usuario_ids}, None)
+
+
+def obtener_usuario(usuario_id):
+    """
+    Devuelve el `Usuario` con ese id usando la caché, o None si no existe.
+    Un acierto en caché no consulta la base de datos.
+    """
+    from .models import Usuario
+
+    clave_version = _clave_version(usuario_id)
+    clave_principal = _clave_principal(usuario_id)
+    valores = cache.get_many([clave_version, clave_principal])
+    version = valores.get(clave_version)
+    guardado = valores.get(clave_principal)
+
+    if version is not None and guardado is not None and guardado[0] == version:
+        return guardado[1]
+
+    if version is None:
+        # Solo se crea la versión si nadie la creó antes; así no se pisa una
+        # invalidación concurrente.
+        cache.add(clave_version, uuid.uuid4().hex, None)
+        version = cache.get(clave_version)
+
+    try:
+        # El hash de la contraseña no se guarda en la caché compartida; quien lo
+        # necesite (cambiar contraseña, salir del tótem) lo lee de la base al usarlo.
+        usuario = Usuario.objects.defer('password').get(id=usuario_id)
+    except Usuario.DoesNotExist:
+        return None
+
+    # Si la versión cambió mientras leíamos, la entrada guardada nunca coincidirá.
+    cache.set(clave_principal, (version, usuario), TIEMPO_PRINCIPAL)
+    return usuario
+
+
+# --- Páginas públicas (inicio y landing de reuniones) ---
+#
+# Todas las entradas llevan la "generación" pública en la clave. Las señales de
+# Reunion, RespuestaEncuesta y Usuario (alta/baja) la cambian y con eso quedan
+# obsoletas de una vez la página completa de los anónimos y los fragmentos de
+# datos compartidos que usan los usuarios con sesión.
+
+TIEMPO_PAGINAS_PUBLICAS = 5 * 60  # segundos; acota el desfase de "próximas reuniones"
+_CLAVE_GENERACION_PUBLICA = 'publico:generacion'
+
+
+def invalidar_paginas_publicas():
+    cache.set(_CLAVE_GENERACION_PUBLICA, uuid.uuid4().hex, None)
+
+
+def clave_publica(nombre):
+    generacion = cache.get(_CLAVE_GENERACION_PUBLICA)
+    if generacion is None:
+        cache.add(_CLAVE_GENERACION_PUBLICA, uuid.uuid4().hex, None)
+        generacion = cache.get(_CLAVE_GENERACION_PUBLICA)
+    return f'publico:{generacion}:{nombre}'
+
+
+def fragmento_publico(nombre, construir):
+    """
+    Devuelve los datos compartidos `nombre`, calculándolos con `construir()`
+    solo si no están en caché para la generación actual.
+    """
+    clave = clave_publica(nombre)
+    valor = cache.get(clave)
+    if valor is None:
+        valor = construir()
+        cache.set(clave, valor, TIEMPO_PAGINAS_PUBLICAS)
+    return valor
@@ -1,11 +1,12 @@
-from paneladm.models import SoporteTicket
+from paneladm.cache import tickets_abiertos
 
 def notificaciones_admin(request):
     """
     Añade el número de tickets de soporte abiertos al contexto
-    si el usuario es un administrador.
+    si el usuario es un administrador o ayudante.
+    El contador vive en la caché, por lo que no cuesta consultas por página.
     """
-    if hasattr(request, 'user_is_admin') and request.user_is_admin:
-        tickets_abiertos = SoporteTicket.objects.filter(estado='abierto').count()
-        return {'tickets_abiertos_count': tickets_abiertos}
-    return {}
\ No newline at end of file
+    usuario = getattr(request, 'usuario', None)
+    if usuario and (usuario.es_admin or usuario.es_ayudante):
+        return {'tickets_abiertos_count': tickets_abiertos()}
+    return {}
@@ -0,0 +1,119 @@
+"""
+Directorio de miembros paginado por cursor (keyset).
+
+En vez de OFFSET, cada página pide las filas que vienen *después* de la última
+de la anterior según el orden del listado, así que cualquier página cuesta lo
+mismo que la primera. El cursor lleva los valores de orden de esa última fila
+(JSON en base64, opaco para el cliente). Solo se leen las columnas que muestra
+la tarjeta.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.urls import reverse
+
+from .busqueda import buscar
+from .models import RUBRO_CHOICES, Usuario
+
+POR_PAGINA = 24
+
+# (campo, descendente), terminando siempre en el id para que el orden sea total.
+ORDEN_MIEMBROS = (('destacado', True), ('nombre', False), ('id', False))
+ORDEN_ADMIN = (('destacado', True), ('perfil_publico', True), ('nombre', False), ('id', False))
+ORDEN_BUSQUEDA = (('relevancia', True), ('id', False))
+
+CAMPOS_TARJETA = ('id', 'nombre', 'apellido', 'rubro', 'rubro_otro', 'nombre_empresa', 'foto', 'perfil_publico', 'destacado')
+NOMBRES_RUBRO = {valor: nombre for _, grupo in RUBRO_CHOICES for valor, nombre in grupo}
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def leer_cursor(cursor, orden):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise CursorInvalido(cursor)
+    if not isinstance(valores, list) or len(valores) != len(orden):
+        raise CursorInvalido(cursor)
+    return valores
+
+
+def despues_de(orden, valores):
+    """
+    Q de las filas que van después de `valores` en `orden`:
+    (a > x) OR (a = x AND b > y) OR ..., con < en los campos descendentes.
+    """
+    filtro, iguales = Q(), Q()
+    for (campo, descendente), valor in zip(orden, valores):
+        filtro |= iguales & Q(**{f'{campo}__{"lt" if descendente else "gt"}': valor})
+        iguales &= Q(**{campo: valor})
+    return filtro
+
+
+def filtrar_despues(queryset, orden, cursor):
+    """`queryset` desde la fila siguiente a la del cursor; `CursorInvalido` si no sirve."""
+    try:
+        return queryset.filter(despues_de(orden, leer_cursor(cursor, orden)))
+    except (TypeError, ValueError, ValidationError):
+        raise CursorInvalido(cursor)
+
+
+def miembros_visibles(usuario_actual):
+    """Miembros que ve `usuario_actual` y el orden en que se listan."""
+    miembros = Usuario.objects.filter(es_admin=False, es_ayudante=False, es_totem=False)
+    if usuario_actual.es_admin:
+        # El admin ve también los perfiles privados, después de los públicos.
+        return miembros, ORDEN_ADMIN
+    return miembros.filter(perfil_publico=True), ORDEN_MIEMBROS
+
+
+def tarjeta(fila):
+    """Lo que muestra la tarjeta de un miembro, a partir de una fila de `values()`."""
+    if fila['rubro'] == 'otro':
+        rubro = fila['rubro_otro'] or 'Otro'
+    else:
+        rubro = NOMBRES_RUBRO.get(fila['rubro'], fila['rubro'])
+    return {
+        'id': fila['id'],
+        'nombre': f"{fila['nombre']} {fila['apellido']}",
+        'rubro': rubro or '',
+        'empresa': fila['nombre_empresa'] or '',
+        'foto': Usuario._meta.get_field('foto').storage.url(fila['foto']) if fila['foto'] else None,
+        'perfil_publico': fila['perfil_publico'],
+        'destacado': fila['destacado'],
+        'url': reverse('perfil_publico', args=[fila['id']]),
+    }
+
+
+def pagina(usuario_actual, termino='', rubro='', cursor=None):
+    """
+    Devuelve (tarjetas, cursor siguiente o None). Con `termino` el orden es por
+    relevancia (ver usuario/busqueda.py). Lanza `CursorInvalido` si el cursor
+    no corresponde a este listado.
+    """
+    miembros, orden = miembros_visibles(usuario_actual)
+    if rubro:
+        miembros = miembros.filter(rubro__iexact=rubro)
+    if termino.strip():
+        miembros, orden = buscar(miembros, termino), ORDEN_BUSQUEDA
+    else:
+        miembros = miembros.order_by(*(f'-{campo}' if descendente else campo for campo, descendente in orden))
+    if cursor:
+        miembros = filtrar_despues(miembros, orden, cursor)
+
+    campos = CAMPOS_TARJETA + (('relevancia',) if orden is ORDEN_BUSQUEDA else ())
+    filas = list(miembros.values(*campos)[:POR_PAGINA + 1])
+    siguiente = None
+    if len(filas) > POR_PAGINA:
+        filas = filas[:POR_PAGINA]
+        siguiente = codificar_cursor([filas[-1][campo] for campo, _ in orden])
+    return [tarjeta(fila) for fila in filas], siguiente
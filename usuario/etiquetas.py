@@ -0,0 +1,254 @@
+"""
+Etiquetas (credenciales) de los usuarios renderizadas como PNG y PDF.
+
+La etiqueta de 100 x 50 mm se dibuja con Pillow a partir de datos simples
+(`datos_etiqueta`), así se puede dibujar en otros procesos. El resultado se
+guarda en MEDIA_ROOT/etiquetas/v<VERSION_ETIQUETA>/<id>-<huella>.png|pdf: la
+huella resume todo lo que se imprime (nombre, rubro, asistencias, QR...), de
+modo que un dato nuevo genera otro archivo y uno ya dibujado se reutiliza.
+
+`preparar_etiquetas` dibuja por adelantado las de los interesados de una
+reunión en un pool de procesos y arma hojas A4 con 10 etiquetas para
+imprimirlas antes del evento; en la puerta solo se reimprimen las excepciones.
+"""
+import glob
+import hashlib
+import os
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import django
+import qrcode
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+
+from .qr import contenido_qr
+
+# Sube este número si cambia el diseño, para no reutilizar etiquetas viejas.
+VERSION_ETIQUETA = 1
+
+DPI = 300
+ANCHO, ALTO = 1181, 591  # 100 x 50 mm
+MARGEN = 45
+HOJA_ANCHO, HOJA_ALTO = 2480, 3508  # A4
+COLUMNAS, FILAS = 2, 5
+AZUL = (0, 123, 255)
+GRIS = (85, 85, 85)
+TIPOS_ETIQUETA = {'png': 'image/png', 'pdf': 'application/pdf'}
+
+
+def carpeta_etiquetas():
+    return os.path.join(settings.MEDIA_ROOT, 'etiquetas', f'v{VERSION_ETIQUETA}')
+
+
+def datos_etiqueta(usuario):
+    """Todo lo que se imprime en la etiqueta, en tipos simples."""
+    return {
+        'id': usuario.id,
+        'nombre': usuario.nombre,
+        'apellido': usuario.apellido,
+        'rubro': usuario.get_rubro_real_display or '',
+        'asistencias': usuario.cantidad_asistencias,
+        'emojis': usuario.etiqueta_emojis or '',
+        'qr': contenido_qr(usuario.id),
+        'logo': os.path.join(settings.BASE_DIR, 'static', 'img', 'logo.jpg'),
+        'fuente': getattr(settings, 'ETIQUETAS_FUENTE', None),
+        'fuente_emoji': getattr(settings, 'ETIQUETAS_FUENTE_EMOJI', None),
+    }
+
+
+def huella(datos):
+    base = '\x1f'.join(f'{clave}={datos[clave]}' for clave in sorted(datos))
+    return hashlib.sha1(base.encode()).hexdigest()[:16]
+
+
+def ruta_etiqueta(datos, formato='png'):
+    return os.path.join(carpeta_etiquetas(), f"{datos['id']}-{huella(datos)}.{formato}")
+
+
+def _fuente(datos, tamano):
+    if datos['fuente']:
+        return ImageFont.truetype(datos['fuente'], tamano)
+    return ImageFont.load_default(size=tamano)
+
+
+def _texto(datos, texto):
+    """La fuente incluida en Pillow solo trae ASCII: sin ETIQUETAS_FUENTE se quitan los tildes."""
+    if datos['fuente']:
+        return texto
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+
+
+def _ajustar(draw, texto, datos, tamano, ancho):
+    """La fuente más grande (hasta `tamano`) con la que `texto` cabe en `ancho`."""
+    while tamano > 20:
+        fuente = _fuente(datos, tamano)
+        if draw.textlength(texto, font=fuente) <= ancho:
+            return fuente
+        tamano -= 4
+    return _fuente(datos, tamano)
+
+
+@lru_cache(maxsize=4)
+def _logo(ruta, lado):
+    """El logo ya reducido; se carga una vez por proceso."""
+    try:
+        with Image.open(ruta) as logo:
+            logo = logo.convert('RGB')
+    except OSError:
+        return None
+    logo.thumbnail((lado, lado))
+    return logo
+
+
+def _calendario(draw, x, y, lado):
+    """Ícono de calendario con check, como el de la versión HTML."""
+    draw.rounded_rectangle((x, y + lado * 0.12, x + lado, y + lado), radius=lado * 0.12, outline=AZUL, width=6)
+    draw.rectangle((x, y + lado * 0.12, x + lado, y + lado * 0.35), fill=AZUL)
+    draw.line((x + lado * 0.28, y, x + lado * 0.28, y + lado * 0.2), fill=AZUL, width=8)
+    draw.line((x + lado * 0.72, y, x + lado * 0.72, y + lado * 0.2), fill=AZUL, width=8)
+    draw.line(
+        (x + lado * 0.28, y + lado * 0.67, x + lado * 0.45, y + lado * 0.82, x + lado * 0.74, y + lado * 0.5),
+        fill=AZUL, width=8, joint='curve',
+    )
+
+
+def dibujar_etiqueta(datos):
+    """Devuelve la etiqueta como imagen RGB. No usa la base de datos."""
+    imagen = Image.new('RGB', (ANCHO, ALTO), 'white')
+    draw = ImageDraw.Draw(imagen)
+
+    lado_logo = 330
+    logo = _logo(datos['logo'], lado_logo)
+    if logo:
+        imagen.paste(logo, (MARGEN, (ALTO - logo.height) // 2))
+
+    lado_qr = 270
+    qr = qrcode.make(datos['qr'], border=1).get_image().convert('RGB').resize((lado_qr, lado_qr), Image.NEAREST)
+    imagen.paste(qr, (ANCHO - MARGEN - lado_qr, ALTO - MARGEN - lado_qr))
+
+    x = MARGEN + lado_logo + 45
+    ancho_texto = ANCHO - MARGEN - lado_qr - 20 - x
+    y = MARGEN + 10
+    for linea in (_texto(datos, datos['nombre']), _texto(datos, datos['apellido'])):
+        fuente = _ajustar(draw, linea, datos, 62, ancho_texto)
+        draw.text((x, y), linea, font=fuente, fill='black', stroke_width=1, stroke_fill='black')
+        y += 74
+    rubro = _texto(datos, datos['rubro'])
+    if rubro:
+        draw.text((x, y + 6), rubro, font=_ajustar(draw, rubro, datos, 40, ancho_texto), fill=GRIS)
+    y += 70
+
+    _calendario(draw, x, y + 8, 62)
+    draw.text((x + 80, y), str(datos['asistencias']), font=_fuente(datos, 75), fill=AZUL, stroke_width=2, stroke_fill=AZUL)
+
+    # Los emojis necesitan una fuente de emojis; sin ella la página HTML los superpone.
+    if datos['emojis'] and datos['fuente_emoji']:
+        fuente = ImageFont.truetype(datos['fuente_emoji'], 109)
+        capa = Image.new('RGBA', (int(draw.textlength(datos['emojis'], font=fuente)) + 20, 140), (255, 255, 255, 0))
+        ImageDraw.Draw(capa).text((0, 0), datos['emojis'], font=fuente, embedded_color=True)
+        capa.thumbnail((ancho_texto, 70))
+        imagen.paste(capa, (x, ALTO - MARGEN - capa.height), capa)
+    return imagen
+
+
+def renderizar_etiqueta(datos):
+    """
+    Dibuja y guarda el PNG y el PDF de la etiqueta, borrando las versiones
+    anteriores del mismo usuario. Devuelve la ruta del PNG.
+    """
+    png, pdf = ruta_etiqueta(datos, 'png'), ruta_etiqueta(datos, 'pdf')
+    os.makedirs(os.path.dirname(png), exist_ok=True)
+    imagen = dibujar_etiqueta(datos)
+    for ruta, formato, opciones in ((png, 'PNG', {'compress_level': 3, 'dpi': (DPI, DPI)}), (pdf, 'PDF', {})):
+        temporal = f'{ruta}.{os.getpid()}.tmp'
+        imagen.save(temporal, format=formato, resolution=DPI, **opciones)
+        os.replace(temporal, ruta)
+    for anterior in glob.glob(os.path.join(os.path.dirname(png), f"{datos['id']}-*")):
+        if anterior not in (png, pdf) and not anterior.endswith('.tmp'):
+            try:
+                os.remove(anterior)
+            except FileNotFoundError:
+                pass
+    return png
+
+
+def etiqueta_png(usuario):
+    """Ruta del PNG de la etiqueta del usuario, dibujándola solo si no existe."""
+    datos = datos_etiqueta(usuario)
+    ruta = ruta_etiqueta(datos)
+    if not os.path.exists(ruta):
+        renderizar_etiqueta(datos)
+    return ruta
+
+
+def _iniciar_proceso():
+    # Con el método "spawn" (Windows, macOS) los procesos hijos parten sin Django configurado.
+    django.setup()
+
+
+def pre_renderizar(usuarios, procesos=None):
+    """
+    Dibuja en `procesos` procesos (0: en este) las etiquetas que faltan.
+    Devuelve (datos de todas, cuántas se dibujaron).
+    """
+    todos = [datos_etiqueta(u) for u in usuarios]
+    faltantes = [d for d in todos if not os.path.exists(ruta_etiqueta(d))]
+    if faltantes and procesos != 0:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+            list(pool.map(renderizar_etiqueta, faltantes, chunksize=max(1, len(faltantes) // (4 * (procesos or os.cpu_count() or 1)))))
+    else:
+        for datos in faltantes:
+            renderizar_etiqueta(datos)
+    return todos, len(faltantes)
+
+
+def hoja_etiquetas(lista_datos, destino):
+    """
+    Arma un PDF A4 con COLUMNAS x FILAS etiquetas por página a partir de los
+    PNG ya dibujados (dibuja los que falten) y lo escribe en `destino`.
+    Devuelve la cantidad de páginas.
+    """
+    por_hoja = COLUMNAS * FILAS
+    x0 = (HOJA_ANCHO - COLUMNAS * ANCHO) // 2
+    y0 = (HOJA_ALTO - FILAS * ALTO) // 2
+    paginas = []
+    for inicio in range(0, len(lista_datos), por_hoja):
+        pagina = Image.new('RGB', (HOJA_ANCHO, HOJA_ALTO), 'white')
+        draw = ImageDraw.Draw(pagina)
+        for i, datos in enumerate(lista_datos[inicio:inicio + por_hoja]):
+            ruta = ruta_etiqueta(datos)
+            if not os.path.exists(ruta):
+                ruta = renderizar_etiqueta(datos)
+            x = x0 + (i % COLUMNAS) * ANCHO
+            y = y0 + (i // COLUMNAS) * ALTO
+            with Image.open(ruta) as etiqueta:
+                pagina.paste(etiqueta, (x, y))
+            draw.rectangle((x, y, x + ANCHO - 1, y + ALTO - 1), outline=(200, 200, 200), width=2)  # guía de corte
+        paginas.append(pagina)
+    if not paginas:
+        return 0
+    os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+    temporal = f'{destino}.tmp'
+    paginas[0].save(temporal, format='PDF', resolution=DPI, save_all=True, append_images=paginas[1:])
+    os.replace(temporal, destino)
+    return len(paginas)
+
+
+def ruta_hoja_reunion(reunion_id):
+    return os.path.join(settings.MEDIA_ROOT, 'etiquetas', 'hojas', f'reunion_{reunion_id}.pdf')
+
+
+def preparar_reunion(reunion, procesos=None, con_hoja=True):
+    """
+    Dibuja las etiquetas que falten de los interesados de la reunión y, si se
+    pide, arma la hoja en ruta_hoja_reunion, en orden alfabético por apellido.
+    Devuelve (interesados, etiquetas dibujadas, páginas de la hoja).
+    """
+    interesados = reunion.interesados.order_by('apellido', 'nombre', 'id').only(
+        'id', 'nombre', 'apellido', 'rubro', 'rubro_otro', 'cantidad_asistencias', 'etiqueta_emojis'
+    )
+    todos, dibujadas = pre_renderizar(interesados, procesos)
+    paginas = hoja_etiquetas(todos, ruta_hoja_reunion(reunion.id)) if con_hoja else 0
+    return len(todos), dibujadas, paginas
@@ -0,0 +1,141 @@
+"""
+Cuántos usuarios hay por rubro, para los filtros del directorio y del panel.
+
+Se cuentan en tres alcances:
+
+- `directorio`: los miembros que ve cualquier usuario (sin roles, perfil público).
+- `directorio_admin`: los miembros que ve el admin en el directorio (también los privados).
+- `panel`: todos los usuarios (Gestión de Usuarios).
+
+Cada alcance vive en la caché como una lista con sus rubros más un contador
+por rubro. Las señales de `Usuario` suman y restan según cómo estaba el
+usuario al leerlo (`post_init`) y cómo quedó al guardarlo, así que mostrar un
+filtro no consulta la base. Si falta algo en la caché (o el cambio no se
+puede ajustar, p. ej. un usuario que no se leyó completo), el alcance se
+vuelve a contar con un GROUP BY. Todo caduca cada `TIEMPO_FACETAS`, lo que
+corrige los cambios que no pasan por las señales (`update()`, `bulk_create`).
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+ALCANCES = ('directorio', 'directorio_admin', 'panel')
+TIEMPO_FACETAS = 30 * 60  # segundos
+CAMPOS = ('rubro', 'es_admin', 'es_ayudante', 'es_totem', 'perfil_publico')
+
+
+def _clave_rubros(alcance):
+    return f'facetas:{alcance}:rubros'
+
+
+def _clave_total(alcance, rubro):
+    return f'facetas:{alcance}:n:' + hashlib.sha1(rubro.encode()).hexdigest()[:16]
+
+
+def filtro_alcance(alcance):
+    """Q de los usuarios que cuentan en `alcance`."""
+    if alcance == 'panel':
+        return Q()
+    filtro = Q(es_admin=False, es_ayudante=False, es_totem=False)
+    if alcance == 'directorio':
+        filtro &= Q(perfil_publico=True)
+    return filtro
+
+
+def alcances_de(estado):
+    """Alcances en los que cuenta un usuario, dado un dict con `CAMPOS`."""
+    if not estado['rubro']:
+        return ()
+    alcances = ['panel']
+    if not (estado['es_admin'] or estado['es_ayudante'] or estado['es_totem']):
+        alcances.append('directorio_admin')
+        if estado['perfil_publico']:
+            alcances.append('directorio')
+    return tuple(alcances)
+
+
+def estado_de(usuario):
+    """Los `CAMPOS` del usuario, o None si alguno no se leyó (campo diferido)."""
+    if any(campo not in usuario.__dict__ for campo in CAMPOS):
+        return None
+    return {campo: usuario.__dict__[campo] for campo in CAMPOS}
+
+
+def contar(alcance):
+    """Cuenta el alcance en la base de datos y lo guarda. Devuelve {rubro: total}."""
+    from .models import Usuario
+
+    totales = dict(
+        Usuario.objects.filter(filtro_alcance(alcance)).exclude(rubro__isnull=True).exclude(rubro='')
+        .order_by().values_list('rubro').annotate(n=Count('id'))
+    )
+    valores = {_clave_total(alcance, rubro): n for rubro, n in totales.items()}
+    valores[_clave_rubros(alcance)] = sorted(totales)
+    cache.set_many(valores, TIEMPO_FACETAS)
+    return totales
+
+
+def invalidar(alcances=ALCANCES):
+    cache.delete_many([_clave_rubros(alcance) for alcance in alcances])
+
+
+def totales(alcance):
+    """{rubro: total} del alcance, desde la caché (dos lecturas) o contándolo si falta."""
+    rubros = cache.get(_clave_rubros(alcance))
+    if rubros is None:
+        return contar(alcance)
+    claves = {_clave_total(alcance, rubro): rubro for rubro in rubros}
+    guardados = cache.get_many(claves)
+    if len(guardados) != len(claves):
+        return contar(alcance)
+    return {claves[clave]: n for clave, n in guardados.items()}
+
+
+def ajustar(antes, despues):
+    """
+    Mueve los contadores de un usuario que pasó de `antes` a `despues` (dicts
+    de `estado_de`, o None para "no existía"/"ya no existe").
+    """
+    cambios = {}
+    if antes:
+        for alcance in alcances_de(antes):
+            cambios[(alcance, antes['rubro'])] = cambios.get((alcance, antes['rubro']), 0) - 1
+    if despues:
+        for alcance in alcances_de(despues):
+            cambios[(alcance, despues['rubro'])] = cambios.get((alcance, despues['rubro']), 0) + 1
+
+    perdidos = set()
+    for (alcance, rubro), delta in cambios.items():
+        if not delta or alcance in perdidos:
+            continue
+        rubros = cache.get(_clave_rubros(alcance))
+        if rubros is None:
+            continue  # Nadie lo ha contado todavía: la próxima lectura lo cuenta.
+        try:
+            if rubro not in rubros:
+                raise ValueError(rubro)
+            cache.incr(_clave_total(alcance, rubro), delta)
+        except ValueError:
+            # Rubro nuevo en el alcance o contador caducado: se vuelve a contar.
+            perdidos.add(alcance)
+    if perdidos:
+        invalidar(perdidos)
+
+
+def opciones_rubro(alcance):
+    """
+    Opciones del filtro de rubros con su total, sin los vacíos: lista de
+    (valor, nombre, total) en el orden de RUBRO_CHOICES. Los valores que no
+    están en RUBRO_CHOICES van al final.
+    """
+    from .models import RUBRO_CHOICES
+
+    cuenta = totales(alcance)
+    opciones = []
+    for _, grupo in RUBRO_CHOICES:
+        for valor, nombre in grupo:
+            if cuenta.get(valor):
+                opciones.append((valor, nombre, cuenta.pop(valor)))
+    opciones += [(valor, valor, n) for valor, n in sorted(cuenta.items()) if n > 0]
+    return opciones
@@ -2,38 +2,20 @@
 
 from django import forms
 from .models import Usuario
+from .rut import RutInvalido, cuerpo_o_none, rut_canonico, separar_rut
 from paneladm.models import RespuestaEncuesta
 import re
 
 def validate_rut(rut):
     """
     Valida un RUT chileno.
-    Retorna (True, "RUT limpio") si es válido, o (False, "Mensaje de error") si no lo es.
+    Retorna (True, "RUT canónico") si es válido, o (False, "Mensaje de error") si no lo es.
+    El RUT canónico va sin puntos ni guion (ver usuario/rut.py).
     """
-    rut_limpio = str(rut).upper().replace(".", "").replace("-", "")
-    
-    if not rut_limpio[:-1].isdigit() or not (rut_limpio[-1].isdigit() or rut_limpio[-1] == 'K'):
-        return False, "El RUT debe contener solo números y, si corresponde, una 'K' al final."
-
-    # Si el RUT viene formateado (ej: 12.345.678-9), el último caracter es el DV.
-    # Si viene limpio (ej: 123456789), también.
-    body = rut_limpio[:-1]
-    dv = rut_limpio[-1]
-
     try:
-        reversed_body = map(int, reversed(body))
-        factors = [2, 3, 4, 5, 6, 7] * (len(body) // 6 + 1)
-        s = sum(digit * factor for digit, factor in zip(reversed_body, factors))
-        res = 11 - (s % 11)
-        
-        calculated_dv = str(res) if res < 10 else ('0' if res == 11 else 'K')
-
-        if dv == calculated_dv:
-            return True, rut_limpio
-        else:
-            return False, "El RUT ingresado no es válido (dígito verificador incorrecto)."
-    except ValueError:
-        return False, "Formato de RUT incorrecto."
+        return True, rut_canonico(*separar_rut(rut))
+    except RutInvalido as error:
+        return False, str(error)
 
 class LoginForm(forms.Form):
     email = forms.EmailField(label="Correo Electrónico", widget=forms.EmailInput(attrs={'class': 'form-control', 'autocomplete': 'email'}))
@@ -70,7 +52,7 @@ class UsuarioForm(forms.ModelForm):
             raise forms.ValidationError(message_or_rut)
 
         # Verificar si el RUT ya existe en la base de datos
-        if Usuario.objects.filter(rut=message_or_rut).exists():
+        if Usuario.objects.filter(rut_cuerpo=cuerpo_o_none(message_or_rut)).exists():
             raise forms.ValidationError("Ya existe un usuario con este RUT.")
 
         return message_or_rut
@@ -138,9 +120,9 @@ class EditarUsuarioForm(forms.ModelForm):
         # Al editar, debemos excluir al propio usuario de la verificación de duplicados.
         # 'self.instance' es el objeto de usuario que se está editando.
         if self.instance:
-            if Usuario.objects.filter(rut=message_or_rut).exclude(pk=self.instance.pk).exists():
+            if Usuario.objects.filter(rut_cuerpo=cuerpo_o_none(message_or_rut)).exclude(pk=self.instance.pk).exists():
                 raise forms.ValidationError("Ya existe otro usuario con este RUT.")
-        elif Usuario.objects.filter(rut=message_or_rut).exists():
+        elif Usuario.objects.filter(rut_cuerpo=cuerpo_o_none(message_or_rut)).exists():
              raise forms.ValidationError("Ya existe un usuario con este RUT.")
 
         return message_or_rut
@@ -193,7 +175,7 @@ class AdminUsuarioForm(forms.ModelForm):
         is_valid, message_or_rut = validate_rut(rut)
         if not is_valid:
             raise forms.ValidationError(message_or_rut)
-        if Usuario.objects.filter(rut=message_or_rut).exclude(pk=self.instance.pk).exists():
+        if Usuario.objects.filter(rut_cuerpo=cuerpo_o_none(message_or_rut)).exclude(pk=self.instance.pk).exists():
             raise forms.ValidationError("Ya existe un usuario con este RUT.")
         return message_or_rut
 
@@ -244,7 +226,7 @@ class AdminCrearUsuarioForm(AdminUsuarioForm):
         is_valid, message_or_rut = validate_rut(rut)
         if not is_valid:
             raise forms.ValidationError(message_or_rut)
-        if Usuario.objects.filter(rut=message_or_rut).exists():
+        if Usuario.objects.filter(rut_cuerpo=cuerpo_o_none(message_or_rut)).exists():
             raise forms.ValidationError("Ya existe un usuario con este RUT.")
         return message_or_rut
 
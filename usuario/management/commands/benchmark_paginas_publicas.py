@@ -0,0 +1,106 @@
+import time
+from datetime import timedelta
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from paneladm.models import Reunion, Encuesta, RespuestaEncuesta
+from usuario.models import Usuario
+
+SIN_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+# Caché propia del benchmark: los datos sembrados se descartan al terminar y no
+# deben quedar (ni borrar nada) en la caché real de la aplicación.
+CACHE_BENCHMARK = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-paginas-publicas'},
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide peticiones/segundo de la portada y la landing de reuniones con y sin caché, "
+        "sobre un conjunto de datos de prueba que se descarta al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=200)
+        parser.add_argument('--usuarios', type=int, default=2000)
+        parser.add_argument('--reuniones', type=int, default=60)
+
+    def handle(self, *args, **options):
+        try:
+            with override_settings(CACHES=CACHE_BENCHMARK), transaction.atomic():
+                miembro = self.sembrar(options['usuarios'], options['reuniones'])
+                self.medir(miembro, options['peticiones'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def sembrar(self, n_usuarios, n_reuniones):
+        self.stdout.write(f"Sembrando {n_usuarios} usuarios y {n_reuniones} reuniones...")
+        Usuario.objects.bulk_create([
+            Usuario(
+                nombre=f'Bench{i}', apellido='Prueba', rut=f'9{i:08d}', email=f'bench{i}@example.com',
+                password='pbkdf2_sha256$bench', etiqueta_emojis='🚀',
+            )
+            for i in range(n_usuarios)
+        ])
+        # MySQL no devuelve los ids en bulk_create, así que se vuelven a leer.
+        usuarios = list(Usuario.objects.filter(email__startswith='bench').order_by('id'))
+        ahora = timezone.now()
+        Reunion.objects.bulk_create([
+            Reunion(
+                detalle=f'Reunión {i}', descripcion='Reunión de prueba ' * 20, ubicacion='Concepción',
+                fecha=ahora + timedelta(days=i - n_reuniones // 2),
+            )
+            for i in range(n_reuniones)
+        ])
+        reuniones = list(Reunion.objects.filter(detalle__startswith='Reunión ').order_by('id'))
+        for reunion in reuniones:
+            reunion.interesados.add(*usuarios[:50])
+        encuesta = Encuesta.objects.create(reunion=reuniones[0])
+        RespuestaEncuesta.objects.bulk_create([
+            RespuestaEncuesta(encuesta=encuesta, usuario=u, puntuacion=5, comentarios='¡Excelente!', destacado=True)
+            for u in usuarios[:20]
+        ])
+        return usuarios[0]
+
+    def medir(self, miembro, peticiones):
+        session = SessionStore()
+        session['usuario_id'] = miembro.id
+        session.save()
+
+        escenarios = [
+            ('inicio (anónimo)', reverse('inicio'), None),
+            ('inicio (con sesión)', reverse('inicio'), session.session_key),
+            ('landing reuniones', reverse('landing_reuniones'), None),
+        ]
+        for nombre, url, session_key in escenarios:
+            with override_settings(CACHES=SIN_CACHE):
+                antes = self.peticiones_por_segundo(url, session_key, peticiones)
+            cache.clear()
+            despues = self.peticiones_por_segundo(url, session_key, peticiones)
+            self.stdout.write(
+                f"{nombre:<22} sin caché: {antes:8.1f} req/s   con caché: {despues:8.1f} req/s   "
+                f"(x{despues / antes:.1f})"
+            )
+
+    def peticiones_por_segundo(self, url, session_key, peticiones):
+        client = Client(SERVER_NAME='localhost')
+        if session_key:
+            client.cookies['sessionid'] = session_key
+        client.get(url)  # calentamiento
+        inicio = time.perf_counter()
+        for _ in range(peticiones):
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+        return peticiones / (time.perf_counter() - inicio)
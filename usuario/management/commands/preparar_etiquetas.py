@@ -0,0 +1,36 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from paneladm.models import Reunion
+from usuario.etiquetas import preparar_reunion, ruta_hoja_reunion
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-renderiza las etiquetas (PNG y PDF) de los interesados de una reunión y arma la hoja A4 "
+        "para imprimirlas antes del evento. Las etiquetas ya dibujadas y sin cambios se reutilizan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('reunion_id', type=int)
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help="Procesos que dibujan las etiquetas. Con 0 se dibujan en el proceso principal.")
+        parser.add_argument('--sin-hoja', action='store_true', help="Solo dibuja las etiquetas, sin armar la hoja.")
+
+    def handle(self, *args, **options):
+        try:
+            reunion = Reunion.objects.get(id=options['reunion_id'])
+        except Reunion.DoesNotExist:
+            raise CommandError(f"No existe la reunión {options['reunion_id']}.")
+
+        inicio = time.monotonic()
+        total, dibujadas, paginas = preparar_reunion(reunion, options['procesos'], not options['sin_hoja'])
+        transcurrido = time.monotonic() - inicio
+        self.stdout.write(
+            f"{total} interesados: {dibujadas} etiquetas dibujadas, {total - dibujadas} reutilizadas "
+            f"({transcurrido:.1f}s)."
+        )
+        if paginas:
+            self.stdout.write(self.style.SUCCESS(f"Hoja de {paginas} página(s) en {ruta_hoja_reunion(reunion.id)}"))
@@ -0,0 +1,77 @@
+import time
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from usuario.cache import invalidar_usuarios
+from usuario.models import Usuario, TrabajoQR
+from usuario.qr import generar_qr_png, nombre_archivo_qr
+
+MAX_INTENTOS = 5
+ESPERA_BASE = 30  # segundos; se duplica en cada intento
+ESPERA_MAXIMA = 60 * 60
+
+
+def espera_reintento(intentos):
+    return timedelta(seconds=min(ESPERA_BASE * 2 ** (intentos - 1), ESPERA_MAXIMA))
+
+
+class Command(BaseCommand):
+    help = "Worker que genera los códigos QR pendientes de la cola TrabajoQR."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50, help="Trabajos por transacción.")
+        parser.add_argument('--intervalo', type=float, default=2.0, help="Segundos de espera cuando la cola está vacía.")
+        parser.add_argument('--una-vez', action='store_true', help="Vacía la cola y termina.")
+
+    def handle(self, *args, **options):
+        while True:
+            procesados = self.procesar_lote(options['lote'])
+            if procesados:
+                continue
+            if options['una_vez']:
+                return
+            time.sleep(options['intervalo'])
+
+    def procesar_lote(self, tamano):
+        with transaction.atomic():
+            pendientes = TrabajoQR.objects.filter(
+                intentos__lt=MAX_INTENTOS, proximo_intento__lte=timezone.now(),
+            ).order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                # Varios workers pueden trabajar en paralelo sin tomar los mismos trabajos.
+                pendientes = pendientes.select_for_update(skip_locked=True)
+            trabajos = list(pendientes.select_related('usuario')[:tamano])
+
+            hechos = []
+            for trabajo in trabajos:
+                usuario = trabajo.usuario
+                try:
+                    if not usuario.qr_code:
+                        usuario.qr_code.save(
+                            nombre_archivo_qr(usuario.id), ContentFile(generar_qr_png(usuario.id)), save=False
+                        )
+                        # update() evita re-hashear la contraseña y volver a disparar señales.
+                        Usuario.objects.filter(pk=usuario.pk).update(qr_code=usuario.qr_code.name)
+                    hechos.append(trabajo.id)
+                except Exception as e:
+                    # Sin espera, un error persistente (disco lleno, permisos) gastaría los
+                    # intentos en segundos y el worker giraría sin pausa sobre el mismo trabajo.
+                    TrabajoQR.objects.filter(pk=trabajo.pk).update(
+                        intentos=F('intentos') + 1,
+                        proximo_intento=timezone.now() + espera_reintento(trabajo.intentos + 1),
+                        ultimo_error=str(e),
+                    )
+                    self.stderr.write(f"Error al generar el QR de {usuario.email}: {e}")
+
+            TrabajoQR.objects.filter(id__in=hechos).delete()
+            usuario_ids = [t.usuario_id for t in trabajos if t.id in hechos]
+            transaction.on_commit(lambda: invalidar_usuarios(usuario_ids))
+
+        if hechos:
+            self.stdout.write(f"{len(hechos)} códigos QR generados.")
+        return len(trabajos)
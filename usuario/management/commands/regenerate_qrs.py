@@ -0,0 +1,133 @@
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from usuario.cache import invalidar_usuarios
+from usuario.models import Usuario, EMOJIS_DISPONIBLES
+from usuario.qr import contenido_qr, dibujar_qr, nombre_archivo_qr
+
+
+def _iniciar_proceso():
+    # Con el método "spawn" (Windows, macOS) los procesos hijos parten sin Django configurado.
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera los PNG de los códigos QR de todos los usuarios (por ejemplo, tras rotar la clave). "
+        "Solo tiene sentido con QR_GUARDAR_ARCHIVOS; si no, los QR se dibujan a pedido. "
+        "Si se interrumpe, la siguiente ejecución continúa desde el último lote guardado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help="Usuarios por lote (y por bulk_update).")
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help="Procesos que dibujan los QR. Con 0 se dibujan en el proceso principal.")
+        parser.add_argument('--hilos', type=int, default=8, help="Hilos que escriben los archivos.")
+        parser.add_argument('--checkpoint', help="Archivo con el último id procesado (por defecto BASE_DIR/.regenerate_qrs).")
+        parser.add_argument('--reiniciar', action='store_true', help="Ignora el checkpoint y empieza desde el primer usuario.")
+
+    def handle(self, *args, **options):
+        if not settings.QR_GUARDAR_ARCHIVOS:
+            raise CommandError(
+                "QR_GUARDAR_ARCHIVOS está desactivado: los QR se dibujan a pedido en /qr/<id>.png y no hay "
+                "archivos que regenerar. Para reenviar los QR a los miembros usa `enviar_credenciales`."
+            )
+        self.campo = Usuario._meta.get_field('qr_code')
+        # Fuera de MEDIA_ROOT, que se publica tal cual.
+        checkpoint = options['checkpoint'] or os.path.join(settings.BASE_DIR, '.regenerate_qrs')
+        desde = 0 if options['reiniciar'] else self.leer_checkpoint(checkpoint)
+        if desde:
+            self.stdout.write(f"Continuando desde el usuario con id > {desde}.")
+
+        usuarios = (
+            Usuario.objects.filter(id__gt=desde).order_by('id')
+            .only('id', 'qr_code', 'etiqueta_emojis')
+            .iterator(chunk_size=options['lote'])
+        )
+
+        procesos = None
+        if options['procesos'] > 0:
+            procesos = ProcessPoolExecutor(max_workers=options['procesos'], initializer=_iniciar_proceso)
+            self.chunksize = max(1, options['lote'] // (4 * options['procesos']))
+        total = 0
+        inicio = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=options['hilos']) as hilos:
+                lote = []
+                for usuario in usuarios:
+                    lote.append(usuario)
+                    if len(lote) == options['lote']:
+                        total += self.procesar_lote(lote, procesos, hilos, checkpoint)
+                        self.informar(total, inicio)
+                        lote = []
+                if lote:
+                    total += self.procesar_lote(lote, procesos, hilos, checkpoint)
+        finally:
+            if procesos:
+                procesos.shutdown()
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS("Proceso completado."))
+        self.informar(total, inicio)
+
+    def procesar_lote(self, lote, procesos, hilos, checkpoint):
+        contenidos = [contenido_qr(u.id) for u in lote]
+        if procesos:
+            imagenes = procesos.map(dibujar_qr, contenidos, chunksize=self.chunksize)
+        else:
+            imagenes = map(dibujar_qr, contenidos)
+
+        nombres = list(hilos.map(self.escribir, lote, imagenes))
+
+        for usuario, nombre in zip(lote, nombres):
+            usuario.qr_code = nombre
+            if not usuario.etiqueta_emojis:
+                usuario.etiqueta_emojis = "".join(random.sample(EMOJIS_DISPONIBLES, 3))
+
+        ids = [u.id for u in lote]
+        with transaction.atomic():
+            # bulk_update no llama a save() ni dispara señales; la caché se invalida a mano.
+            Usuario.objects.bulk_update(lote, ['qr_code', 'etiqueta_emojis'])
+            transaction.on_commit(lambda: invalidar_usuarios(ids))
+        self.guardar_checkpoint(checkpoint, ids[-1])
+        return len(lote)
+
+    def escribir(self, usuario, imagen):
+        """Escribe el PNG con un nombre fijo por usuario, reemplazando el anterior."""
+        storage = self.campo.storage
+        nombre = self.campo.generate_filename(None, nombre_archivo_qr(usuario.id))
+        if storage.exists(nombre):
+            storage.delete(nombre)
+        nombre = storage.save(nombre, ContentFile(imagen))
+        anterior = usuario.qr_code.name
+        if anterior and anterior != nombre and storage.exists(anterior):
+            storage.delete(anterior)
+        return nombre
+
+    def leer_checkpoint(self, ruta):
+        try:
+            with open(ruta) as archivo:
+                return int(archivo.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def guardar_checkpoint(self, ruta, ultimo_id):
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w') as archivo:
+            archivo.write(str(ultimo_id))
+        os.replace(temporal, ruta)
+
+    def informar(self, total, inicio):
+        transcurrido = time.monotonic() - inicio
+        velocidad = total / transcurrido if transcurrido else 0
+        self.stdout.write(f"{total} usuarios en {transcurrido:.1f}s ({velocidad:.1f} usuarios/s)")
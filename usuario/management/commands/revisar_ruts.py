@@ -0,0 +1,52 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from usuario.models import Usuario
+from usuario.rut import rut_canonico, validar_ruts
+
+TAMANO_LOTE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Revisa una lista de RUT (uno por línea, en cualquier formato) antes de cargarla: informa los "
+        "inválidos, los repetidos dentro de la lista y los que ya pertenecen a un usuario registrado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Archivo de texto con un RUT por línea, o '-' para leer de la entrada estándar.")
+
+    def handle(self, *args, **options):
+        try:
+            archivo = sys.stdin if options['archivo'] == '-' else open(options['archivo'], encoding='utf-8')
+        except OSError as error:
+            raise CommandError(f"No se pudo abrir {options['archivo']}: {error}")
+        with archivo:
+            lineas = [linea.strip() for linea in archivo if linea.strip()]
+
+        validos, invalidos, repetidos = {}, [], []
+        for numero, (texto, separado) in enumerate(zip(lineas, validar_ruts(lineas)), start=1):
+            if separado is None:
+                invalidos.append((numero, texto))
+            elif separado[0] in validos:
+                repetidos.append((numero, texto))
+            else:
+                validos[separado[0]] = separado[1]
+
+        # Una consulta por lote sobre el índice único de rut_cuerpo.
+        cuerpos = list(validos)
+        registrados = []
+        for i in range(0, len(cuerpos), TAMANO_LOTE):
+            registrados += Usuario.objects.filter(rut_cuerpo__in=cuerpos[i:i + TAMANO_LOTE]).values_list('rut_cuerpo', 'email')
+
+        for numero, texto in invalidos:
+            self.stdout.write(f"Línea {numero}: RUT inválido {texto!r}")
+        for numero, texto in repetidos:
+            self.stdout.write(f"Línea {numero}: {texto!r} repetido en la lista")
+        for cuerpo, email in sorted(registrados):
+            self.stdout.write(f"{rut_canonico(cuerpo, validos[cuerpo])} ya está registrado ({email})")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(lineas)} líneas: {len(validos)} RUT válidos distintos ({len(validos) - len(registrados)} nuevos), "
+            f"{len(invalidos)} inválidos, {len(repetidos)} repetidos, {len(registrados)} ya registrados."
+        ))
@@ -1,26 +1,42 @@
-from .models import Usuario
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 
-class UserInfoMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
+from .cache import obtener_usuario
 
-    def __call__(self, request):
-        if request.path.startswith('/admin/'):
-            return self.get_response(request)
 
+def get_usuario(request):
+    """
+    Devuelve el `Usuario` de la sesión actual (o None), cargándolo una sola vez
+    por petición. El middleware, los decoradores y las vistas comparten este objeto.
+    Entre peticiones se sirve desde la caché de `usuario.cache`.
+    """
+    if not hasattr(request, '_cached_usuario'):
+        usuario = None
         usuario_id = request.session.get('usuario_id')
-        
-        # Usamos el sistema de usuario anónimo de Django para consistencia
-        from django.contrib.auth.models import AnonymousUser
-        request.user = AnonymousUser()
-        
         if usuario_id:
-            try:
-                # Adjuntamos el objeto de usuario para fácil acceso en las plantillas
-                request.user = Usuario.objects.get(id=usuario_id)
-            except Usuario.DoesNotExist:
+            usuario = obtener_usuario(usuario_id)
+            if usuario is None:
                 # Si el usuario_id en la sesión es inválido, lo limpiamos para evitar errores.
                 request.session.flush()
+        request._cached_usuario = usuario
+    return request._cached_usuario
+
 
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+class UserInfoMiddleware:
+    """
+    Adjunta `request.usuario`, el usuario de la sesión cargado de forma perezosa:
+    la consulta solo se ejecuta la primera vez que alguien lo utiliza.
+    Las rutas de archivos estáticos y media nunca consultan la base de datos.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rutas_sin_usuario = tuple(
+            ruta for ruta in (settings.STATIC_URL, settings.MEDIA_URL) if ruta
+        )
+
+    def __call__(self, request):
+        if request.path.startswith(self.rutas_sin_usuario):
+            request.usuario = None
+        else:
+            request.usuario = SimpleLazyObject(lambda: get_usuario(request))
+        return self.get_response(request)
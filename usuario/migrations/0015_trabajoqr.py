@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 01:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuario', '0014_usuario_es_totem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoQR',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trabajo_qr', to='usuario.usuario')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de QR',
+                'verbose_name_plural': 'Trabajos de QR',
+            },
+        ),
+    ]
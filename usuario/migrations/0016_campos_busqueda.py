@@ -0,0 +1,58 @@
+# Generated by Django 4.2.23 on 2026-10-18 01:59
+
+from django.db import migrations, models
+
+from usuario.busqueda import campos_busqueda
+
+TAMANO_LOTE = 1000
+
+
+def llenar_campos_busqueda(apps, schema_editor):
+    Usuario = apps.get_model('usuario', 'Usuario')
+    lote = []
+    for usuario in Usuario.objects.only('id', 'nombre', 'apellido', 'rut').iterator(chunk_size=TAMANO_LOTE):
+        campos_busqueda(usuario)
+        lote.append(usuario)
+        if len(lote) == TAMANO_LOTE:
+            Usuario.objects.bulk_update(lote, ['nombre_busqueda', 'apellido_busqueda', 'rut_busqueda'])
+            lote = []
+    Usuario.objects.bulk_update(lote, ['nombre_busqueda', 'apellido_busqueda', 'rut_busqueda'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuario', '0015_trabajoqr'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='apellido_busqueda',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='nombre_busqueda',
+            field=models.CharField(blank=True, editable=False, max_length=201),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='rut_busqueda',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        # Se llenan antes de crear los índices, que así se construyen una sola vez.
+        migrations.RunPython(llenar_campos_busqueda, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['nombre_busqueda'], name='usuario_nombre_busqueda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['apellido_busqueda'], name='usuario_apellido_busqueda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['rut_busqueda'], name='usuario_rut_busqueda_idx'),
+        ),
+    ]
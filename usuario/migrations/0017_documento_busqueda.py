@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+from usuario.busqueda import documento
+
+TAMANO_LOTE = 1000
+
+
+def llenar_documento_busqueda(apps, schema_editor):
+    Usuario = apps.get_model('usuario', 'Usuario')
+    campos = ('id', 'nombre', 'apellido', 'nombre_empresa', 'rubro', 'rubro_otro', 'buscando')
+    lote = []
+    for usuario in Usuario.objects.only(*campos).iterator(chunk_size=TAMANO_LOTE):
+        usuario.documento_busqueda = documento(usuario)
+        lote.append(usuario)
+        if len(lote) == TAMANO_LOTE:
+            Usuario.objects.bulk_update(lote, ['documento_busqueda'])
+            lote = []
+    Usuario.objects.bulk_update(lote, ['documento_busqueda'])
+
+
+def crear_fulltext(apps, schema_editor):
+    # Solo MySQL/MariaDB; las demás bases usan el índice en memoria (usuario/busqueda.py).
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE FULLTEXT INDEX usuario_documento_ft ON usuario_usuario (documento_busqueda)'
+        )
+
+
+def borrar_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX usuario_documento_ft ON usuario_usuario')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuario', '0016_campos_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='documento_busqueda',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        # Se llena antes de crear el índice, que así se construye una sola vez.
+        migrations.RunPython(llenar_documento_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_fulltext, borrar_fulltext),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuario', '0017_documento_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['perfil_publico', '-destacado', 'nombre', 'id'], name='usuario_directorio_idx'),
+        ),
+    ]
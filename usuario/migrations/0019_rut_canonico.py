@@ -0,0 +1,81 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:36
+
+import sys
+
+from django.db import migrations, models
+
+from usuario.rut import rut_canonico, validar_ruts
+
+TAMANO_LOTE = 1000
+
+
+def normalizar_ruts(apps, schema_editor):
+    """
+    Separa cuerpo y DV de cada RUT válido y lo reescribe en forma canónica.
+    Si varios usuarios tienen el mismo RUT escrito distinto, el cuerpo queda
+    solo en uno (el que ya lo tenía canónico o, si no, el de menor id) y los
+    demás se informan para resolverlos a mano. Los RUT inválidos se dejan
+    como están, sin cuerpo.
+    """
+    Usuario = apps.get_model('usuario', 'Usuario')
+    filas = list(Usuario.objects.order_by('id').values_list('id', 'rut'))
+    grupos, invalidos = {}, []
+    for (usuario_id, rut), separado in zip(filas, validar_ruts(rut for _, rut in filas)):
+        if separado is None:
+            invalidos.append((usuario_id, rut))
+        else:
+            grupos.setdefault(separado, []).append((usuario_id, rut))
+
+    duenos, duplicados = {}, {}
+    for (cuerpo, dv), grupo in grupos.items():
+        canonico = rut_canonico(cuerpo, dv)
+        dueno = next((fila for fila in grupo if fila[1] == canonico), grupo[0])
+        duenos[cuerpo] = (dueno[0], dv)
+        if len(grupo) > 1:
+            duplicados[cuerpo] = [dueno] + [fila for fila in grupo if fila is not dueno]
+
+    lote = []
+    for cuerpo, (usuario_id, dv) in duenos.items():
+        lote.append(Usuario(id=usuario_id, rut=rut_canonico(cuerpo, dv), rut_cuerpo=cuerpo, rut_dv=dv))
+        if len(lote) == TAMANO_LOTE:
+            Usuario.objects.bulk_update(lote, ['rut', 'rut_cuerpo', 'rut_dv'])
+            lote = []
+    Usuario.objects.bulk_update(lote, ['rut', 'rut_cuerpo', 'rut_dv'])
+
+    if duplicados:
+        sys.stdout.write(f"\n  RUT repetidos ({len(duplicados)}), el cuerpo quedó en el primero de cada grupo:\n")
+        for _, grupo in sorted(duplicados.items()):
+            sys.stdout.write("    " + ", ".join(f"#{usuario_id} {rut!r}" for usuario_id, rut in grupo) + "\n")
+    if invalidos:
+        sys.stdout.write(f"\n  RUT inválidos ({len(invalidos)}), quedan sin cuerpo:\n")
+        for usuario_id, rut in invalidos[:50]:
+            sys.stdout.write(f"    #{usuario_id} {rut!r}\n")
+        if len(invalidos) > 50:
+            sys.stdout.write(f"    ... y {len(invalidos) - 50} más\n")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuario', '0018_indice_directorio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='rut_cuerpo',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='rut_dv',
+            field=models.CharField(blank=True, editable=False, max_length=1),
+        ),
+        # Se llena antes de crear el índice único, que así se construye una sola vez.
+        migrations.RunPython(normalizar_ruts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='usuario',
+            name='rut_cuerpo',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuario', '0019_rut_canonico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoqr',
+            name='proximo_intento',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='trabajoqr',
+            index=models.Index(fields=['proximo_intento'], name='usuario_tra_proximo_588749_idx'),
+        ),
+    ]
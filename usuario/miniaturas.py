@@ -0,0 +1,44 @@
+"""
+Miniaturas de las fotos de perfil, para el padrón de las estaciones de escaneo.
+
+Cada estación descarga una foto por persona del padrón; con la foto original
+eso son megas por reunión. La miniatura (LADO x LADO, JPEG) se dibuja a pedido
+en `/foto/<id>/miniatura.jpg` y se guarda en la caché de Django. La clave y la
+URL llevan una huella del archivo de la foto, así que al cambiar la foto cambia
+la URL y el navegador puede guardar la anterior sin revalidar.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.cache import cache
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+LADO = 96  # px; alcanza para un avatar de 48 px en pantallas de doble densidad
+CALIDAD = 80
+TIEMPO_MINIATURA = 7 * 24 * 60 * 60  # segundos
+
+
+def huella(nombre_foto):
+    return hashlib.sha1(nombre_foto.encode()).hexdigest()[:10]
+
+
+def url_miniatura(usuario_id, nombre_foto):
+    return f"{reverse('miniatura_foto', args=[usuario_id])}?v={huella(nombre_foto)}"
+
+
+def miniatura(nombre_foto):
+    """Bytes JPEG de la miniatura de la foto `nombre_foto` (nombre en el storage de `Usuario.foto`)."""
+    from .models import Usuario
+
+    clave = f'miniatura:{LADO}:{huella(nombre_foto)}'
+    datos = cache.get(clave)
+    if datos is None:
+        with Usuario._meta.get_field('foto').storage.open(nombre_foto, 'rb') as archivo:
+            imagen = ImageOps.exif_transpose(Image.open(archivo))
+            imagen = ImageOps.fit(imagen.convert('RGB'), (LADO, LADO))
+        salida = BytesIO()
+        imagen.save(salida, 'JPEG', quality=CALIDAD, optimize=True)
+        datos = salida.getvalue()
+        cache.set(clave, datos, TIEMPO_MINIATURA)
+    return datos
@@ -1,12 +1,14 @@
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import pre_save, post_save, post_delete, post_init
 from django.dispatch import receiver
 from django.contrib.auth.hashers import make_password, check_password
-import qrcode
-from io import BytesIO
-from django.core.files import File
-from django.urls import reverse
 from django.conf import settings
+from django.utils import timezone
+import random
+from . import facetas
+from .busqueda import campos_busqueda, documento, indice_local, usa_fulltext
+from .rut import RutInvalido, rut_canonico, separar_rut
+from .cache import invalidar_usuario, invalidar_paginas_publicas
 
 RUBRO_CHOICES = [
     ('Tecnología y Desarrollo', (
@@ -59,6 +61,9 @@ class Usuario(models.Model):
     nombre = models.CharField(max_length=100)
     apellido = models.CharField(max_length=100)
     rut = models.CharField(max_length=12, unique=True)
+    # RUT separado (ver usuario/rut.py): se busca por el cuerpo, entero con índice único.
+    rut_cuerpo = models.PositiveIntegerField(unique=True, null=True, blank=True, editable=False)
+    rut_dv = models.CharField(max_length=1, blank=True, editable=False)
     email = models.EmailField(unique=True)
     password = models.CharField(max_length=128)
     telefono = models.CharField(max_length=15, blank=True, null=True)
@@ -81,7 +86,27 @@ class Usuario(models.Model):
     perfil_publico = models.BooleanField(default=True, help_text="Permite que otros miembros vean tu perfil en el directorio.")
     destacado = models.BooleanField(default=False)
 
+    # Copias normalizadas para buscar por prefijo con índice (ver usuario/busqueda.py).
+    nombre_busqueda = models.CharField(max_length=201, blank=True, editable=False)
+    apellido_busqueda = models.CharField(max_length=100, blank=True, editable=False)
+    rut_busqueda = models.CharField(max_length=12, blank=True, editable=False)
+    # Texto libre del directorio; en MySQL lleva un índice FULLTEXT (migración 0017).
+    documento_busqueda = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nombre_busqueda'], name='usuario_nombre_busqueda_idx'),
+            models.Index(fields=['apellido_busqueda'], name='usuario_apellido_busqueda_idx'),
+            models.Index(fields=['rut_busqueda'], name='usuario_rut_busqueda_idx'),
+            # Orden del directorio (usuario/directorio.py), para paginar por cursor.
+            models.Index(fields=['perfil_publico', '-destacado', 'nombre', 'id'], name='usuario_directorio_idx'),
+        ]
+
     def save(self, *args, **kwargs):
+        # El usuario de sesión (usuario/cache.py) viene sin la contraseña: no hay nada que revisar.
+        if 'password' in self.get_deferred_fields():
+            return super().save(*args, **kwargs)
+
         # Comprueba si la contraseña ha sido cambiada o si es un usuario nuevo.
         # Una contraseña hasheada siempre empieza con un algoritmo como 'pbkdf2_sha256$'.
         # Si no empieza así, significa que es una contraseña nueva en texto plano.
@@ -103,28 +128,125 @@ class Usuario(models.Model):
         self.password = make_password(raw_password)
         self._password = raw_password
 
+    @property
+    def qr_url(self):
+        from .qr import url_qr
+        return url_qr(self.id, 'png')
+
+    @property
+    def qr_svg_url(self):
+        from .qr import url_qr
+        return url_qr(self.id, 'svg')
+
     @property
     def get_rubro_real_display(self):
         if self.rubro == 'otro':
             return self.rubro_otro or 'Otro'
         return self.get_rubro_display()
 
+class TrabajoQR(models.Model):
+    """
+    Cola de generación de los PNG guardados en media/qr_codes (opcionales, ver
+    QR_GUARDAR_ARCHIVOS). Cada fila es un usuario cuyo archivo falta; el worker
+    `python manage.py procesar_qr` la procesa y la elimina. Si falla, se
+    reintenta con espera exponencial (`proximo_intento`).
+    """
+    usuario = models.OneToOneField(Usuario, on_delete=models.CASCADE, related_name='trabajo_qr')
+    creado_en = models.DateTimeField(auto_now_add=True)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "Trabajo de QR"
+        verbose_name_plural = "Trabajos de QR"
+        indexes = [models.Index(fields=['proximo_intento'])]
+
+    def __str__(self):
+        return f"QR pendiente de {self.usuario_id}"
+
+EMOJIS_DISPONIBLES = ['💡', '🚀', '📈', '💼', '🤝', '🌐', '💻', '📱', '🎯', '🌟', '🌱', '🔗', '🛠️', '📊', '🧠', '⚡️', '🏆', '🔑']
+
+@receiver(pre_save, sender=Usuario)
+def asignar_emojis(sender, instance, **kwargs):
+    # Se asignan antes del INSERT para no necesitar un segundo UPDATE.
+    if instance._state.adding and not instance.etiqueta_emojis:
+        instance.etiqueta_emojis = "".join(random.sample(EMOJIS_DISPONIBLES, 3))
+
+@receiver(pre_save, sender=Usuario)
+def canonizar_rut(sender, instance, **kwargs):
+    # Un RUT válido se guarda sin puntos ni guion y con su cuerpo y DV por separado.
+    # Uno inválido (datos antiguos) se deja como está, sin cuerpo. Un repetido que
+    # dejó la migración 0019 (el cuerpo ya es de otro usuario) también queda sin
+    # cuerpo, para que se pueda seguir guardando hasta que se unifique.
+    try:
+        cuerpo, dv = separar_rut(instance.rut)
+    except RutInvalido:
+        instance.rut_cuerpo, instance.rut_dv = None, ''
+        return
+    if cuerpo != instance.rut_cuerpo and Usuario.objects.filter(rut_cuerpo=cuerpo).exclude(pk=instance.pk).exists():
+        instance.rut_cuerpo, instance.rut_dv = None, ''
+        return
+    instance.rut_cuerpo, instance.rut_dv = cuerpo, dv
+    instance.rut = rut_canonico(cuerpo, dv)
+
+@receiver(pre_save, sender=Usuario)
+def actualizar_campos_busqueda(sender, instance, **kwargs):
+    campos_busqueda(instance)
+    instance.documento_busqueda = documento(instance)
+
 @receiver(post_save, sender=Usuario)
 def extras_post_creacion(sender, instance, created, **kwargs):
-    import random
+    # El QR se sirve a pedido desde /qr/<id>.png. Solo si se quiere además una copia
+    # en media/qr_codes se encola su generación en segundo plano (ver TrabajoQR).
+    if created and settings.QR_GUARDAR_ARCHIVOS and not instance.qr_code:
+        TrabajoQR.objects.create(usuario=instance)
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_cache_usuario(sender, instance, **kwargs):
+    # Se invalida al confirmar la transacción para que nadie vuelva a cachear datos viejos.
+    usuario_id = instance.pk
+    transaction.on_commit(lambda: invalidar_usuario(usuario_id))
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_paginas_publicas_usuario(sender, instance, created=True, **kwargs):
+    # Solo las altas y bajas cambian el total de miembros de la portada.
     if created:
-        update_fields = []
-        if not instance.etiqueta_emojis:
-            emojis_disponibles = ['💡', '🚀', '📈', '💼', '🤝', '🌐', '💻', '📱', '🎯', '🌟', '🌱', '🔗', '🛠️', '📊', '🧠', '⚡️', '🏆', '🔑']
-            instance.etiqueta_emojis = "".join(random.sample(emojis_disponibles, 3))
-            update_fields.append('etiqueta_emojis')
-        if not instance.qr_code:
-            base_url = getattr(settings, 'BASE_URL', 'http://127.0.0.1:8000')
-            qr_url = base_url + reverse('perfil_publico', args=[instance.id])
-            buffer = BytesIO()
-            qrcode.make(qr_url).save(buffer, format='PNG')
-            instance.qr_code.save(f'qr_usuario_{instance.id}.png', File(buffer), save=False)
-            update_fields.append('qr_code')
-
-        if update_fields:
-            instance.save(update_fields=update_fields)
+        transaction.on_commit(invalidar_paginas_publicas)
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def actualizar_indice_local(sender, instance, **kwargs):
+    # Sin FULLTEXT, el índice en memoria de este proceso sigue a los cambios.
+    if usa_fulltext():
+        return
+    usuario_id = instance.pk
+    texto = None if kwargs['signal'] is post_delete else instance.documento_busqueda
+    transaction.on_commit(lambda: indice_local.actualizar(usuario_id, texto))
+
+@receiver(post_init, sender=Usuario)
+def recordar_estado_facetas(sender, instance, **kwargs):
+    # Cómo estaba al leerlo, para mover los contadores por rubro al guardar.
+    instance._estado_facetas = facetas.estado_de(instance)
+
+@receiver(post_save, sender=Usuario)
+def ajustar_facetas_guardado(sender, instance, created, **kwargs):
+    antes, despues = getattr(instance, '_estado_facetas', None), facetas.estado_de(instance)
+    instance._estado_facetas = despues
+    if created:
+        transaction.on_commit(lambda: facetas.ajustar(None, despues))
+    elif antes is None or despues is None:
+        # No se sabe cómo estaba (o cómo quedó): se vuelve a contar.
+        transaction.on_commit(facetas.invalidar)
+    elif antes != despues:
+        transaction.on_commit(lambda: facetas.ajustar(antes, despues))
+
+@receiver(post_delete, sender=Usuario)
+def ajustar_facetas_eliminado(sender, instance, **kwargs):
+    antes = getattr(instance, '_estado_facetas', None) or facetas.estado_de(instance)
+    if antes is None:
+        transaction.on_commit(facetas.invalidar)
+    else:
+        transaction.on_commit(lambda: facetas.ajustar(antes, None))
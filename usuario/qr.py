@@ -0,0 +1,145 @@
+"""
+Generación de los códigos QR de los usuarios.
+
+El QR lleva un token firmado y compacto, no una URL: la versión de la clave,
+una firma HMAC truncada y el id del usuario en base 36, todo en mayúsculas y
+dígitos. Así el QR usa el modo alfanumérico (menos módulos, se lee más rápido
+con cámaras malas) y el check-in descarta códigos falsos o inventados sin
+consultar la base de datos (`leer_codigo_qr`).
+
+El contenido depende solo de la clave activa y del id del usuario, así que la
+imagen se puede renderizar a pedido (`/qr/<id>.png` y `/qr/<id>.svg`) sin leer
+nada de la base de datos. Los bytes ya codificados se guardan en un LRU acotado
+dentro del proceso y la respuesta lleva un ETag fuerte derivado del contenido.
+"""
+import base64
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# Sube este número si cambia la forma de dibujar el QR, para invalidar los ETags.
+VERSION_RENDER = 2
+
+LARGO_FIRMA = 16  # caracteres base 32 (80 bits de HMAC-SHA256)
+LARGO_MAXIMO_ID = 13  # un id de 64 bits en base 36
+
+TIPOS_CONTENIDO = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def _base36(numero):
+    digitos = ''
+    while True:
+        numero, resto = divmod(numero, 36)
+        digitos = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'[resto] + digitos
+        if not numero:
+            return digitos
+
+
+def _firma(clave_id, cuerpo):
+    secreto = settings.QR_CLAVES[clave_id]
+    digest = salted_hmac('usuario.qr', f'{clave_id}{cuerpo}', secret=secreto, algorithm='sha256').digest()
+    return base64.b32encode(digest[:10]).decode()
+
+
+def firmar_token(usuario_id, clave_id=None):
+    """Token del QR: <clave><firma><id en base 36>. Por defecto firma con QR_CLAVE_ACTIVA."""
+    clave_id = clave_id or settings.QR_CLAVE_ACTIVA
+    if len(clave_id) != 1 or clave_id not in settings.QR_CLAVES:
+        raise ImproperlyConfigured(f"La clave de QR '{clave_id}' no existe o no es de un carácter.")
+    cuerpo = _base36(usuario_id)
+    return f'{clave_id}{_firma(clave_id, cuerpo)}{cuerpo}'
+
+
+def verificar_token(token):
+    """
+    Devuelve el id del usuario si `token` tiene una firma válida con alguna de
+    las claves de QR_CLAVES, o None. No consulta la base de datos.
+    """
+    token = str(token or '').strip().upper()
+    if not 1 + LARGO_FIRMA < len(token) <= 1 + LARGO_FIRMA + LARGO_MAXIMO_ID:
+        return None
+    clave_id, firma, cuerpo = token[0], token[1:1 + LARGO_FIRMA], token[1 + LARGO_FIRMA:]
+    if clave_id not in settings.QR_CLAVES or not cuerpo.isalnum():
+        return None
+    if not constant_time_compare(firma, _firma(clave_id, cuerpo)):
+        return None
+    return int(cuerpo, 36)
+
+
+def es_codigo_legado(codigo):
+    """True si `codigo` es el id numérico que los escáneres sacan de un QR antiguo (la URL del perfil)."""
+    return str(codigo or '').strip().isdigit()
+
+
+def legado_vigente():
+    hasta = getattr(settings, 'QR_LEGADO_HASTA', None)
+    return hasta is not None and timezone.localdate() <= hasta
+
+
+def leer_codigo_qr(codigo):
+    """
+    Id del usuario para lo que mandó un escáner, o None si el código no sirve.
+    Hasta QR_LEGADO_HASTA también se aceptan los ids de los QR antiguos, que
+    no van firmados.
+    """
+    codigo = str(codigo or '').strip()
+    if len(codigo) > 1 + LARGO_FIRMA:
+        return verificar_token(codigo)
+    if es_codigo_legado(codigo) and legado_vigente():
+        return int(codigo)
+    return None
+
+
+def contenido_qr(usuario_id):
+    return firmar_token(usuario_id)
+
+
+def etag_qr(usuario_id, formato):
+    """ETag fuerte: cambia solo si cambia el contenido, el formato o el dibujo."""
+    base = f'{VERSION_RENDER}:{formato}:{contenido_qr(usuario_id)}'
+    return hashlib.sha1(base.encode()).hexdigest()
+
+
+def dibujar_qr(contenido, formato='png'):
+    """Codifica `contenido` como imagen, sin caché. No usa la base de datos ni los settings."""
+    buffer = BytesIO()
+    if formato == 'svg':
+        qrcode.make(contenido, image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qrcode.make(contenido).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+_renderizar = lru_cache(maxsize=getattr(settings, 'QR_LRU_MAX', 2048))(dibujar_qr)
+
+
+def generar_qr(usuario_id, formato='png'):
+    """Devuelve los bytes del QR del usuario en `formato` ('png' o 'svg')."""
+    return _renderizar(contenido_qr(usuario_id), formato)
+
+
+def generar_qr_png(usuario_id):
+    return generar_qr(usuario_id, 'png')
+
+
+def url_qr(usuario_id, formato='png'):
+    """
+    URL del QR. Lleva un fragmento del ETag como versión para que los navegadores
+    puedan guardarla sin revalidar y aun así vean un cambio de clave.
+    """
+    return f"{reverse(f'qr_usuario_{formato}', args=[usuario_id])}?v={etag_qr(usuario_id, formato)[:8]}"
+
+
+def nombre_archivo_qr(usuario_id):
+    return f'qr_usuario_{usuario_id}.png'
@@ -0,0 +1,89 @@
+"""
+RUT chileno en forma canónica.
+
+`Usuario` guarda el RUT como texto canónico (cuerpo + DV, sin puntos ni
+guion: '123456785') y además como `rut_cuerpo` (entero, índice único) y
+`rut_dv`. Buscar a alguien por RUT es entonces una igualdad sobre un entero
+indexado, sin importar cómo lo haya escrito la persona. Toda entrada de RUT
+(registro, inscripción a reuniones, búsqueda del panel, revisión de listas)
+pasa por `separar_rut`, que limpia con `usuario.busqueda.normalizar_rut`.
+
+El dígito verificador se calcula con tablas precalculadas por tramos de tres
+dígitos (tres sumas en vez de un ciclo por dígito); `validar_ruts` valida
+listas de miles de RUT de una vez con el mismo cálculo.
+"""
+from .busqueda import normalizar_rut
+
+CUERPO_MAXIMO = 99_999_999
+
+
+class RutInvalido(ValueError):
+    pass
+
+
+def _tabla(desde):
+    # Suma ponderada (factores 2..7 desde la derecha) de cada número de 3 dígitos
+    # ubicado a partir del dígito `desde`.
+    factores = [2, 3, 4, 5, 6, 7]
+    tabla = []
+    for n in range(1000):
+        suma = 0
+        for i in range(3):
+            suma += (n // 10 ** i % 10) * factores[(desde + i) % 6]
+        tabla.append(suma)
+    return tuple(tabla)
+
+
+_TABLAS = (_tabla(0), _tabla(3), _tabla(6))
+_DV = ('0', 'K', '9', '8', '7', '6', '5', '4', '3', '2', '1')  # por resto de la suma módulo 11
+
+
+def digito_verificador(cuerpo):
+    t0, t1, t2 = _TABLAS
+    return _DV[(t0[cuerpo % 1000] + t1[cuerpo // 1000 % 1000] + t2[cuerpo // 1_000_000 % 1000]) % 11]
+
+
+def separar_rut(texto):
+    """
+    '12.345.678-5' -> (12345678, '5'). Lanza `RutInvalido` con el mensaje para
+    el usuario si no es un RUT válido.
+    """
+    limpio = normalizar_rut(texto)
+    cuerpo, dv = limpio[:-1], limpio[-1:]
+    if not cuerpo.isdigit() or not (dv.isdigit() or dv == 'K'):
+        raise RutInvalido("El RUT debe contener solo números y, si corresponde, una 'K' al final.")
+    numero = int(cuerpo)
+    if not 0 < numero <= CUERPO_MAXIMO:
+        raise RutInvalido("Formato de RUT incorrecto.")
+    if digito_verificador(numero) != dv:
+        raise RutInvalido("El RUT ingresado no es válido (dígito verificador incorrecto).")
+    return numero, dv
+
+
+def rut_canonico(cuerpo, dv):
+    return f'{cuerpo}{dv}'
+
+
+def cuerpo_o_none(texto):
+    """Cuerpo del RUT si `texto` es un RUT válido; si no, None."""
+    try:
+        return separar_rut(texto)[0]
+    except RutInvalido:
+        return None
+
+
+def validar_ruts(textos):
+    """
+    Valida muchos RUT de una vez. Devuelve una lista alineada con `textos`
+    con (cuerpo, dv) o None si el RUT no es válido.
+    """
+    resultado = []
+    agregar = resultado.append
+    for limpio in map(normalizar_rut, textos):
+        cuerpo, dv = limpio[:-1], limpio[-1:]
+        if not cuerpo.isdigit():
+            agregar(None)
+            continue
+        n = int(cuerpo)
+        agregar((n, dv) if 0 < n <= CUERPO_MAXIMO and digito_verificador(n) == dv else None)
+    return resultado
@@ -1,3 +1,712 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from paneladm.membresia import es_interesado, membresias
+from paneladm.models import Asistencia, Reunion
+from . import etiquetas, facetas
+from .busqueda import buscar, consulta_booleana, filtro_prefijo, indice_local
+from .cache import obtener_usuario
+from .forms import validate_rut
+from .models import Usuario, TrabajoQR
+from .qr import contenido_qr, firmar_token, leer_codigo_qr, verificar_token
+from .rut import digito_verificador, validar_ruts
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UsuarioSesionTests(TestCase):
+    """
+    Verifica que el usuario de la sesión se carga una sola vez por petición,
+    sin importar cuántos decoradores o vistas lo utilicen, y que entre
+    peticiones se sirve desde la caché hasta que cambia.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create(
+            nombre='Ana', apellido='Admin', rut='111111111', email='ana@example.com',
+            password='secreto123', es_admin=True,
+        )
+        cls.miembro = Usuario.objects.create(
+            nombre='Mario', apellido='Miembro', rut='222222222', email='mario@example.com',
+            password='secreto123',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def iniciar_sesion(self, usuario):
+        session = self.client.session
+        session['usuario_id'] = usuario.id
+        session.save()
+
+    def consultas_de_sesion(self, url, usuario):
+        tabla = Usuario._meta.db_table
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return [
+            q['sql'] for q in ctx.captured_queries
+            if f'FROM "{tabla}" WHERE "{tabla}"."id" = {usuario.id}' in q['sql']
+        ]
+
+    def test_paginas_de_miembro_cargan_el_usuario_una_vez(self):
+        self.iniciar_sesion(self.miembro)
+        urls = [
+            reverse('inicio'),
+            reverse('perfil'),
+            reverse('configuracion'),
+            reverse('mis_tickets'),
+            reverse('mis_reuniones'),
+            reverse('directorio_miembros'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertEqual(len(self.consultas_de_sesion(url, self.miembro)), 1)
+
+    def test_paginas_del_panel_cargan_el_usuario_una_vez(self):
+        self.iniciar_sesion(self.admin)
+        urls = [
+            reverse('panel-admin:panel_admin'),
+            reverse('panel-admin:gestion_usuarios'),
+            reverse('panel-admin:gestion_reuniones'),
+            reverse('panel-admin:control_asistencia'),
+            reverse('panel-admin:gestion_asistentes'),
+            reverse('panel-admin:gestion_soporte'),
+            reverse('panel-admin:estadisticas_admin'),
+            reverse('panel-admin:ruleta_sorteo'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertEqual(len(self.consultas_de_sesion(url, self.admin)), 1)
+
+    def test_peticiones_siguientes_usan_la_cache(self):
+        self.iniciar_sesion(self.admin)
+        url = reverse('panel-admin:gestion_usuarios')
+        self.assertEqual(len(self.consultas_de_sesion(url, self.admin)), 1)
+        self.assertEqual(len(self.consultas_de_sesion(url, self.admin)), 0)
+
+    def test_revocar_un_rol_tiene_efecto_inmediato(self):
+        self.iniciar_sesion(self.admin)
+        url = reverse('panel-admin:gestion_usuarios')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.es_admin = False
+            self.admin.save()
+
+        response = self.client.get(url)
+        self.assertRedirects(response, reverse('inicio'), fetch_redirect_response=False)
+
+    def test_cambiar_password_no_pisa_campos_desfasados(self):
+        self.iniciar_sesion(self.miembro)
+        self.client.get(reverse('configuracion'))  # usuario de sesión en caché
+        self.assertNotIn('password', obtener_usuario(self.miembro.id).__dict__)
+        # Cambia en la base sin pasar por las señales, como los contadores de asistencia.
+        Usuario.objects.filter(id=self.miembro.id).update(cantidad_asistencias=5)
+
+        response = self.client.post(reverse('cambiar_password'), {
+            'password_actual': 'secreto123', 'nueva_password': 'otraClave456', 'confirmar_password': 'otraClave456',
+        })
+        self.assertRedirects(response, reverse('configuracion'), fetch_redirect_response=False)
+        self.miembro.refresh_from_db()
+        self.assertEqual(self.miembro.cantidad_asistencias, 5)
+        self.assertTrue(check_password('otraClave456', self.miembro.password))
+
+    def test_archivos_estaticos_no_consultan_el_usuario(self):
+        self.iniciar_sesion(self.miembro)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/media/no-existe.png')
+        tabla = Usuario._meta.db_table
+        self.assertFalse([q for q in ctx.captured_queries if tabla in q['sql']])
+
+    def test_sesion_con_usuario_inexistente_redirige_al_login(self):
+        session = self.client.session
+        session['usuario_id'] = 999999
+        session.save()
+        response = self.client.get(reverse('perfil'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PaginasPublicasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_la_portada_anonima_se_sirve_desde_la_cache(self):
+        self.client.get(reverse('inicio'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('inicio'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_crear_una_reunion_invalida_la_cache(self):
+        self.client.get(reverse('landing_reuniones'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Reunion.objects.create(
+                detalle='Networking de prueba', descripcion='...', ubicacion='Concepción',
+                fecha=timezone.now() + timedelta(days=3),
+            )
+        self.assertContains(self.client.get(reverse('landing_reuniones')), 'Networking de prueba')
+
+    def test_el_benchmark_no_toca_la_cache_de_la_aplicacion(self):
+        self.client.get(reverse('landing_reuniones'))
+        antes = self.client.get(reverse('landing_reuniones')).content
+        call_command('benchmark_paginas_publicas', peticiones=1, usuarios=5, reuniones=2, stdout=StringIO())
+        # Las reuniones sembradas se descartaron; la página en caché tampoco debe mostrarlas.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('landing_reuniones')).content, antes)
+
+
+class MembresiaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create(
+            nombre='Mara', apellido='Miembro', rut='777777777', email='mara@example.com', password='x',
+        )
+        cls.otros = [
+            Usuario.objects.create(
+                nombre=f'O{i}', apellido='Otro', rut=f'7777777{i:02d}', email=f'o{i}@example.com', password='x',
+            )
+            for i in range(5)
+        ]
+        fecha = timezone.now() + timedelta(days=2)
+        cls.asistida, cls.interesada, cls.libre = [
+            Reunion.objects.create(detalle=f'R{i}', descripcion='...', ubicacion='Sala', fecha=fecha)
+            for i in range(3)
+        ]
+        Asistencia.objects.create(reunion=cls.asistida, usuario=cls.usuario)
+        cls.interesada.interesados.add(cls.usuario)
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['usuario_id'] = self.usuario.id
+        session.save()
+
+    def consultas_portada(self):
+        cache.clear()
+        self.client.get(reverse('inicio'))  # sesión y datos compartidos en caché
+        with CaptureQueriesContext(connection) as ctx:
+            respuesta = self.client.get(reverse('inicio'))
+        return respuesta, len(ctx.captured_queries)
+
+    def test_estado_de_las_tarjetas_en_una_consulta(self):
+        estado = membresias(self.usuario.id, [self.asistida.id, self.interesada.id, self.libre.id])
+        self.assertEqual(estado.asistidas, {self.asistida.id})
+        self.assertEqual(estado.interesadas, {self.interesada.id})
+        with self.assertNumQueries(0):
+            membresias(None, [self.asistida.id])
+
+        respuesta, antes = self.consultas_portada()
+        self.assertContains(respuesta, 'Asistencia Confirmada', count=2)  # tarjeta y modal
+        self.assertContains(respuesta, 'btn-outline-danger w-100 toggle-interes-btn', count=1)
+        self.assertContains(respuesta, 'btn btn-outline-danger toggle-interes-btn', count=1)
+
+        # Más asistentes e interesados no agregan consultas a la página.
+        for reunion in (self.asistida, self.interesada, self.libre):
+            reunion.interesados.add(*self.otros)
+        Asistencia.objects.bulk_create([Asistencia(reunion=self.libre, usuario=u) for u in self.otros])
+        self.assertEqual(self.consultas_portada()[1], antes)
+
+    def test_toggle_interes(self):
+        url = reverse('toggle_interes', args=[self.libre.id])
+        self.assertEqual(self.client.post(url).json()['status'], 'added')
+        self.assertTrue(es_interesado(self.usuario.id, self.libre.id))
+        self.assertEqual(self.client.post(url).json()['status'], 'removed')
+        self.assertFalse(es_interesado(self.usuario.id, self.libre.id))
+        respuesta = self.client.post(reverse('toggle_interes', args=[self.asistida.id]))
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class BusquedaDirectorioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.visitante = Usuario.objects.create(
+            nombre='Vera', apellido='Visita', rut='444444444', email='vera@example.com', password='x',
+        )
+        cls.jose = Usuario.objects.create(
+            nombre='José', apellido='Núñez', rut='444444445', email='jose@example.com', password='x',
+            rubro='diseno_grafico', nombre_empresa='Estudio Pájaro', buscando='Socios',
+        )
+        cls.josefina = Usuario.objects.create(
+            nombre='Josefina', apellido='Díaz', rut='444444446', email='josefina@example.com', password='x',
+            rubro='otro', rubro_otro='Cerámica',
+        )
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['usuario_id'] = self.visitante.id
+        session.save()
+
+    def directorio(self, q):
+        response = self.client.get(reverse('directorio_miembros'), {'q': q})
+        return [m['id'] for m in response.context['miembros']]
+
+    def test_documento_normalizado_con_el_nombre_del_rubro(self):
+        self.assertEqual(self.jose.documento_busqueda, 'jose nunez estudio pajaro diseno grafico socios')
+        self.assertEqual(self.josefina.documento_busqueda, 'josefina diaz ceramica')
+        self.assertEqual(consulta_booleana('  Diseño  grá! '), '+diseno* +gra*')
+
+    def test_sin_tildes_por_prefijo_y_ordenado_por_relevancia(self):
+        self.assertEqual(self.directorio('diseño'), [self.jose.id])
+        self.assertEqual(self.directorio('CERAMICA'), [self.josefina.id])
+        self.assertEqual(self.directorio('jose nun'), [self.jose.id])
+        # La coincidencia entera pesa más que la de prefijo.
+        self.assertEqual(self.directorio('jose'), [self.jose.id, self.josefina.id])
+        self.assertEqual(self.directorio('jose xyz'), [])
+
+    def test_el_indice_local_sigue_los_cambios(self):
+        buscar(Usuario.objects.all(), 'jose')  # se construye
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jose.nombre_empresa = 'Imprenta Cóndor'
+            self.jose.save()
+            Usuario.objects.filter(id=self.josefina.id).delete()
+        self.assertIsNotNone(indice_local.version)
+        self.assertEqual(self.directorio('condor'), [self.jose.id])
+        self.assertEqual(self.directorio('pajaro'), [])
+        self.assertEqual(self.directorio('josefina'), [])
+
+
+@mock.patch('usuario.directorio.POR_PAGINA', 4)
+class DirectorioPaginadoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.visitante = Usuario.objects.create(
+            nombre='Vera', apellido='Visita', rut='444444444', email='vera@example.com', password='x', es_ayudante=True,
+        )
+        cls.admin = Usuario.objects.create(
+            nombre='Ana', apellido='Admin', rut='444444449', email='ana@example.com', password='x', es_admin=True,
+        )
+        # Nombres repetidos para que el desempate por id importe.
+        cls.miembros = [
+            Usuario.objects.create(
+                nombre=['Berta', 'Carla', 'Berta'][i % 3], apellido=f'M{i}', rut=f'5555555{i:02d}', email=f'm{i}@example.com',
+                password='x', destacado=i in (3, 7), perfil_publico=i != 5, rubro='diseno_grafico',
+            )
+            for i in range(11)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def entrar(self, usuario):
+        session = self.client.session
+        session['usuario_id'] = usuario.id
+        session.save()
+
+    def recorrer(self, consultas=2, **filtros):
+        """Ids de la primera página (HTML) y de las siguientes (JSON), en orden."""
+        response = self.client.get(reverse('directorio_miembros'), filtros)
+        ids = [m['id'] for m in response.context['miembros']]
+        siguiente = response.context['siguiente']
+        while siguiente:
+            with self.assertNumQueries(consultas):  # sesión + la página
+                data = self.client.get(reverse('directorio_api'), dict(filtros, cursor=siguiente)).json()
+            ids += [m['id'] for m in data['resultados']]
+            siguiente = data['siguiente']
+        return ids
+
+    def test_recorre_todo_en_el_orden_del_listado(self):
+        self.entrar(self.visitante)
+        self.client.get(reverse('directorio_miembros'))  # sesión en caché
+        esperado = list(
+            Usuario.objects.filter(id__in=[m.id for m in self.miembros], perfil_publico=True)
+            .order_by('-destacado', 'nombre', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(self.recorrer(), esperado)
+        # En SQLite la búsqueda filtra antes los candidatos del índice en memoria.
+        self.assertEqual(self.recorrer(consultas=3, q='berta'), [m.id for m in self.miembros if m.nombre == 'Berta' and m.perfil_publico])
+
+    def test_el_admin_ve_los_privados_al_final_de_cada_grupo(self):
+        self.entrar(self.admin)
+        self.client.get(reverse('directorio_miembros'))
+        ids = self.recorrer()
+        self.assertEqual(len(ids), 11)
+        self.assertEqual(ids[:2], [self.miembros[3].id, self.miembros[7].id])
+        self.assertEqual(ids[-1], self.miembros[5].id)
+
+    def test_tarjeta_con_el_nombre_del_rubro_y_cursor_invalido(self):
+        self.entrar(self.visitante)
+        data = self.client.get(reverse('directorio_api')).json()
+        self.assertEqual(data['resultados'][0]['rubro'], 'Diseño Gráfico')
+        self.assertNotIn('email', data['resultados'][0])
+        for cursor in ('no-es-un-cursor', 'WyJ4IiwieCIsIngiXQ'):  # ["x","x","x"]
+            response = self.client.get(reverse('directorio_api'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+
+class FacetasRubroTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create(
+            nombre='Ana', apellido='Admin', rut='444444449', email='ana@example.com', password='x', es_admin=True,
+            rubro='educacion',
+        )
+        cls.publico = Usuario.objects.create(
+            nombre='Pía', apellido='Pública', rut='555555501', email='pia@example.com', password='x', rubro='educacion',
+        )
+        cls.privado = Usuario.objects.create(
+            nombre='Pedro', apellido='Privado', rut='555555502', email='pedro@example.com', password='x',
+            rubro='gastronomia', perfil_publico=False,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def totales(self):
+        return {alcance: facetas.totales(alcance) for alcance in facetas.ALCANCES}
+
+    def test_se_cuentan_una_vez_y_se_ajustan_con_las_senales(self):
+        esperado = {
+            'directorio': {'educacion': 1},
+            'directorio_admin': {'educacion': 1, 'gastronomia': 1},
+            'panel': {'educacion': 2, 'gastronomia': 1},
+        }
+        self.assertEqual(self.totales(), esperado)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.totales(), esperado)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            privado = Usuario.objects.get(id=self.privado.id)
+            privado.perfil_publico = True
+            privado.save()
+            publico = Usuario.objects.get(id=self.publico.id)
+            publico.rubro = 'gastronomia'
+            publico.save()
+            Usuario.objects.get(id=self.admin.id).delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(facetas.totales('directorio_admin'), {'educacion': 0, 'gastronomia': 2})
+            self.assertEqual(facetas.totales('panel'), {'educacion': 0, 'gastronomia': 2})
+        # En `directorio` gastronomía no existía: ese alcance se vuelve a contar.
+        self.assertEqual(facetas.totales('directorio'), {'gastronomia': 2})
+        self.assertEqual(facetas.opciones_rubro('panel'), [('gastronomia', 'Gastronomía', 2)])
+
+    def test_rubro_nuevo_o_usuario_incompleto_vuelven_a_contar(self):
+        self.totales()
+        with self.captureOnCommitCallbacks(execute=True):
+            Usuario.objects.create(
+                nombre='Nico', apellido='Nuevo', rut='555555503', email='nico@example.com', password='x', rubro='turismo_hoteleria',
+            )
+            incompleto = Usuario.objects.only('id', 'nombre').get(id=self.publico.id)
+            incompleto.nombre = 'Pía María'
+            incompleto.save()
+        self.assertEqual(facetas.totales('directorio'), {'educacion': 1, 'turismo_hoteleria': 1})
+
+    def test_los_filtros_muestran_totales_sin_rubros_vacios(self):
+        session = self.client.session
+        session['usuario_id'] = self.admin.id
+        session.save()
+        self.assertContains(self.client.get(reverse('directorio_miembros')), 'Gastronomía (1)')
+        self.assertNotContains(self.client.get(reverse('directorio_miembros')), 'Nutrición')
+        self.assertContains(self.client.get(reverse('panel-admin:gestion_usuarios')), 'Educación y Formación (2)')
+
+
+class RutCanonicoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create(
+            nombre='Rita', apellido='Rut', rut='12.345.678-5', email='rita@example.com', password='x',
+        )
+
+    def test_guarda_cuerpo_y_dv(self):
+        self.usuario.refresh_from_db()
+        self.assertEqual((self.usuario.rut, self.usuario.rut_cuerpo, self.usuario.rut_dv), ('123456785', 12345678, '5'))
+
+    def test_validacion_en_lote(self):
+        textos = ['12.345.678-5', '12345678-4', '1-9', '7.654.321-6', '7.654.321-k', 'abc', '', '123456789-0']
+        self.assertEqual(validar_ruts(textos), [(12345678, '5'), None, (1, '9'), (7654321, '6'), None, None, None, None])
+        for texto, separado in zip(textos, validar_ruts(textos)):
+            self.assertEqual(validate_rut(texto)[0], separado is not None)
+
+    def test_validar_ruts_coincide_con_digito_verificador(self):
+        def referencia(cuerpo):
+            # Módulo 11 dígito a dígito, como lo calculaba antes validate_rut.
+            suma = sum(int(d) * f for d, f in zip(reversed(str(cuerpo)), [2, 3, 4, 5, 6, 7] * 2))
+            return {10: 'K', 11: '0'}.get(11 - suma % 11, str(11 - suma % 11))
+
+        cuerpos = list(range(1, 3000)) + list(range(9_999_000, 10_001_000)) + list(range(99_998_000, 100_000_000))
+        for cuerpo in cuerpos:
+            self.assertEqual(digito_verificador(cuerpo), referencia(cuerpo), cuerpo)
+        textos = [f'{c}{digito_verificador(c)}' for c in cuerpos] + [f'{c}{"K" if digito_verificador(c) != "K" else "0"}' for c in cuerpos]
+        esperado = [(c, digito_verificador(c)) for c in cuerpos] + [None] * len(cuerpos)
+        self.assertEqual(validar_ruts(textos), esperado)
+
+    def test_se_puede_guardar_un_repetido_que_dejo_la_migracion(self):
+        # La migración 0019 deja a los repetidos con su RUT original y sin cuerpo.
+        repetido = Usuario.objects.create(
+            nombre='Rita', apellido='Repetida', rut='99999999-9', email='rita2@example.com', password='x',
+        )
+        Usuario.objects.filter(id=repetido.id).update(rut='12345678-5', rut_cuerpo=None, rut_dv='')
+        repetido.refresh_from_db()
+        repetido.telefono = '123'
+        repetido.save()
+        repetido.refresh_from_db()
+        self.assertEqual((repetido.rut, repetido.rut_cuerpo, repetido.rut_dv, repetido.telefono), ('12345678-5', None, '', '123'))
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.rut_cuerpo, 12345678)
+
+    def test_busqueda_por_rut_en_cualquier_formato(self):
+        for termino in ('12.345.678-5', '12345678-5', '1234'):
+            self.assertTrue(Usuario.objects.filter(filtro_prefijo(termino)).filter(id=self.usuario.id).exists(), termino)
+
+    def test_revisar_lista_de_ruts(self):
+        archivo = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False)
+        with archivo:
+            archivo.write('12345678-5\n11.111.111-1\n111111111\n12345678-0\n')
+        salida = StringIO()
+        call_command('revisar_ruts', archivo.name, stdout=salida)
+        os.remove(archivo.name)
+        self.assertIn('123456785 ya está registrado (rita@example.com)', salida.getvalue())
+        self.assertIn("Línea 3: '111111111' repetido en la lista", salida.getvalue())
+        self.assertIn("Línea 4: RUT inválido '12345678-0'", salida.getvalue())
+        self.assertIn('2 RUT válidos distintos (1 nuevos)', salida.getvalue())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QR_GUARDAR_ARCHIVOS=True)
+class ColaQRTests(TestCase):
+
+    def test_el_registro_no_genera_el_qr_en_la_peticion(self):
+        tabla = Usuario._meta.db_table
+        with CaptureQueriesContext(connection) as ctx:
+            usuario = Usuario.objects.create(
+                nombre='Rita', apellido='Registro', rut='444444444', email='rita@example.com', password='x',
+            )
+        escrituras = [q['sql'] for q in ctx.captured_queries if f'"{tabla}"' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(len(escrituras), 1)
+        self.assertTrue(escrituras[0].startswith('INSERT'))
+        self.assertTrue(usuario.etiqueta_emojis)
+        self.assertFalse(usuario.qr_code)
+        self.assertTrue(TrabajoQR.objects.filter(usuario=usuario).exists())
+
+    def test_el_worker_genera_los_qr_pendientes(self):
+        usuario = Usuario.objects.create(
+            nombre='Rita', apellido='Registro', rut='444444444', email='rita@example.com', password='x',
+        )
+        call_command('procesar_qr', una_vez=True, stdout=StringIO())
+        usuario.refresh_from_db()
+        self.assertTrue(usuario.qr_code.name.endswith('.png'))
+        self.assertFalse(TrabajoQR.objects.exists())
+
+    def test_un_trabajo_fallido_espera_antes_de_reintentarse(self):
+        Usuario.objects.create(nombre='Rita', apellido='Registro', rut='444444444', email='rita@example.com', password='x')
+        with mock.patch('usuario.management.commands.procesar_qr.generar_qr_png', side_effect=OSError('disco lleno')):
+            call_command('procesar_qr', una_vez=True, stdout=StringIO(), stderr=StringIO())
+        trabajo = TrabajoQR.objects.get()
+        self.assertEqual(trabajo.intentos, 1)
+        self.assertGreater(trabajo.proximo_intento, timezone.now())
+
+        call_command('procesar_qr', una_vez=True, stdout=StringIO())
+        self.assertTrue(TrabajoQR.objects.exists())
+        TrabajoQR.objects.update(proximo_intento=timezone.now())
+        call_command('procesar_qr', una_vez=True, stdout=StringIO())
+        self.assertFalse(TrabajoQR.objects.exists())
+
+
+class QRPedidoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create(
+            nombre='Quique', apellido='QR', rut='444444444', email='quique@example.com', password='x',
+        )
+
+    def setUp(self):
+        cache.clear()
+        session = self.client.session
+        session['usuario_id'] = self.usuario.id
+        session.save()
+
+    def test_qr_se_sirve_con_etag_y_cache_larga(self):
+        url = reverse('qr_usuario_png', args=[self.usuario.id])
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'image/png')
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertIn('private', respuesta['Cache-Control'])
+        self.assertTrue(respuesta.content.startswith(b'\x89PNG'))
+
+        # Con el usuario ya en caché, revalidar solo lee la sesión.
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_qr_svg(self):
+        respuesta = self.client.get(reverse('qr_usuario_svg', args=[self.usuario.id]))
+        self.assertEqual(respuesta['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', respuesta.content)
+
+    def test_el_qr_de_otro_usuario_no_se_entrega(self):
+        self.assertEqual(self.client.get(reverse('qr_usuario_png', args=[self.usuario.id + 1])).status_code, 403)
+        self.client.session.flush()
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(reverse('qr_usuario_png', args=[self.usuario.id])).status_code, 403)
+
+
+@override_settings(QR_CLAVES={'1': 'secreto-uno', '2': 'secreto-dos'}, QR_CLAVE_ACTIVA='2')
+class TokenQRTests(TestCase):
+
+    def test_el_token_es_alfanumerico_y_se_verifica_sin_consultas(self):
+        token = contenido_qr(123456)
+        self.assertRegex(token, r'^2[A-Z2-7]{16}[0-9A-Z]+$')
+        with self.assertNumQueries(0):
+            self.assertEqual(verificar_token(token), 123456)
+            self.assertEqual(verificar_token(token.lower()), 123456)
+
+    def test_rechaza_firmas_falsas_e_ids_cambiados(self):
+        token = firmar_token(42)
+        self.assertIsNone(verificar_token(firmar_token(43)[:17] + token[17:]))
+        self.assertIsNone(verificar_token(token[0] + 'A' * 16 + token[17:]))
+        self.assertIsNone(verificar_token('9' + token[1:]))
+        self.assertIsNone(verificar_token('http://example.com/perfil-publico/42/'))
+        self.assertIsNone(leer_codigo_qr('42'))
+
+    def test_rotacion_de_claves(self):
+        anterior = firmar_token(7, clave_id='1')
+        self.assertEqual(verificar_token(anterior), 7)
+        with override_settings(QR_CLAVES={'2': 'secreto-dos'}):
+            self.assertIsNone(verificar_token(anterior))
+            self.assertEqual(verificar_token(firmar_token(7)), 7)
+
+    def test_ids_de_qr_antiguos_solo_hasta_la_fecha_de_corte(self):
+        hoy = timezone.localdate()
+        with override_settings(QR_LEGADO_HASTA=hoy):
+            self.assertEqual(leer_codigo_qr('42'), 42)
+        with override_settings(QR_LEGADO_HASTA=hoy - timedelta(days=1)):
+            self.assertIsNone(leer_codigo_qr('42'))
+
+
+class EtiquetasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create(
+            nombre='Ana', apellido='Admin', rut='111111111', email='ana@example.com', password='x', es_admin=True,
+        )
+        cls.reunion = Reunion.objects.create(
+            detalle='Feria', descripcion='d', fecha=timezone.now() + timedelta(days=3), ubicacion='Sala',
+        )
+        cls.interesados = [
+            Usuario.objects.create(
+                nombre=f'Íñigo{i}', apellido=f'Núñez{i}', rut=f'6666666{i:02d}', email=f'e{i}@example.com', password='x',
+            )
+            for i in range(12)
+        ]
+        cls.reunion.interesados.add(*cls.interesados)
+
+    def setUp(self):
+        cache.clear()
+        # Carpeta propia por prueba: las etiquetas dibujadas en una no cuentan en otra.
+        media = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media.enable()
+        self.addCleanup(media.disable)
+        session = self.client.session
+        session['usuario_id'] = self.admin.id
+        session.save()
+
+    def test_prepara_etiquetas_y_hoja_reutilizando_las_ya_dibujadas(self):
+        salida = StringIO()
+        call_command('preparar_etiquetas', self.reunion.id, procesos=0, stdout=salida)
+        self.assertIn('12 etiquetas dibujadas, 0 reutilizadas', salida.getvalue())
+        for usuario in self.interesados:
+            datos = etiquetas.datos_etiqueta(usuario)
+            self.assertTrue(os.path.exists(etiquetas.ruta_etiqueta(datos, 'png')))
+            self.assertTrue(os.path.exists(etiquetas.ruta_etiqueta(datos, 'pdf')))
+        with open(etiquetas.ruta_hoja_reunion(self.reunion.id), 'rb') as hoja:
+            self.assertEqual(hoja.read().count(b'/Type /Page\n'), 2)  # 12 etiquetas, 10 por hoja
+
+        salida = StringIO()
+        call_command('preparar_etiquetas', self.reunion.id, procesos=0, sin_hoja=True, stdout=salida)
+        self.assertIn('0 etiquetas dibujadas, 12 reutilizadas', salida.getvalue())
+
+    def test_un_dato_nuevo_reemplaza_la_etiqueta(self):
+        usuario = self.interesados[0]
+        anterior = etiquetas.etiqueta_png(usuario)
+        Usuario.objects.filter(id=usuario.id).update(cantidad_asistencias=5)
+        usuario.refresh_from_db()
+        nueva = etiquetas.etiqueta_png(usuario)
+        self.assertNotEqual(anterior, nueva)
+        self.assertFalse(os.path.exists(anterior))
+        self.assertEqual(etiquetas.etiqueta_png(usuario), nueva)
+
+    def test_la_pagina_de_impresion_usa_la_imagen_pre_renderizada(self):
+        usuario = self.interesados[1]
+        respuesta = self.client.get(reverse('imprimir_etiqueta', args=[usuario.id]))
+        self.assertEqual(respuesta.status_code, 200)
+        version = respuesta.context['version_etiqueta']
+        url = f"{reverse('etiqueta_usuario_png', args=[usuario.id])}?v={version}"
+        self.assertContains(respuesta, url)
+
+        imagen = self.client.get(url)
+        self.assertEqual(imagen['Content-Type'], 'image/png')
+        self.assertIn('immutable', imagen['Cache-Control'])
+        self.assertTrue(b''.join(imagen.streaming_content).startswith(b'\x89PNG'))
+        pdf = self.client.get(reverse('etiqueta_usuario_pdf', args=[usuario.id]))
+        self.assertEqual(pdf['Content-Type'], 'application/pdf')
+        self.assertIn('no-cache', pdf['Cache-Control'])
+
+    def test_las_etiquetas_de_otros_no_se_entregan(self):
+        session = self.client.session
+        session['usuario_id'] = self.interesados[0].id
+        session.save()
+        self.assertEqual(self.client.get(reverse('imprimir_etiqueta', args=[self.interesados[1].id])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('etiqueta_usuario_png', args=[self.interesados[1].id])).status_code, 403)
+
+    def test_descarga_de_la_hoja_desde_el_panel(self):
+        respuesta = self.client.get(reverse('panel-admin:hoja_etiquetas_reunion', args=[self.reunion.id]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(respuesta.streaming_content).startswith(b'%PDF'))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), QR_GUARDAR_ARCHIVOS=True)
+class RegenerarQRTests(TestCase):
+
+    def setUp(self):
+        self.usuarios = [
+            Usuario.objects.create(
+                nombre=f'U{i}', apellido='Lote', rut=f'5555555{i:02d}', email=f'u{i}@example.com', password='x',
+            )
+            for i in range(5)
+        ]
+        self.checkpoint = tempfile.mktemp()
+
+    def test_regenera_todos_los_qr(self):
+        salida = StringIO()
+        call_command('regenerate_qrs', procesos=0, lote=2, checkpoint=self.checkpoint, stdout=salida)
+        nombres = set(Usuario.objects.values_list('qr_code', flat=True))
+        self.assertEqual(nombres, {f'qr_codes/qr_usuario_{u.id}.png' for u in self.usuarios})
+        self.assertIn('usuarios/s', salida.getvalue())
+
+    def test_continua_desde_el_checkpoint(self):
+        with open(self.checkpoint, 'w') as archivo:
+            archivo.write(str(self.usuarios[2].id))
+        call_command('regenerate_qrs', procesos=0, checkpoint=self.checkpoint, stdout=StringIO())
+        con_qr = set(Usuario.objects.exclude(qr_code='').exclude(qr_code=None).values_list('id', flat=True))
+        self.assertEqual(con_qr, {u.id for u in self.usuarios[3:]})
+
+    @override_settings(QR_GUARDAR_ARCHIVOS=False)
+    def test_sin_guardar_archivos_no_escribe_nada(self):
+        with self.assertRaisesMessage(CommandError, 'QR_GUARDAR_ARCHIVOS'):
+            call_command('regenerate_qrs', procesos=0, checkpoint=self.checkpoint, stdout=StringIO())
+        self.assertFalse(Usuario.objects.exclude(qr_code='').exclude(qr_code=None).exists())
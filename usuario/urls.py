@@ -7,6 +7,11 @@ urlpatterns = [
     path('perfil/editar/<int:usuario_id>/', views.editar_perfil, name='editar_perfil'),
     path('perfil-publico/<int:usuario_id>/', views.perfil_publico, name='perfil_publico'),
     path('imprimir-etiqueta/<int:usuario_id>/', views.imprimir_etiqueta, name='imprimir_etiqueta'),
+    path('etiqueta/<int:usuario_id>.png', views.etiqueta_usuario, {'formato': 'png'}, name='etiqueta_usuario_png'),
+    path('etiqueta/<int:usuario_id>.pdf', views.etiqueta_usuario, {'formato': 'pdf'}, name='etiqueta_usuario_pdf'),
+    path('qr/<int:usuario_id>.png', views.qr_usuario, {'formato': 'png'}, name='qr_usuario_png'),
+    path('qr/<int:usuario_id>.svg', views.qr_usuario, {'formato': 'svg'}, name='qr_usuario_svg'),
+    path('foto/<int:usuario_id>/miniatura.jpg', views.miniatura_foto, name='miniatura_foto'),
     path('reunion/<int:reunion_id>/toggle-interes/', views.toggle_interes, name='toggle_interes'),
     path('configuracion/', views.configuracion, name='configuracion'),
     path('configuracion/cambiar-password/', views.cambiar_password, name='cambiar_password'),
@@ -15,5 +20,6 @@ urlpatterns = [
     path('soporte/mis-tickets/', views.mis_tickets, name='mis_tickets'),
     path('soporte/ticket/<int:ticket_id>/', views.ver_ticket_usuario, name='ver_ticket_usuario'),
     path('directorio/', views.directorio_miembros, name='directorio_miembros'),
+    path('directorio/api/', views.directorio_api, name='directorio_api'),
     path('mis-reuniones/', views.mis_reuniones, name='mis_reuniones'),
 ]
@@ -1,12 +1,24 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from .forms import UsuarioForm, EditarUsuarioForm, RespuestaEncuestaForm, CambiarPasswordForm, LoginForm
-from .models import Usuario, RUBRO_CHOICES
+from .models import Usuario
+from .cache import clave_publica, fragmento_publico, TIEMPO_PAGINAS_PUBLICAS
+from .directorio import CursorInvalido, pagina as pagina_directorio
+from .facetas import opciones_rubro
+from .qr import etag_qr, generar_qr, TIPOS_CONTENIDO
+from .miniaturas import miniatura
+from .etiquetas import datos_etiqueta, huella, renderizar_etiqueta, ruta_etiqueta, TIPOS_ETIQUETA
 from paneladm.models import Reunion, Encuesta, RespuestaEncuesta, SoporteTicket, TicketRespuesta
+from paneladm.membresia import es_asistente, es_interesado, membresias
 from paneladm.forms import SoporteTicketForm, TicketRespuestaForm, ReunionForm
+from paneladm.cache import tickets_abiertos as contador_tickets_abiertos
 from django.contrib.auth.hashers import check_password
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.utils import timezone
+from django.views.decorators.http import condition
 from django.db.models import Q
+import os
 import random
 
 def login_required(view_func):
@@ -14,7 +26,7 @@ def login_required(view_func):
     Decorador personalizado para verificar que el usuario ha iniciado sesión.
     """
     def wrapper(request, *args, **kwargs):
-        if 'usuario_id' not in request.session:
+        if not request.usuario:
             messages.error(request, 'Debes iniciar sesión para acceder a esta página.')
             return redirect('login')
         return view_func(request, *args, **kwargs)
@@ -73,10 +85,9 @@ def registro(request):
 
 
 def perfil(request):
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect('login')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
     if request.method == 'POST' and 'responder_encuesta' in request.POST:
         form_respuesta = RespuestaEncuestaForm(request.POST)
         if form_respuesta.is_valid():
@@ -124,65 +135,161 @@ def editar_perfil(request, usuario_id):
 def perfil_publico(request, usuario_id):
     # MODO MANTENIMIENTO
     # return render(request, 'mantenimiento.html')
-    usuario_logueado = None
-    if 'usuario_id' in request.session:
-        usuario_logueado = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
-
+    usuario_logueado = request.usuario
     perfil_visitado = get_object_or_404(Usuario, id=usuario_id)
     return render(request, 'perfil_publico.html', {'perfil_visitado': perfil_visitado, 'usuario': usuario_logueado})
 
+def _etag_qr(request, usuario_id, formato):
+    return etag_qr(usuario_id, formato)
+
+@condition(etag_func=_etag_qr)
+def _servir_qr(request, usuario_id, formato):
+    response = HttpResponse(generar_qr(usuario_id, formato), content_type=TIPOS_CONTENIDO[formato])
+    # El QR es una credencial de ingreso: solo lo guarda el navegador, nunca un proxy.
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+def qr_usuario(request, usuario_id, formato):
+    """
+    Renderiza el QR de un usuario a pedido. El contenido es determinista, por lo
+    que el navegador lo puede guardar indefinidamente. Como lleva un token
+    firmado, solo lo ven el propio usuario y el personal que imprime etiquetas.
+    """
+    if not _puede_ver_credencial(request, usuario_id):
+        return HttpResponse(status=403)
+    return _servir_qr(request, usuario_id, formato)
+
+def miniatura_foto(request, usuario_id):
+    """
+    Miniatura de la foto de perfil para el padrón de las estaciones (ver
+    usuario/miniaturas.py). La URL lleva la huella de la foto, así que el
+    navegador la guarda sin revalidar.
+    """
+    if not _puede_ver_credencial(request, usuario_id):
+        return HttpResponse(status=403)
+    foto = Usuario.objects.filter(id=usuario_id).values_list('foto', flat=True).first()
+    if not foto:
+        return HttpResponse(status=404)
+    response = HttpResponse(miniatura(foto), content_type='image/jpeg')
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+def _puede_ver_credencial(request, usuario_id):
+    """El QR y la etiqueta los ven el propio usuario y el personal que imprime etiquetas."""
+    usuario_actual = request.usuario
+    return bool(usuario_actual) and (
+        usuario_actual.id == usuario_id
+        or usuario_actual.es_admin or usuario_actual.es_ayudante or usuario_actual.es_totem
+    )
+
 def imprimir_etiqueta(request, usuario_id):
     """
     Vista que muestra solo la etiqueta de un usuario para impresión directa.
+    La etiqueta es la imagen pre-renderizada (ver usuario/etiquetas.py); solo
+    se dibuja aquí si no se preparó antes o cambió algún dato.
+    """
+    if not _puede_ver_credencial(request, usuario_id):
+        return HttpResponse(status=403)
+    usuario = get_object_or_404(Usuario, id=usuario_id)
+    datos = datos_etiqueta(usuario)
+    if not os.path.exists(ruta_etiqueta(datos)):
+        renderizar_etiqueta(datos)
+    return render(request, 'etiqueta_imprimir.html', {
+        'usuario': usuario,
+        'version_etiqueta': huella(datos),
+        # Sin fuente de emojis la imagen no los trae y los agrega la página.
+        'emojis_en_html': not datos['fuente_emoji'],
+    })
+
+def etiqueta_usuario(request, usuario_id, formato):
+    """
+    Entrega el PNG o PDF pre-renderizado de la etiqueta. La página de impresión
+    lo pide con ?v=<huella>, así que el navegador puede guardarlo sin revalidar.
     """
+    if not _puede_ver_credencial(request, usuario_id):
+        return HttpResponse(status=403)
     usuario = get_object_or_404(Usuario, id=usuario_id)
-    return render(request, 'etiqueta_imprimir.html', {'usuario': usuario})
+    datos = datos_etiqueta(usuario)
+    ruta = ruta_etiqueta(datos, formato)
+    if not os.path.exists(ruta):
+        renderizar_etiqueta(datos)
+    response = FileResponse(open(ruta, 'rb'), content_type=TIPOS_ETIQUETA[formato])
+    if request.GET.get('v') == huella(datos):
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
 
-def inicio(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = None
-    if usuario_id:
-        try:
-            usuario = Usuario.objects.get(id=usuario_id)
-        except Usuario.DoesNotExist:
-            pass
-
-    reuniones_proximas = Reunion.objects.filter(fecha__gte=timezone.now()).order_by('fecha')
+def pagina_publica_cacheada(nombre):
+    """
+    Decorador que guarda la página completa para los visitantes sin sesión.
+    Si hay mensajes pendientes se genera la página normalmente, porque los muestra.
+    """
+    def decorador(view_func):
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or request.usuario or len(messages.get_messages(request)):
+                return view_func(request, *args, **kwargs)
+
+            clave = clave_publica(f'pagina:{nombre}:{timezone.localdate().isoformat()}')
+            contenido = cache.get(clave)
+            if contenido is not None:
+                return HttpResponse(contenido)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(clave, response.content, TIEMPO_PAGINAS_PUBLICAS)
+            return response
+        return wrapper
+    return decorador
+
+def _datos_inicio():
+    """Datos de la portada que son iguales para todos los visitantes."""
     now = timezone.now()
+    reuniones_proximas = list(Reunion.objects.filter(fecha__gte=now).order_by('fecha'))
     for reunion in reuniones_proximas:
         delta = reunion.fecha.date() - now.date()
         reunion.dias_restantes = delta.days
 
-    testimonios = RespuestaEncuesta.objects.filter(destacado=True).exclude(comentarios__exact='').order_by('-fecha_respuesta')
-    total_usuarios = Usuario.objects.count()
-    total_reuniones = Reunion.objects.count()
+    testimonios = RespuestaEncuesta.objects.filter(destacado=True).exclude(comentarios__exact='').select_related('usuario').order_by('-fecha_respuesta')
+    return {
+        'reuniones': reuniones_proximas,
+        'testimonios': list(testimonios),
+        'total_usuarios': Usuario.objects.count(),
+        'total_reuniones': Reunion.objects.count(),
+    }
+
+@pagina_publica_cacheada('inicio')
+def inicio(request):
+    usuario = request.usuario
+
+    datos = fragmento_publico(f'inicio:{timezone.localdate().isoformat()}', _datos_inicio)
     contexto = {
         'usuario': usuario,
-        'reuniones': reuniones_proximas,
-        'testimonios': testimonios,
-        'total_usuarios': total_usuarios,
-        'total_reuniones': total_reuniones,
+        # Estado de cada tarjeta (asistió / interesado) en una sola consulta.
+        'membresias': membresias(usuario.id if usuario else None, [r.id for r in datos['reuniones']]),
+        **datos,
     }
     return render(request, 'inicio.html', contexto)
 
-def landing_reuniones(request):
+def _datos_landing_reuniones():
     now = timezone.now()
-    reuniones_proximas = Reunion.objects.filter(fecha__gte=now).order_by('fecha')
-    reuniones_pasadas = Reunion.objects.filter(fecha__lt=now).order_by('-fecha')
-    contexto = {
-        'reuniones_proximas': reuniones_proximas,
-        'reuniones_pasadas': reuniones_pasadas,
+    return {
+        'reuniones_proximas': list(Reunion.objects.filter(fecha__gte=now).order_by('fecha')),
+        'reuniones_pasadas': list(Reunion.objects.filter(fecha__lt=now).order_by('-fecha')),
     }
+
+@pagina_publica_cacheada('landing_reuniones')
+def landing_reuniones(request):
+    contexto = fragmento_publico('landing_reuniones', _datos_landing_reuniones)
     return render(request, 'landing_reuniones.html', contexto)
 
 def registrar_interes(request, reunion_id):
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         messages.error(request, 'Debes iniciar sesión para mostrar interés en una reunión.')
         return redirect('login')
     if request.method == 'POST':
         reunion = get_object_or_404(Reunion, id=reunion_id)
-        usuario = get_object_or_404(Usuario, id=usuario_id)
         reunion.interesados.add(usuario)
         messages.success(request, f'¡Genial! Has mostrado interés en "{reunion.detalle}".')
     return redirect('inicio')
@@ -196,12 +303,12 @@ def toggle_interes(request, reunion_id):
     from django.http import JsonResponse
     if request.method == 'POST':
         reunion = get_object_or_404(Reunion, id=reunion_id)
-        usuario = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+        usuario = request.usuario
 
-        if usuario in reunion.asistentes.all():
+        if es_asistente(usuario.id, reunion.id):
             return JsonResponse({'status': 'error', 'message': 'Tu asistencia ya está confirmada.'}, status=400)
 
-        if usuario in reunion.interesados.all():
+        if es_interesado(usuario.id, reunion.id):
             reunion.interesados.remove(usuario)
             return JsonResponse({'status': 'removed', 'message': 'Interés quitado.'})
         else:
@@ -210,20 +317,16 @@ def toggle_interes(request, reunion_id):
     return JsonResponse({'status': 'error', 'message': 'Método no permitido.'}, status=405)
 
 def panel_admin(request):
-    usuario_id = request.session.get('usuario_id')
-    if not usuario_id:
-        return redirect('login')
-    try:
-        usuario_actual = Usuario.objects.get(id=usuario_id)
-        if not usuario_actual.es_admin and not usuario_actual.es_ayudante:
-            return redirect('inicio')
-    except Usuario.DoesNotExist:
+    usuario_actual = request.usuario
+    if not usuario_actual:
         return redirect('login')
+    if not usuario_actual.es_admin and not usuario_actual.es_ayudante:
+        return redirect('inicio')
 
     # Datos para el dashboard
     total_usuarios = Usuario.objects.filter(es_admin=False, es_ayudante=False, es_totem=False).count()
     reuniones_programadas = Reunion.objects.filter(fecha__gte=timezone.now()).count()
-    tickets_abiertos = SoporteTicket.objects.filter(estado='abierto').count()
+    tickets_abiertos = contador_tickets_abiertos()
 
     contexto = {'usuario': usuario_actual, 'total_usuarios': total_usuarios,
                 'reuniones_programadas': reuniones_programadas, 'tickets_abiertos': tickets_abiertos}
@@ -235,8 +338,7 @@ def configuracion(request):
     """
     Muestra la página de configuración del usuario.
     """
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
 
     if request.method == 'POST':
         usuario.perfil_publico = request.POST.get('perfil_publico') == 'true'
@@ -251,8 +353,7 @@ def configuracion(request):
 
 @login_required
 def cambiar_password(request):
-    usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, id=usuario_id)
+    usuario = request.usuario
     if request.method == 'POST':
         form = CambiarPasswordForm(request.POST)
         if form.is_valid():
@@ -264,7 +365,8 @@ def cambiar_password(request):
             else:
                 from django.contrib.auth.hashers import make_password
                 usuario.password = nueva_password
-                usuario.save()
+                # Solo la contraseña: el usuario de sesión viene de la caché y puede estar desfasado.
+                usuario.save(update_fields=['password'])
                 messages.success(request, '¡Contraseña actualizada con éxito!')
                 return redirect('configuracion')
     else:
@@ -279,8 +381,7 @@ def cambiar_password(request):
 @login_required
 def eliminar_cuenta(request):
     if request.method == 'POST':
-        usuario_id = request.session.get('usuario_id')
-        usuario = get_object_or_404(Usuario, id=usuario_id)
+        usuario = request.usuario
         usuario.delete()
         request.session.flush()
         messages.success(request, 'Tu cuenta ha sido eliminada permanentemente.')
@@ -289,7 +390,7 @@ def eliminar_cuenta(request):
 
 @login_required
 def crear_ticket_soporte(request):
-    usuario = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+    usuario = request.usuario
     if request.method == 'POST':
         form = SoporteTicketForm(request.POST)
         if form.is_valid():
@@ -309,13 +410,13 @@ def crear_ticket_soporte(request):
 
 @login_required
 def mis_tickets(request):
-    usuario = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+    usuario = request.usuario
     tickets = SoporteTicket.objects.filter(usuario=usuario).order_by('-fecha_creacion')
     return render(request, 'mis_tickets.html', {'usuario': usuario, 'tickets': tickets})
 
 @login_required
 def ver_ticket_usuario(request, ticket_id):
-    usuario = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+    usuario = request.usuario
     ticket = get_object_or_404(SoporteTicket, id=ticket_id, usuario=usuario) # Seguridad: solo el dueño puede ver
 
     if request.method == 'POST':
@@ -338,50 +439,46 @@ def ver_ticket_usuario(request, ticket_id):
 
 @login_required
 def directorio_miembros(request):
-    # --- CÓDIGO CORREGIDO Y MEJORADO ---
-    usuario_id = request.session.get('usuario_id')
-    usuario_actual = get_object_or_404(Usuario, id=usuario_id) # El que está viendo la página
-
+    """
+    Primera página del directorio. Las siguientes las pide la página a
+    `directorio_api` a medida que se hace scroll.
+    """
+    usuario_actual = request.usuario # El que está viendo la página
     query = request.GET.get('q', '')
     rubro_filter = request.GET.get('rubro', '')
+    miembros, siguiente = pagina_directorio(usuario_actual, query, rubro_filter)
 
-    # Base de miembros: excluimos roles especiales que no deben aparecer en el directorio.
-    base_miembros = Usuario.objects.filter(es_admin=False, es_ayudante=False, es_totem=False)
-
-    # Los usuarios normales solo ven perfiles públicos. El admin ve todos los perfiles (públicos y privados).
-    if usuario_actual.es_admin:
-        # El admin ve a todos los usuarios, ordenando por destacado, luego por visibilidad y finalmente por nombre.
-        miembros = base_miembros.order_by('-destacado', '-perfil_publico', 'nombre')
-    else:
-        miembros = base_miembros.filter(perfil_publico=True).order_by('-destacado', 'nombre')
-
-    if query:
-        miembros = miembros.filter(
-            Q(nombre__icontains=query) |
-            Q(apellido__icontains=query) |
-            Q(nombre_empresa__icontains=query) |
-            Q(rubro__icontains=query)  # Corregido: buscar en el rubro del usuario
-        )
-
-    if rubro_filter:
-        miembros = miembros.filter(rubro__iexact=rubro_filter)
-
-    # Obtenemos todos los rubros posibles desde el modelo para el filtro del directorio.
-    todos_los_rubros = [choice[0] for group in RUBRO_CHOICES for choice in group[1]]
+    # Rubros con miembros y cuántos tiene cada uno, desde la caché (ver usuario/facetas.py).
+    todos_los_rubros = opciones_rubro('directorio_admin' if usuario_actual.es_admin else 'directorio')
 
     contexto = {
         'usuario': usuario_actual,
         'miembros': miembros,
+        'siguiente': siguiente,
         'rubros': todos_los_rubros,
     }
     return render(request, 'directorio.html', contexto)
 
+@login_required
+def directorio_api(request):
+    """
+    Página del directorio en JSON, con los mismos filtros `q` y `rubro` y el
+    `cursor` que devolvió la página anterior.
+    """
+    try:
+        miembros, siguiente = pagina_directorio(
+            request.usuario, request.GET.get('q', ''), request.GET.get('rubro', ''), request.GET.get('cursor') or None,
+        )
+    except CursorInvalido:
+        return JsonResponse({'error': 'Cursor inválido.'}, status=400)
+    return JsonResponse({'resultados': miembros, 'siguiente': siguiente})
+
 @login_required
 def mis_reuniones(request):
     """
     Muestra al usuario un resumen de su actividad en las reuniones.
     """
-    usuario = get_object_or_404(Usuario, id=request.session.get('usuario_id'))
+    usuario = request.usuario
 
     # Reuniones futuras en las que el usuario ha mostrado interés O ya es asistente.
     # Usamos Q para combinar ambas consultas y .distinct() para evitar duplicados.